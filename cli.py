@@ -4,34 +4,100 @@ Giao diện dòng lệnh tương tác để kiểm tra chatbot với
 cuộc hội thoại nhiều lượt, hiển thị phản hồi và quản lý trạng thái cuộc trò chuyện.
 """
 
+import io
+import sys
 import json
-from typing import List, Dict, Any
-from expense_assistant import ExpenseAssistant, create_client
+import asyncio
+import warnings
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+from expense_assistant import ExpenseAssistant, create_client, create_async_client, create_response_cache
+from completion_cache import CompletionCache
 from functions import MOCK_EXPENSE_REPORTS, EXPENSE_POLICIES, AVAILABLE_FUNCTIONS, SAMPLE_USER_QUERIES
 
-def display_response(response_data: Dict[str, Any]):
-    """Hiển thị phản hồi đã được định dạng từ assistant."""
-    print("\n" + "="*50)
-    print("🤖 PHẢN HỒI TỪ TRỢ LÝ:")
-    print("="*50)
+# Encoder dùng chung cho việc hiển thị tham số/kết quả tool call
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+if ORJSON_AVAILABLE:
+    def _json_encode(value: Any) -> str:
+        """Serialize bằng orjson (C), giữ nguyên ký tự tiếng Việt."""
+        return orjson.dumps(value, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+else:
+    _json_encode = json.JSONEncoder(ensure_ascii=False, indent=2).encode
+
+# Các lệnh đặc biệt trong chat tương tác: đầu vào (đã lower) -> lệnh
+COMMANDS = {
+    "quit": "exit", "exit": "exit", "q": "exit", "thoat": "exit",
+    "clear": "clear", "xoa": "clear",
+    "summary": "summary", "tong-ket": "summary",
+    "help": "help", "giup-do": "help",
+}
+
+@lru_cache(maxsize=1)
+def get_assistant() -> ExpenseAssistant:
+    """
+    Trả về ExpenseAssistant dùng chung cho mọi lệnh CLI.
+    
+    Client và system prompt + tools chỉ được dựng một lần, nên mọi request gửi
+    cùng một prefix giống hệt nhau và tận dụng được OpenAI prompt caching.
+    Các request trùng hoàn toàn (demo, batch test chạy lại) được trả từ CompletionCache,
+    câu hỏi gần giống nhau về ngữ nghĩa được trả từ semantic response cache.
+    """
+    client = create_client()
+    return ExpenseAssistant(client, model="GPT-4o-mini", completion_cache=CompletionCache(),
+                            response_cache=create_response_cache("GPT-4o-mini"))
+
+def get_fresh_assistant() -> ExpenseAssistant:
+    """Lấy assistant dùng chung với lịch sử hội thoại đã được đặt lại (chỉ còn system prompt)."""
+    assistant = get_assistant()
+    assistant.clear_conversation()
+    return assistant
+
+def display_response_header(file=None):
+    """In tiêu đề khung phản hồi của assistant (mặc định ra stdout)."""
+    print("\n" + "="*50, file=file)
+    print("🤖 PHẢN HỒI TỪ TRỢ LÝ:", file=file)
+    print("="*50, file=file)
+
+def display_response(response_data: Dict[str, Any], streamed: bool = False):
+    """
+    Hiển thị phản hồi đã được định dạng từ assistant.
     
-    # Nội dung phản hồi chính
-    if response_data.get("content"):
-        print(response_data["content"])
+    Toàn bộ nội dung được ghi vào buffer rồi xuất ra bằng một lần sys.stdout.write.
+    
+    Args:
+        response_data: Dictionary phản hồi từ get_response
+        streamed: Nội dung đã được in theo từng token - chỉ hiển thị phần chi tiết còn lại
+    """
+    buf = io.StringIO()
+    
+    if not streamed:
+        display_response_header(file=buf)
+        
+        # Nội dung phản hồi chính
+        if response_data.get("content"):
+            print(response_data["content"], file=buf)
     
     # Chi tiết các lần gọi hàm
     if response_data.get("tool_calls"):
-        print("\n🔧 CÁC CHỨC NĂNG ĐÃ SỬ DỤNG:")
+        print("\n🔧 CÁC CHỨC NĂNG ĐÃ SỬ DỤNG:", file=buf)
         for i, tool_call in enumerate(response_data["tool_calls"], 1):
-            print(f"\n   {i}. {tool_call['function']}()")
-            print(f"      Tham số: {json.dumps(tool_call['arguments'], indent=6, ensure_ascii=False)}")
-            print(f"      Kết quả: {json.dumps(tool_call['result'], indent=6, ensure_ascii=False)}")
+            print(f"\n   {i}. {tool_call['function']}()", file=buf)
+            print(f"      Tham số: {_json_encode(tool_call['arguments'])}", file=buf)
+            print(f"      Kết quả: {_json_encode(tool_call['result'])}", file=buf)
     
     # Sử dụng token
     if response_data.get("total_tokens"):
-        print(f"\n📊 Tokens đã sử dụng: {response_data['total_tokens']}")
+        print(f"\n📊 Tokens đã sử dụng: {response_data['total_tokens']}", file=buf)
+        print(f"   ♻️ Tokens từ prompt cache: {response_data.get('cached_tokens', 0)}", file=buf)
     
-    print("="*50)
+    print("="*50, file=buf)
+    sys.stdout.write(buf.getvalue())
 
 def run_interactive_chat():
     """Chạy phiên chat tương tác với assistant."""
@@ -45,8 +111,7 @@ def run_interactive_chat():
     print("="*60)
     
     # Khởi tạo assistant
-    client = create_client()
-    assistant = ExpenseAssistant(client, model="GPT-4o-mini")
+    assistant = get_fresh_assistant()
     
     while True:
         try:
@@ -54,20 +119,22 @@ def run_interactive_chat():
             user_input = input("\n👤 Bạn: ").strip()
             
             # Xử lý các lệnh đặc biệt
-            if user_input.lower() in ['quit', 'exit', 'q', 'thoat']:
+            command = COMMANDS.get(user_input.lower())
+            
+            if command == "exit":
                 print("\n👋 Cảm ơn bạn đã sử dụng Trợ Lý Chi Phí! Tạm biệt!")
                 break
             
-            elif user_input.lower() in ['clear', 'xoa']:
+            elif command == "clear":
                 assistant.clear_conversation()
                 print("\n🔄 Cuộc trò chuyện đã được xóa. Bắt đầu mới!")
                 continue
             
-            elif user_input.lower() in ['summary', 'tong-ket']:
+            elif command == "summary":
                 print(f"\n{assistant.get_conversation_summary()}")
                 continue
             
-            elif user_input.lower() in ['help', 'giup-do']:
+            elif command == "help":
                 print("\n📚 CÂU HỎI MẪU:")
                 for i, query in enumerate(SAMPLE_USER_QUERIES[:5], 1):
                     print(f"   {i}. {query}")
@@ -79,10 +146,10 @@ def run_interactive_chat():
                 print("   Vui lòng nhập tin nhắn hoặc lệnh.")
                 continue
             
-            # Nhận và hiển thị phản hồi
-            print("\n🤔 Đang xử lý...")
-            response = assistant.get_response(user_input)
-            display_response(response)
+            # Nhận phản hồi dạng stream - nội dung được in ngay khi từng token tới
+            display_response_header()
+            response = assistant.get_response(user_input, stream=True)
+            display_response(response, streamed=True)
             
         except KeyboardInterrupt:
             print("\n\n👋 Chat bị gián đoạn. Tạm biệt!")
@@ -91,28 +158,8 @@ def run_interactive_chat():
             print(f"\n❌ Lỗi: {str(e)}")
             print("   Vui lòng thử lại hoặc gõ 'quit' để thoát.")
 
-def run_batch_chat(queries: List[str], batch_size: int = 3) -> List[Dict[str, Any]]:
-    """
-    Chạy batch chat với nhiều queries cùng lúc.
-    
-    Args:
-        queries: Danh sách các câu hỏi/queries
-        batch_size: Kích thước batch
-        
-    Returns:
-        Danh sách kết quả
-    """
-    print(f"🚀 Bắt Đầu Batch Chat với {len(queries)} queries")
-    print("="*60)
-    
-    # Khởi tạo assistant
-    client = create_client()
-    assistant = ExpenseAssistant(client, model="GPT-4o-mini")
-    
-    # Process batch
-    results = assistant.process_batch_requests(queries, batch_size)
-    
-    # Hiển thị kết quả
+def display_batch_results(results: List[Dict[str, Any]]):
+    """Hiển thị kết quả của một lần batch chat."""
     print(f"\n📋 CHI TIẾT KẾT QUẢ BATCH:")
     print("="*60)
     
@@ -125,7 +172,7 @@ def run_batch_chat(queries: List[str], batch_size: int = 3) -> List[Dict[str, An
         if "error" in result:
             print(f"❌ Lỗi: {result['error']}")
         else:
-            content = result['content']
+            content = result['content'] or ""
             if len(content) > 150:
                 print(f"💬 Phản hồi: {content[:150]}...")
             else:
@@ -135,9 +182,58 @@ def run_batch_chat(queries: List[str], batch_size: int = 3) -> List[Dict[str, An
                 print(f"🔧 Functions gọi: {len(result['tool_calls'])}")
                 for tool_call in result['tool_calls']:
                     print(f"   • {tool_call['function']}()")
+
+async def run_batch_chat_async(queries: List[str], max_concurrent: int = 5,
+                               rpm: int = 200, tpm: int = 40000) -> List[Dict[str, Any]]:
+    """
+    Chạy batch chat song song trên AsyncOpenAI với giới hạn concurrency và RPM/TPM.
+    
+    Args:
+        queries: Danh sách các câu hỏi/queries
+        max_concurrent: Số request tối đa chạy song song
+        rpm: Giới hạn số request mỗi phút
+        tpm: Giới hạn số token mỗi phút
+        
+    Returns:
+        Danh sách kết quả theo đúng thứ tự queries
+    """
+    print(f"🚀 Bắt Đầu Batch Chat với {len(queries)} queries")
+    print("="*60)
+    
+    # Khởi tạo assistant và một AsyncOpenAI client dùng chung cho cả batch
+    assistant = get_fresh_assistant()
+    async_client = create_async_client()
     
+    try:
+        results = await assistant.process_batch_requests_async(
+            queries, async_client, max_concurrent=max_concurrent, rpm=rpm, tpm=tpm
+        )
+    finally:
+        await async_client.close()
+    
+    display_batch_results(results)
     return results
 
+def run_batch_chat(queries: List[str], max_concurrent: int = 3,
+                   batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Chạy batch chat với nhiều queries cùng lúc.
+    
+    Args:
+        queries: Danh sách các câu hỏi/queries
+        max_concurrent: Số request tối đa chạy song song
+        batch_size: (Deprecated) tên cũ của max_concurrent
+        
+    Returns:
+        Danh sách kết quả
+    """
+    if batch_size is not None:
+        warnings.warn("batch_size đã deprecated, hãy dùng max_concurrent",
+                      DeprecationWarning, stacklevel=2)
+        max_concurrent = batch_size
+    
+    return asyncio.run(run_batch_chat_async(queries, max_concurrent=max_concurrent))
+
 def run_expense_batch_processing(expenses: List[Dict] = None) -> Dict[str, Any]:
     """
     Xử lý batch các chi phí để tính toán và xác thực hàng loạt.
@@ -156,39 +252,45 @@ def run_expense_batch_processing(expenses: List[Dict] = None) -> Dict[str, Any]:
     print(f"📊 Đang xử lý {len(expenses)} chi phí...")
     
     # Khởi tạo assistant
-    client = create_client()
-    assistant = ExpenseAssistant(client, model="GPT-4o-mini")
+    assistant = get_assistant()
     
     # Process expense batch
     result = assistant.process_expense_batch(expenses)
     
-    # Hiển thị kết quả chi tiết
-    print(f"\n📋 KẾT QUẢ XỬ LÝ BATCH:")
-    print("="*60)
+    # Hiển thị kết quả chi tiết - ghi vào buffer, xuất ra một lần
+    buf = io.StringIO()
+    print(f"\n📋 KẾT QUẢ XỬ LÝ BATCH:", file=buf)
+    print("="*60, file=buf)
     
     stats = result["statistics"]
-    print(f"📊 THỐNG KÊ TỔNG QUAN:")
-    print(f"   • Tổng chi phí: {stats['total_submitted']:,.0f} VNĐ")
-    print(f"   • Tổng hoàn trả: {stats['total_reimbursed']:,.0f} VNĐ")
-    print(f"   • Tiết kiệm: {stats['savings']:,.0f} VNĐ")
-    print(f"   • Chi phí hợp lệ: {stats['valid_count']}/{result['total_expenses']}")
-    print(f"   • Chi phí có cảnh báo: {stats['warnings_count']}")
-    print(f"   • Chi phí không hợp lệ: {stats['invalid_count']}")
-    
-    print(f"\n💰 CHI TIẾT HOÀN TRẢ:")
-    for item in result["reimbursement_calculation"]["breakdown"]:
-        print(f"   • {item['category']}: {item['amount_submitted']:,.0f} VNĐ → {item['amount_reimbursed']:,.0f} VNĐ")
-        print(f"     {item['note']}")
-    
-    print(f"\n⚠️  CẢNH BÁO VÀ LỖI:")
+    print(f"📊 THỐNG KÊ TỔNG QUAN:", file=buf)
+    print(f"   • Tổng chi phí: {stats['total_submitted']:,.0f} VNĐ", file=buf)
+    print(f"   • Tổng hoàn trả: {stats['total_reimbursed']:,.0f} VNĐ", file=buf)
+    print(f"   • Tiết kiệm: {stats['savings']:,.0f} VNĐ", file=buf)
+    print(f"   • Chi phí hợp lệ: {stats['valid_count']}/{result['total_expenses']}", file=buf)
+    print(f"   • Chi phí có cảnh báo: {stats['warnings_count']}", file=buf)
+    print(f"   • Chi phí không hợp lệ: {stats['invalid_count']}", file=buf)
+    
+    breakdown = result["reimbursement_calculation"]["breakdown"]
+    print(f"\n💰 CHI TIẾT HOÀN TRẢ:", file=buf)
+    for category, submitted, reimbursed, note in zip(
+        breakdown["category"].tolist(), breakdown["amount_submitted"].tolist(),
+        breakdown["amount_reimbursed"].tolist(), breakdown["note"].tolist()
+    ):
+        print(f"   • {category}: {submitted:,.0f} VNĐ → {reimbursed:,.0f} VNĐ", file=buf)
+        print(f"     {note}", file=buf)
+    
+    print(f"\n⚠️  CẢNH BÁO VÀ LỖI:", file=buf)
     for validation in result["validation_results"]:
         if validation["warnings"] or validation["errors"]:
             expense = validation["expense"]
-            print(f"   • Chi phí #{validation['expense_index']}: {expense.get('description', 'N/A')}")
+            print(f"   • Chi phí #{validation['expense_index']}: {expense.get('description', 'N/A')}", file=buf)
             for warning in validation["warnings"]:
-                print(f"     ⚠️  {warning}")
+                print(f"     ⚠️  {warning}", file=buf)
             for error in validation["errors"]:
-                print(f"     ❌ {error}")
+                print(f"     ❌ {error}", file=buf)
+    
+    sys.stdout.write(buf.getvalue())
     
     return result
 
@@ -206,7 +308,7 @@ def quick_batch_demo():
         "Chính sách về chi phí đi lại là gì?"
     ]
     
-    batch_results = run_batch_chat(sample_queries, batch_size=2)
+    batch_results = run_batch_chat(sample_queries, max_concurrent=2)
     
     print(f"\n📊 Kết quả batch chat: {len(batch_results)} phản hồi")
     
@@ -216,36 +318,55 @@ def quick_batch_demo():
     
     print(f"\n✅ Demo hoàn thành! Đã xử lý {len(batch_results)} queries và {expense_results['total_expenses']} chi phí.")
 
-def run_batch_test(queries: List[str]) -> List[Dict]:
+def run_batch_test(queries: List[str], max_workers: int = 8) -> List[Dict]:
     """
     Chạy kiểm tra hàng loạt với nhiều truy vấn.
     
+    Các truy vấn độc lập nên được gửi song song bằng thread pool; mỗi thread dùng
+    một ExpenseAssistant riêng (lịch sử hội thoại riêng) nhưng chung OpenAI client
+    và completion cache.
+    
     Args:
         queries: Danh sách các truy vấn kiểm tra
+        max_workers: Số truy vấn chạy song song tối đa
         
     Returns:
         Danh sách dữ liệu phản hồi cho mỗi truy vấn
     """
-    client = create_client()
-    assistant = ExpenseAssistant(client, model="GPT-4o-mini")
+    shared = get_assistant()
+    
+    def run_query(query: str) -> Dict[str, Any]:
+        assistant = ExpenseAssistant(shared.client, model=shared.model,
+                                     completion_cache=shared.completion_cache,
+                                     response_cache=shared.response_cache)
+        try:
+            return assistant.get_response(query)
+        finally:
+            # Mỗi truy vấn là một hội thoại dùng một lần: không để lại các lượt đã lưu trong DB
+            assistant.clear_conversation()
     
     print(f"🧪 Chạy kiểm tra hàng loạt với {len(queries)} truy vấn...")
-    results = []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(queries)))) as executor:
+        responses = list(executor.map(run_query, queries))
     
-    for i, query in enumerate(queries, 1):
-        print(f"\n--- Kiểm tra {i}/{len(queries)} ---")
+    total = len(queries)
+    results = [None] * total
+    
+    for i, (query, response) in enumerate(zip(queries, responses)):
+        print(f"\n--- Kiểm tra {i + 1}/{total} ---")
         print(f"Truy vấn: {query}")
         
-        response = assistant.get_response(query)
-        results.append({
+        tool_calls = response.get("tool_calls") or ()
+        content = response["content"]
+        results[i] = {
             "query": query,
             "response": response,
-            "has_function_calls": len(response.get("tool_calls", [])) > 0,
+            "has_function_calls": len(tool_calls) > 0,
             "token_count": response.get("total_tokens", 0)
-        })
+        }
         
-        print(f"Phản hồi: {response['content'][:100]}..." if len(response['content']) > 100 else response['content'])
-        print(f"Gọi hàm: {len(response.get('tool_calls', []))}")
+        print(f"Phản hồi: {content[:100]}..." if len(content) > 100 else content)
+        print(f"Gọi hàm: {len(tool_calls)}")
     
     return results
 
@@ -254,8 +375,7 @@ def quick_test():
     print("🚀 Kiểm Tra Nhanh Trợ Lý Chi Phí")
     print("="*40)
     
-    client = create_client()
-    assistant = ExpenseAssistant(client, model="GPT-4o-mini")
+    assistant = get_fresh_assistant()
     
     test_queries = [
         "Giới hạn chi phí ăn uống là bao nhiều?",
@@ -276,8 +396,7 @@ def quick_demo():
     print("⚡ DEMO NHANH - Chức Năng Cốt Lõi")
     print("="*40)
     
-    client = create_client()
-    assistant = ExpenseAssistant(client, model="GPT-4o-mini")
+    assistant = get_fresh_assistant()
     
     test_query = "Tính hoàn tiền cho: ăn trưa 900.000 VNĐ, taxi 600.000 VNĐ, văn phòng phẩm 2.400.000 VNĐ"
     print(f"Truy vấn kiểm tra: {test_query}")
@@ -298,7 +417,8 @@ if __name__ == "__main__":
     print("2. quick_test() - Chạy kiểm tra chức năng nhanh")
     print("3. quick_demo() - Demo nhanh")
     print("4. run_batch_test(queries) - Chạy kiểm tra hàng loạt")
-    print("5. run_batch_chat(queries, batch_size) - 🆕 Batch chat mới")
+    print("5. run_batch_chat(queries, max_concurrent) - 🆕 Batch chat mới")
+    print("   run_batch_chat_async(queries, max_concurrent, rpm, tpm) - 🆕 Batch chat song song (async)")
     print("6. run_expense_batch_processing(expenses) - 🆕 Batch xử lý chi phí")
     print("7. quick_batch_demo() - 🆕 Demo tính năng Batching")
     
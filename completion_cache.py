@@ -0,0 +1,120 @@
+"""
+💾 COMPLETION CACHE - Cache chat completions theo nội dung request
+==================================================================
+
+Các demo/batch test gửi lại đúng những câu hỏi cố định mỗi lần chạy. Cache này
+lưu completion trên đĩa (SQLite) với key là sha256 của toàn bộ request:
+- model + tools + messages + tham số sinh (temperature, max_tokens)
+- hash của EXPENSE_POLICIES để tự vô hiệu khi chính sách thay đổi
+- LRU theo số entry, entry lâu không dùng nhất bị xóa trước
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional, Union
+
+
+def _to_jsonable(value: Any) -> Any:
+    """Chuyển object của OpenAI SDK (pydantic) trong messages về dạng JSON được."""
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    return str(value)
+
+
+class CompletionCache:
+    """
+    🗄️ LRU cache completions lưu trong SQLite
+
+    An toàn khi dùng từ nhiều thread; mọi thao tác chỉ là một câu SQL ngắn nên
+    cũng có thể gọi trực tiếp trong event loop của batch async.
+    """
+
+    def __init__(self, path: str = "./data/llm_cache.sqlite3", max_entries: int = 512):
+        """
+        Khởi tạo completion cache
+
+        Args:
+            path: Đường dẫn file SQLite
+            max_entries: Số completion tối đa được giữ lại
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, tools: Union[List[Dict[str, Any]], str], messages: List[Dict[str, Any]],
+                 namespace: str = "", **params) -> str:
+        """
+        Key content-addressable cho một request
+
+        Args:
+            model: Tên model
+            tools: FUNCTION_SCHEMAS gửi kèm request, hoặc digest của nó đã tính sẵn
+            messages: Toàn bộ messages của request
+            namespace: Chuỗi bổ sung (vd: hash chính sách) để vô hiệu cache khi đổi
+            **params: Các tham số sinh khác (temperature, max_tokens...)
+        """
+        payload = json.dumps(
+            {"model": model, "tools": tools, "messages": messages, "namespace": namespace, "params": params},
+            ensure_ascii=False, sort_keys=True, default=_to_jsonable
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Lấy completion đã lưu (dạng dict) và cập nhật thời điểm sử dụng."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Dict[str, Any]):
+        """Lưu completion và xóa các entry LRU vượt quá max_entries."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, value, last_used) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time())
+            )
+            self._conn.execute(
+                "DELETE FROM completions WHERE key NOT IN "
+                "(SELECT key FROM completions ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def clear(self):
+        """Xóa toàn bộ completion đã lưu."""
+        with self._lock:
+            self._conn.execute("DELETE FROM completions")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Lấy thống kê cache."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses
+        }
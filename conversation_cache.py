@@ -0,0 +1,165 @@
+"""
+🗂️ CONVERSATION CACHE - LRU theo ngân sách tokens
+==================================================
+
+Giữ lịch sử hội thoại của ExpenseAssistant trong giới hạn tokens thay vì
+để nó tăng tuyến tính theo số lượt:
+- Mỗi lượt hội thoại (user + tool calls + assistant) là một segment
+- Segment được đánh địa chỉ theo nội dung (sha1 của tin nhắn user)
+- LRU eviction theo ngân sách tokens, không theo số messages
+- Các segment bị loại được gộp vào một tin nhắn tóm tắt duy nhất
+"""
+
+import hashlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import tiktoken
+
+
+class ConversationCache:
+    """
+    🧠 LRU cache các lượt hội thoại với tail eviction theo tokens
+
+    Segment ít được dùng gần đây nhất bị loại trước, nguyên cả lượt (không
+    cắt lẻ từng message để tránh tool message mồ côi). Phần bị loại được
+    tóm tắt lại để giữ thông tin quan trọng như chi phí đã kê khai từ đầu.
+    Thứ tự dùng gần đây (add/get) tách riêng khỏi thứ tự segment, nên
+    get_messages vẫn trả các lượt theo thứ tự thời gian.
+    """
+
+    def __init__(self, max_tokens: int = 3000,
+                 summarize_fn: Optional[Callable[[str, List[Dict[str, Any]]], str]] = None,
+                 encoding_name: str = "o200k_base"):
+        """
+        Khởi tạo conversation cache
+
+        Args:
+            max_tokens: Ngân sách tokens cho các segment còn giữ nguyên văn
+            summarize_fn: Hàm (summary cũ, messages bị loại) -> summary mới
+            encoding_name: Tên tokenizer tiktoken dùng để đếm tokens
+        """
+        self.max_tokens = max_tokens
+        self.summarize_fn = summarize_fn
+        self.encoding = tiktoken.get_encoding(encoding_name)
+
+        self.segments: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        # Key theo thứ tự dùng gần đây, cũ nhất đứng đầu
+        self._recency: "OrderedDict[str, None]" = OrderedDict()
+        self.segment_tokens: Dict[str, int] = {}
+        self.total_tokens = 0
+        self.summary = ""
+        self.summary_tokens = 0
+        self.evicted_segments = 0
+
+    @staticmethod
+    def segment_key(messages: List[Dict[str, Any]]) -> str:
+        """Key content-addressable cho một segment: sha1 của tin nhắn đầu tiên (user)."""
+        content = (messages[0].get("content") or "") if messages else ""
+        return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+    def count_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """Đếm tokens của các message có nội dung dạng text."""
+        return sum(
+            len(self.encoding.encode(msg["content"]))
+            for msg in messages if isinstance(msg.get("content"), str)
+        )
+
+    def add(self, messages: List[Dict[str, Any]]) -> str:
+        """
+        Thêm một lượt hội thoại vào cache và loại bớt segment cũ nếu vượt ngân sách
+
+        Returns:
+            Key của segment vừa thêm
+        """
+        key = self.segment_key(messages)
+
+        # Câu hỏi lặp lại: thay segment cũ bằng lượt mới nhất
+        if key in self.segments:
+            self.total_tokens -= self.segment_tokens.pop(key)
+            del self.segments[key]
+            del self._recency[key]
+
+        tokens = self.count_tokens(messages)
+        self.segments[key] = list(messages)
+        self._recency[key] = None
+        self.segment_tokens[key] = tokens
+        self.total_tokens += tokens
+
+        self._evict()
+        return key
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """Lấy segment theo key và đánh dấu là vừa được sử dụng."""
+        if key not in self.segments:
+            return None
+        self._recency.move_to_end(key)
+        return self.segments[key]
+
+    def _evict(self):
+        """Loại các segment LRU cho tới khi vừa ngân sách, luôn giữ lại segment mới nhất."""
+        evicted = []
+        while self.total_tokens > self.max_tokens and len(self.segments) > 1:
+            key, _ = self._recency.popitem(last=False)
+            messages = self.segments.pop(key)
+            self.total_tokens -= self.segment_tokens.pop(key)
+            evicted.extend(messages)
+            self.evicted_segments += 1
+
+        if evicted:
+            self.summary = self._summarize(evicted)
+            self.summary_tokens = len(self.encoding.encode(self.summary))
+
+    def _summarize(self, evicted: List[Dict[str, Any]]) -> str:
+        """Gộp các message bị loại vào summary hiện có."""
+        if self.summarize_fn:
+            try:
+                return self.summarize_fn(self.summary, evicted)
+            except Exception:
+                pass
+
+        # Fallback không cần API: giữ lại đầu các tin nhắn của user
+        user_lines = [
+            f"• {msg['content'][:100]}"
+            for msg in evicted
+            if msg.get("role") == "user" and isinstance(msg.get("content"), str)
+        ]
+        return "\n".join(filter(None, [self.summary] + user_lines))
+
+    def get_messages(self) -> List[Dict[str, Any]]:
+        """
+        Lấy các message để gửi kèm system prompt
+
+        Returns:
+            Tin nhắn tóm tắt (nếu có) theo sau là các segment còn giữ nguyên văn
+        """
+        messages = []
+        if self.summary:
+            messages.append({
+                "role": "system",
+                "content": f"📚 TÓM TẮT HỘI THOẠI TRƯỚC:\n{self.summary}"
+            })
+        for segment in self.segments.values():
+            messages.extend(segment)
+        return messages
+
+    def clear(self):
+        """Xóa toàn bộ segment và summary."""
+        self.segments.clear()
+        self._recency.clear()
+        self.segment_tokens.clear()
+        self.total_tokens = 0
+        self.summary = ""
+        self.summary_tokens = 0
+        self.evicted_segments = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Lấy thống kê cache."""
+        return {
+            "segments": len(self.segments),
+            "cached_tokens": self.total_tokens,
+            "summary_tokens": self.summary_tokens,
+            "max_tokens": self.max_tokens,
+            "evicted_segments": self.evicted_segments,
+            "has_summary": bool(self.summary)
+        }
@@ -14,25 +14,170 @@ Date: August 2025
 
 import json
 import re
-from datetime import datetime, timedelta
+import time
+import random
+import asyncio
+from collections import OrderedDict, deque
+from functools import lru_cache
+from itertools import islice
+from datetime import datetime
 from typing import Dict, List, Any, Optional, Tuple
-from dataclasses import dataclass
-from openai import OpenAI
+import numpy as np
+from openai import OpenAI, AsyncOpenAI
 import tiktoken
-from database import ExpenseDB
+from database import get_expense_db
 
 
-@dataclass
-class ConversationSegment:
-    """Đại diện cho một đoạn hội thoại đã được tóm tắt"""
-    start_time: str
-    end_time: str
-    message_count: int
-    summary: str
-    key_expenses: List[Dict[str, Any]]
-    important_context: Dict[str, Any]
-    tokens_saved: int
-    original_tokens: int
+def _isoformat(timestamp: Optional[float]) -> str:
+    """Epoch timestamp -> ISO string, chỉ format khi cần lưu/hiển thị"""
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else ''
+
+
+@lru_cache(maxsize=None)
+def _role_label(role: str) -> str:
+    """Nhãn role viết hoa trong conversation text (mỗi role chỉ upper() một lần)"""
+    return role.upper()
+
+
+class SessionSummaryStore:
+    """
+    📦 Các đoạn hội thoại đã tóm tắt của một session, lưu dạng Structure-of-Arrays
+    
+    Cột số (start_time, end_time dạng epoch float64; message_count, tokens_saved,
+    original_tokens dạng int32) là ring buffer numpy dung lượng cố định; cột chuỗi/list
+    là deque cùng maxlen. Thống kê như tổng tokens
+    tiết kiệm chỉ là một phép sum trên mảng thay vì duyệt từng object.
+    """
+    
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        
+        self.summaries: deque = deque(maxlen=capacity)
+        self.key_expenses: deque = deque(maxlen=capacity)
+        self.important_context: deque = deque(maxlen=capacity)
+        
+        self.start_time = np.zeros(capacity, dtype=np.float64)
+        self.end_time = np.zeros(capacity, dtype=np.float64)
+        self.message_count = np.zeros(capacity, dtype=np.int32)
+        self.tokens_saved = np.zeros(capacity, dtype=np.int32)
+        self.original_tokens = np.zeros(capacity, dtype=np.int32)
+        
+        self._head = 0
+        self._size = 0
+        # Tokens tiết kiệm của các đoạn đã bị loại khỏi ring buffer
+        self._evicted_tokens_saved = 0
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def append(self, start_time: float, end_time: float, message_count: int, summary: str,
+               key_expenses: List[Dict[str, Any]], important_context: Dict[str, Any],
+               tokens_saved: int, original_tokens: int):
+        """Thêm một đoạn đã tóm tắt, ghi đè đoạn cũ nhất khi đầy"""
+        if self._size == self.capacity:
+            self._evicted_tokens_saved += int(self.tokens_saved[self._head])
+        else:
+            self._size += 1
+        
+        self.start_time[self._head] = start_time
+        self.end_time[self._head] = end_time
+        self.message_count[self._head] = message_count
+        self.tokens_saved[self._head] = tokens_saved
+        self.original_tokens[self._head] = original_tokens
+        self._head = (self._head + 1) % self.capacity
+        
+        self.summaries.append(summary)
+        self.key_expenses.append(key_expenses)
+        self.important_context.append(important_context)
+    
+    def recent_summaries(self, limit: int) -> List[str]:
+        """Tối đa limit summary gần nhất, cũ trước mới sau"""
+        return list(islice(self.summaries, max(0, len(self.summaries) - limit), None))
+    
+    @property
+    def total_tokens_saved(self) -> int:
+        return int(self.tokens_saved.sum()) + self._evicted_tokens_saved
+
+
+class SemanticSummaryCache:
+    """
+    🔁 Semantic cache cho summaries: window gần giống (cosine ≥ threshold) với một
+    window đã tóm tắt thì dùng lại summary cũ, không gọi API
+    
+    Vector được chuẩn hóa L2 nên cosine similarity chỉ là một phép nhân ma trận.
+    Các vector nằm sẵn trong một ma trận float32 liên tục (mỗi entry một hàng cố định),
+    nên mỗi lần tra cứu là đúng một lệnh BLAS, không phải np.stack lại cả cache.
+    Entry hết hạn sau ttl_seconds, vượt max_entries thì loại entry LRU.
+    """
+    
+    def __init__(self, embedding_fn, threshold: float = 0.95, ttl_seconds: float = 300,
+                 max_entries: int = 256):
+        self.embedding_fn = embedding_fn
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        
+        # key -> (hàng trong ma trận, summary, thời điểm tạo)
+        self.entries: "OrderedDict[int, Tuple[int, str, float]]" = OrderedDict()
+        self._vectors: Optional[np.ndarray] = None   # (max_entries, dim), cấp phát ở lần put đầu
+        self._live = np.zeros(max_entries, dtype=bool)
+        self._row_keys = [None] * max_entries
+        self._free_rows = list(range(max_entries - 1, -1, -1))
+        self._next_key = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def embed(self, text: str) -> np.ndarray:
+        """Embed text và chuẩn hóa L2"""
+        vector = np.asarray(self.embedding_fn([text])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def _drop(self, key: int):
+        row = self.entries.pop(key)[0]
+        self._live[row] = False
+        self._row_keys[row] = None
+        self._free_rows.append(row)
+    
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        for key in [key for key, (_, _, created_at) in self.entries.items() if created_at < cutoff]:
+            self._drop(key)
+    
+    def get(self, vector: np.ndarray) -> Optional[str]:
+        """Tìm summary của window gần nhất, None nếu không có window đủ giống"""
+        self._expire()
+        if not self.entries:
+            self.misses += 1
+            return None
+        
+        similarities = self._vectors @ vector
+        similarities[~self._live] = -np.inf
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            self.misses += 1
+            return None
+        
+        key = self._row_keys[best]
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return self.entries[key][1]
+    
+    def put(self, vector: np.ndarray, summary: str):
+        """Lưu summary cho window vừa tóm tắt"""
+        if self.max_entries <= 0:
+            return
+        if self._vectors is None:
+            self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+        if not self._free_rows:
+            self._drop(next(iter(self.entries)))
+        
+        row = self._free_rows.pop()
+        self._vectors[row] = vector
+        self._live[row] = True
+        self._row_keys[row] = self._next_key
+        self.entries[self._next_key] = (row, summary, time.time())
+        self._next_key += 1
 
 
 class IntelligentConversationSummarizer:
@@ -46,8 +191,13 @@ class IntelligentConversationSummarizer:
     - Token optimization với semantic preservation
     """
     
+    # Window không có tín hiệu expense và ngắn hơn ngưỡng này (ký tự) thì không gọi LLM
+    TRIVIAL_WINDOW_CHARS = 500
+    
     def __init__(self, openai_client: OpenAI, max_window_size: int = 10, 
-                 summarize_threshold: int = 8, max_tokens_per_summary: int = 200):
+                 summarize_threshold: int = 8, max_tokens_per_summary: int = 200,
+                 async_client: Optional[AsyncOpenAI] = None, max_concurrent_summaries: int = 10,
+                 max_summaries_in_memory: int = 50):
         """
         Khởi tạo conversation summarizer
         
@@ -56,17 +206,31 @@ class IntelligentConversationSummarizer:
             max_window_size: Số messages tối đa trong active window
             summarize_threshold: Trigger summarization khi đạt threshold
             max_tokens_per_summary: Giới hạn tokens cho mỗi summary
+            async_client: AsyncOpenAI client cho summarization chạy nền (không có thì
+                dùng client sync trong thread riêng)
+            max_concurrent_summaries: Số request summarization tối đa chạy song song
+            max_summaries_in_memory: Số đoạn đã tóm tắt tối đa giữ trong RAM cho mỗi session
         """
         self.client = openai_client
+        self.async_client = async_client
+        self.max_concurrent_summaries = max_concurrent_summaries
+        
+        # Semaphore theo event loop và các task summarization đang chạy nền theo session
+        self._semaphores: Dict[Any, asyncio.Semaphore] = {}
+        self._pending_summaries: Dict[str, asyncio.Task] = {}
         self.max_window_size = max_window_size
         self.summarize_threshold = summarize_threshold
         self.max_tokens_per_summary = max_tokens_per_summary
+        self.max_summaries_in_memory = max_summaries_in_memory
         
         # Token counter để tối ưu cost
         self.encoding = tiktoken.encoding_for_model("gpt-4")
         
         # ExpenseDB cho lưu trữ summaries
-        self.db = ExpenseDB()
+        self.db = get_expense_db()
+        
+        # Semantic cache: window gần giống window đã tóm tắt thì không gọi API
+        self.summary_cache = SemanticSummaryCache(self.db.embedding_fn)
         
         # Collection cho active conversations
         self.active_conversations = {}
@@ -78,11 +242,48 @@ class IntelligentConversationSummarizer:
             'actions': ['kê khai', 'declare', 'báo cáo', 'report', 'hoàn trả', 'reimburse'],
             'policies': ['chính sách', 'policy', 'quy định', 'giới hạn', 'limit', 'hóa đơn', 'receipt']
         }
+        
+        # Gộp mọi nhóm từ khóa vào một regex duy nhất với named group: mỗi message
+        # chỉ cần một lượt finditer, phân loại kết quả theo m.lastgroup.
+        # Đơn vị tiền nằm trong lookahead để không "nuốt" từ khóa ngay sau số
+        # (vd: '10 kê khai'); 'report' đứng trước 'action' vì 'báo cáo'/'report'
+        # cũng là action.
+        self._re_all = re.compile(
+            r'(?P<amount>\d+(?:[,\.]\d+)?(?=\s*(?:triệu|tr|nghìn|k|VND|vnđ|đồng)))'
+            r'|(?P<report>báo cáo|report)'
+            r'|(?P<action>' + self._join_keywords(self.expense_keywords['actions']) + ')'
+            r'|(?P<policy>' + self._join_keywords(self.expense_keywords['policies']) + ')',
+            re.IGNORECASE
+        )
+        # Kết quả quét theo nội dung message: các window trượt chồng lên nhau và
+        # mỗi lần tóm tắt đều quét lại cùng những message đó
+        self._scan_content = lru_cache(maxsize=4096)(self._scan_content_uncached)
+    
+    @staticmethod
+    def _join_keywords(keywords: List[str]) -> str:
+        """Gộp danh sách từ khóa thành một regex alternation"""
+        return '|'.join(map(re.escape, keywords))
     
     def count_tokens(self, text: str) -> int:
         """Đếm số tokens trong text"""
         return len(self.encoding.encode(text))
     
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        """Đếm tokens cho nhiều text trong một lần gọi tokenizer (encode_batch chạy song song)"""
+        return [len(tokens) for tokens in self.encoding.encode_batch(texts, num_threads=4)]
+    
+    def _scan_content_uncached(self, content: str) -> Tuple[Tuple[str, ...], frozenset]:
+        """Một lượt quét cho cả 4 nhóm pattern: (các số tiền, tập nhóm từ khóa gặp được)"""
+        amounts = []
+        found = set()
+        for m in self._re_all.finditer(content.lower()):
+            kind = m.lastgroup
+            if kind == 'amount':
+                amounts.append(m.group())
+            else:
+                found.add(kind)
+        return tuple(amounts), frozenset(found)
+    
     def extract_expense_context(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
         Trích xuất context quan trọng liên quan đến expense từ messages
@@ -100,41 +301,54 @@ class IntelligentConversationSummarizer:
         }
         
         for msg in messages:
-            content = msg.get('content', '').lower()
-            role = msg.get('role', '')
+            amounts, found = self._scan_content(msg.get('content', ''))
+            if not amounts and not found:
+                continue
             
             # Extract declared expenses
-            amounts = re.findall(self.expense_keywords['amounts'], content)
-            if amounts and role == 'user':
+            if amounts and msg.get('role', '') == 'user':
                 expense_info = {
-                    'amounts': amounts,
+                    'amounts': list(amounts),
                     'content': msg.get('content', '')[:100],
                     'timestamp': msg.get('timestamp', '')
                 }
                 context['declared_expenses'].append(expense_info)
             
             # Extract policy questions
-            if any(keyword in content for keyword in self.expense_keywords['policies']):
+            if 'policy' in found:
                 context['policy_questions'].append({
                     'question': msg.get('content', '')[:100],
                     'timestamp': msg.get('timestamp', '')
                 })
             
             # Extract calculation/report requests
-            if any(action in content for action in self.expense_keywords['actions']):
-                if 'báo cáo' in content or 'report' in content:
-                    context['report_requests'].append(msg.get('content', '')[:100])
-                else:
-                    context['calculation_requests'].append(msg.get('content', '')[:100])
+            if 'report' in found:
+                context['report_requests'].append(msg.get('content', '')[:100])
+            elif 'action' in found:
+                context['calculation_requests'].append(msg.get('content', '')[:100])
         
         return context
     
-    def create_domain_specific_summary(self, messages: List[Dict[str, Any]]) -> str:
-        """
-        Tạo summary tối ưu cho expense domain với focus vào thông tin quan trọng
+    def _conversation_text(self, messages: List[Dict[str, Any]]) -> str:
+        """Chuẩn bị conversation text của window cần tóm tắt (list hoặc deque, không copy)"""
+        recent = islice(messages, max(0, len(messages) - self.summarize_threshold), None)
+        return "\n".join(f"{_role_label(msg['role'])}: {msg['content']}" for msg in recent)
+    
+    def _lookup_cached_summary(self, conversation_text: str) -> Tuple[Optional[np.ndarray], Optional[str]]:
         """
-        expense_context = self.extract_expense_context(messages)
+        Tra semantic cache cho window
         
+        Returns:
+            (vector của window, summary đã cache) - vector là None nếu không embed được
+        """
+        try:
+            vector = self.summary_cache.embed(conversation_text)
+        except Exception:
+            return None, None
+        return vector, self.summary_cache.get(vector)
+    
+    def _build_summary_messages(self, conversation_text: str) -> List[Dict[str, str]]:
+        """Dựng messages gửi lên API để tóm tắt (dùng chung cho bản sync và async)"""
         # Tạo prompt tối ưu cho expense summarization
         system_prompt = """Bạn là chuyên gia tóm tắt hội thoại cho hệ thống báo cáo chi phí. 
         
@@ -152,30 +366,123 @@ class IntelligentConversationSummarizer:
         
         Giữ summary ngắn gọn nhưng đầy đủ thông tin quan trọng (max 300 words)."""
         
-        # Chuẩn bị conversation text
-        conversation_text = "\n".join([
-            f"{msg['role'].upper()}: {msg['content']}" 
-            for msg in messages[-self.summarize_threshold:]
-        ])
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Hội thoại cần tóm tắt:\n\n{conversation_text}"}
+        ]
+    
+    def _summarize_without_llm(self, messages: List[Dict[str, Any]], expense_context: Dict[str, Any],
+                               conversation_text: str) -> Optional[str]:
+        """
+        Tóm tắt tại chỗ các window không đáng gọi LLM
+        
+        Returns:
+            Summary nếu window tầm thường, None nếu cần gọi API
+        """
+        # Không có tín hiệu expense nào và window ngắn: fallback summary đã đủ
+        signal = (len(expense_context['declared_expenses']) + len(expense_context['policy_questions'])
+                  + len(expense_context['report_requests']))
+        if signal == 0 and sum(len(msg.get('content', '')) for msg in messages) < self.TRIVIAL_WINDOW_CHARS:
+            return self.create_fallback_summary(messages, expense_context)
+        
+        # Window còn ngắn hơn ngân sách của summary: giữ nguyên văn
+        if self.count_tokens(conversation_text) <= self.max_tokens_per_summary:
+            return conversation_text
+        
+        return None
+    
+    def create_domain_specific_summary(self, messages: List[Dict[str, Any]],
+                                       expense_context: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Tạo summary tối ưu cho expense domain với focus vào thông tin quan trọng
+        
+        Args:
+            messages: Window cần tóm tắt
+            expense_context: Kết quả extract_expense_context(messages) nếu caller đã có
+        """
+        if expense_context is None:
+            expense_context = self.extract_expense_context(messages)
+        
+        # Dựng conversation text một lần, dùng chung cho semantic cache và prompt
+        conversation_text = self._conversation_text(messages)
+        local_summary = self._summarize_without_llm(messages, expense_context, conversation_text)
+        if local_summary is not None:
+            return local_summary
+        
+        vector, cached_summary = self._lookup_cached_summary(conversation_text)
+        if cached_summary is not None:
+            return cached_summary
         
         try:
             response = self.client.chat.completions.create(
                 model="GPT-4o-mini",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"Hội thoại cần tóm tắt:\n\n{conversation_text}"}
-                ],
+                messages=self._build_summary_messages(conversation_text),
                 max_tokens=self.max_tokens_per_summary,
                 temperature=0.3
             )
             
             summary = response.choices[0].message.content.strip()
+            if vector is not None:
+                self.summary_cache.put(vector, summary)
             return summary
             
         except Exception as e:
             # Fallback summary nếu API call fails
             return self.create_fallback_summary(messages, expense_context)
     
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Semaphore giới hạn số summarization song song cho event loop hiện tại"""
+        loop = asyncio.get_running_loop()
+        if loop not in self._semaphores:
+            self._semaphores[loop] = asyncio.Semaphore(self.max_concurrent_summaries)
+        return self._semaphores[loop]
+    
+    async def create_domain_specific_summary_async(self, messages: List[Dict[str, Any]],
+                                                   max_retries: int = 3,
+                                                   expense_context: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Bản async của create_domain_specific_summary
+        
+        Chạy dưới semaphore chung, thử lại với exponential backoff khi API lỗi,
+        hết lượt thử thì dùng fallback summary.
+        """
+        if self.async_client is None:
+            # Không có AsyncOpenAI: chạy bản sync trong thread để không block event loop
+            async with self._get_semaphore():
+                return await asyncio.to_thread(self.create_domain_specific_summary, messages, expense_context)
+        
+        if expense_context is None:
+            expense_context = self.extract_expense_context(messages)
+        conversation_text = self._conversation_text(messages)
+        local_summary = self._summarize_without_llm(messages, expense_context, conversation_text)
+        if local_summary is not None:
+            return local_summary
+        
+        vector, cached_summary = await asyncio.to_thread(self._lookup_cached_summary, conversation_text)
+        if cached_summary is not None:
+            return cached_summary
+        
+        request_messages = self._build_summary_messages(conversation_text)
+        
+        async with self._get_semaphore():
+            for attempt in range(max_retries):
+                try:
+                    response = await self.async_client.chat.completions.create(
+                        model="GPT-4o-mini",
+                        messages=request_messages,
+                        max_tokens=self.max_tokens_per_summary,
+                        temperature=0.3
+                    )
+                    summary = response.choices[0].message.content.strip()
+                    if vector is not None:
+                        self.summary_cache.put(vector, summary)
+                    return summary
+                except Exception:
+                    if attempt < max_retries - 1:
+                        await asyncio.sleep(2 ** attempt + random.random())
+        
+        return self.create_fallback_summary(messages, expense_context)
+    
     def create_fallback_summary(self, messages: List[Dict[str, Any]], 
                                expense_context: Dict[str, Any]) -> str:
         """Tạo summary backup không cần API call"""
@@ -214,15 +521,18 @@ class IntelligentConversationSummarizer:
         """
         # Khởi tạo session nếu chưa tồn tại
         if session_id not in self.active_conversations:
+            # deque có maxlen: message cũ hơn window tự bị loại trong O(1)
             self.active_conversations[session_id] = {
-                'messages': [],
-                'summaries': [],
-                'total_tokens_saved': 0,
-                'created_at': datetime.now().isoformat()
+                'messages': deque(maxlen=self.max_window_size),
+                'summaries': SessionSummaryStore(self.max_summaries_in_memory),
+                # Summaries cũ hơn đọc lại từ ChromaDB (None = chưa đọc), xem get_conversation_context
+                'stored_summaries': None,
+                'created_at': datetime.now().isoformat(),
+                'created_at_epoch': time.time()
             }
         
-        # Thêm timestamp vào message
-        message['timestamp'] = datetime.now().isoformat()
+        # Thêm timestamp vào message (epoch float, format ISO khi đọc ra)
+        message['timestamp'] = time.time()
         
         # Thêm message vào active window
         self.active_conversations[session_id]['messages'].append(message)
@@ -236,11 +546,39 @@ class IntelligentConversationSummarizer:
         
         # Kiểm tra xem có cần summarize không
         if self.should_summarize(session_id):
-            summary_result = self.summarize_conversation_window(session_id)
-            result.update(summary_result)
+            if self._has_running_loop():
+                # Trong event loop: tóm tắt chạy nền, caller nhận kết quả ngay
+                result['summary_scheduled'] = self._schedule_summarization(session_id)
+            else:
+                summary_result = self.summarize_conversation_window(session_id)
+                result.update(summary_result)
         
         return result
     
+    @staticmethod
+    def _has_running_loop() -> bool:
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
+            return False
+    
+    def _schedule_summarization(self, session_id: str) -> bool:
+        """Tạo task tóm tắt nền cho session (mỗi session tối đa một task đang chạy)"""
+        pending = self._pending_summaries.get(session_id)
+        if pending is not None and not pending.done():
+            return False
+        
+        task = asyncio.create_task(self.summarize_conversation_window_async(session_id))
+        self._pending_summaries[session_id] = task
+        return True
+    
+    async def wait_for_summaries(self):
+        """Chờ mọi task tóm tắt nền đang chạy hoàn tất"""
+        pending = [task for task in self._pending_summaries.values() if not task.done()]
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    
     def summarize_conversation_window(self, session_id: str) -> Dict[str, Any]:
         """
         Tóm tắt conversation window hiện tại và lưu vào ChromaDB
@@ -248,23 +586,60 @@ class IntelligentConversationSummarizer:
         if session_id not in self.active_conversations:
             return {'error': 'Session not found'}
         
-        messages = self.active_conversations[session_id]['messages']
+        messages = list(self.active_conversations[session_id]['messages'])
+        expense_context = self.extract_expense_context(messages)
+        summary_text = self.create_domain_specific_summary(messages, expense_context)
+        return self._store_summary(session_id, messages, summary_text, expense_context)
+    
+    async def summarize_conversation_window_async(self, session_id: str) -> Dict[str, Any]:
+        """
+        Bản async của summarize_conversation_window - message mới đến trong lúc
+        đang tóm tắt vẫn được giữ lại trong active window
+        """
+        if session_id not in self.active_conversations:
+            return {'error': 'Session not found'}
         
-        # Tính toán tokens trước khi summarize
-        original_tokens = sum(self.count_tokens(msg.get('content', '')) for msg in messages)
+        messages = list(self.active_conversations[session_id]['messages'])
+        expense_context = self.extract_expense_context(messages)
+        summary_text = await self.create_domain_specific_summary_async(messages, expense_context=expense_context)
+        return self._store_summary(session_id, messages, summary_text, expense_context)
+    
+    def _store_summary(self, session_id: str, messages: List[Dict[str, Any]], 
+                       summary_text: str, expense_context: Dict[str, Any]) -> Dict[str, Any]:
+        """Lưu summary của các messages đã tóm tắt và thu gọn active window"""
+        # Tokens của window gốc so với summary
+        original_tokens = sum(self.count_tokens_batch([msg.get('content', '') for msg in messages]))
         
-        # Tạo summary
-        summary_text = self.create_domain_specific_summary(messages)
         summary_tokens = self.count_tokens(summary_text)
         tokens_saved = original_tokens - summary_tokens
         
-        # Extract key information
-        expense_context = self.extract_expense_context(messages)
+        start_time = messages[0].get('timestamp', 0.0)
+        end_time = messages[-1].get('timestamp', 0.0)
+        
+        # ExpenseDB gom summary vào write-behind buffer, ghi ChromaDB (embedding + disk)
+        # theo lô ở writer thread nên không chặn add_message
+        segment_id = f"{session_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        self.db.add_conversation_summary(
+            user_id=session_id,
+            conversation_id=segment_id,
+            summary=summary_text,
+            metadata={
+                'session_id': session_id,
+                'start_time': _isoformat(start_time),
+                'end_time': _isoformat(end_time),
+                'message_count': len(messages),
+                'tokens_saved': tokens_saved,
+                'original_tokens': original_tokens,
+                'expense_count': len(expense_context['declared_expenses']),
+                'policy_questions': len(expense_context['policy_questions']),
+                'summary_type': 'conversation_segment'
+            }
+        )
         
-        # Tạo conversation segment
-        segment = ConversationSegment(
-            start_time=messages[0].get('timestamp', ''),
-            end_time=messages[-1].get('timestamp', ''),
+        # Lưu vào active conversation
+        self.active_conversations[session_id]['summaries'].append(
+            start_time=start_time,
+            end_time=end_time,
             message_count=len(messages),
             summary=summary_text,
             key_expenses=expense_context['declared_expenses'],
@@ -273,49 +648,26 @@ class IntelligentConversationSummarizer:
             original_tokens=original_tokens
         )
         
-        # Lưu vào ChromaDB thông qua ExpenseDB
-        segment_id = f"{session_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        # Giữ lại chỉ một số messages gần nhất đã tóm tắt - bỏ bớt từ đầu deque tại chỗ.
+        # Message đến sau khi bắt đầu tóm tắt nằm cuối deque nên không bị ảnh hưởng.
+        keep_recent = max(2, self.max_window_size - self.summarize_threshold)
+        active = self.active_conversations[session_id]['messages']
+        summarized_ids = {id(msg) for msg in messages}
+        still_active = sum(1 for msg in active if id(msg) in summarized_ids)
+        for _ in range(still_active - keep_recent):
+            active.popleft()
         
-        try:
-            self.db.add_conversation_summary(
-                user_id=session_id,
-                conversation_id=segment_id,
-                summary=summary_text,
-                metadata={
-                    'session_id': session_id,
-                    'start_time': segment.start_time,
-                    'end_time': segment.end_time,
-                    'message_count': segment.message_count,
-                    'tokens_saved': tokens_saved,
-                    'original_tokens': original_tokens,
-                    'expense_count': len(expense_context['declared_expenses']),
-                    'policy_questions': len(expense_context['policy_questions']),
-                    'summary_type': 'conversation_segment'
-                }
-            )
-            
-            # Lưu vào active conversation
-            self.active_conversations[session_id]['summaries'].append(segment)
-            self.active_conversations[session_id]['total_tokens_saved'] += tokens_saved
-            
-            # Giữ lại chỉ một số messages gần nhất
-            keep_recent = max(2, self.max_window_size - self.summarize_threshold)
-            self.active_conversations[session_id]['messages'] = messages[-keep_recent:]
-            
-            return {
-                'summarized': True,
-                'tokens_saved': tokens_saved,
-                'summary_created': summary_text,
-                'segment_id': segment_id,
-                'active_messages': len(self.active_conversations[session_id]['messages'])
-            }
-            
-        except Exception as e:
-            return {
-                'summarized': False,
-                'error': f"Failed to save summary: {str(e)}",
-                'tokens_saved': 0
-            }
+        return {
+            'summarized': True,
+            'tokens_saved': tokens_saved,
+            'summary_created': summary_text,
+            'segment_id': segment_id,
+            'active_messages': len(self.active_conversations[session_id]['messages'])
+        }
+    
+    def flush(self):
+        """Chờ mọi summary đang đợi được ghi xuống ChromaDB"""
+        self.db.flush()
     
     def get_conversation_context(self, session_id: str, max_summaries: int = 3) -> str:
         """
@@ -328,27 +680,33 @@ class IntelligentConversationSummarizer:
             return ""
         
         context_parts = []
+        session_data = self.active_conversations[session_id]
         
-        # Lấy recent summaries từ ChromaDB thông qua ExpenseDB
-        try:
-            recent_summaries = self.db.get_conversation_summaries(
-                user_id=session_id, 
-                limit=max_summaries
-            )
-            
-            if recent_summaries:
-                context_parts.append("📚 LỊCH SỬ ĐÃ TÓM TẮT:")
-                for summary_data in recent_summaries:
-                    context_parts.append(f"• {summary_data['summary']}")
-                context_parts.append("")
-        except Exception:
-            pass
+        # Summaries của session đang có sẵn trong RAM. ChromaDB chỉ được đọc một lần cho mỗi
+        # session (lượt đầu, vd: sau khi restart process) để lấy các summary cũ hơn RAM
+        recent_summaries = session_data['summaries'].recent_summaries(max_summaries)
+        if session_data['stored_summaries'] is None:
+            session_data['stored_summaries'] = []
+            if len(recent_summaries) < max_summaries:
+                stored = self.db.get_conversation_summaries(user_id=session_id, limit=max_summaries)
+                stored = [summary_data['summary'] for summary_data in reversed(stored)]
+                # Các summary mới nhất trong đó chính là các summary đang có trong RAM
+                session_data['stored_summaries'] = stored[:max(0, len(stored) - len(recent_summaries))]
+        if session_data['stored_summaries']:
+            recent_summaries = (session_data['stored_summaries'] + recent_summaries)[-max_summaries:]
+        
+        if recent_summaries:
+            context_parts.append("📚 LỊCH SỬ ĐÃ TÓM TẮT:")
+            for summary in recent_summaries:
+                context_parts.append(f"• {summary}")
+            context_parts.append("")
         
         # Thêm active messages
         active_messages = self.active_conversations[session_id]['messages']
         if active_messages:
             context_parts.append("💬 TIN NHẮN GÂN ĐÂY:")
-            for msg in active_messages[-5:]:  # Chỉ lấy 5 messages gần nhất
+            # Chỉ lấy 5 messages gần nhất
+            for msg in islice(active_messages, max(0, len(active_messages) - 5), None):
                 role_emoji = "👤" if msg['role'] == 'user' else "🤖"
                 context_parts.append(f"{role_emoji} {msg['content'][:100]}...")
         
@@ -365,20 +723,25 @@ class IntelligentConversationSummarizer:
             'session_id': session_id,
             'active_messages': len(session_data['messages']),
             'total_summaries': len(session_data['summaries']),
-            'total_tokens_saved': session_data['total_tokens_saved'],
+            'total_tokens_saved': session_data['summaries'].total_tokens_saved,
             'created_at': session_data['created_at'],
-            'last_activity': session_data['messages'][-1]['timestamp'] if session_data['messages'] else None
+            'last_activity': _isoformat(session_data['messages'][-1]['timestamp']) if session_data['messages'] else None
         }
     
     def cleanup_old_sessions(self, days_threshold: int = 7):
-        """Dọn dẹp các sessions cũ"""
-        cutoff_date = datetime.now() - timedelta(days=days_threshold)
+        """
+        Dọn dẹp các sessions cũ
+        
+        active_conversations giữ thứ tự tạo session nên các session hết hạn luôn nằm
+        ở đầu dict: dừng ở session đầu tiên còn hạn, không cần parse ISO timestamp.
+        """
+        cutoff_epoch = time.time() - days_threshold * 86400
         
         sessions_to_remove = []
         for session_id, data in self.active_conversations.items():
-            created_at = datetime.fromisoformat(data['created_at'])
-            if created_at < cutoff_date:
-                sessions_to_remove.append(session_id)
+            if data['created_at_epoch'] >= cutoff_epoch:
+                break
+            sessions_to_remove.append(session_id)
         
         for session_id in sessions_to_remove:
             del self.active_conversations[session_id]
@@ -387,13 +750,15 @@ class IntelligentConversationSummarizer:
 
 
 # Utility functions để integrate với existing system
-def create_summarizer(openai_client: OpenAI) -> IntelligentConversationSummarizer:
+def create_summarizer(openai_client: OpenAI, 
+                      async_client: Optional[AsyncOpenAI] = None) -> IntelligentConversationSummarizer:
     """Factory function để tạo summarizer instance"""
     return IntelligentConversationSummarizer(
         openai_client=openai_client,
         max_window_size=10,
         summarize_threshold=8,
-        max_tokens_per_summary=200
+        max_tokens_per_summary=200,
+        async_client=async_client
     )
 
 
@@ -1,298 +1,801 @@
 import chromadb
-from chromadb.utils import embedding_functions
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Union
+import copy
 import json
+import logging
 import os
+import re
 import time
 import datetime
+import atexit
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from chromadb.db.impl.sqlite import SqliteDB
 from dotenv import load_dotenv
+from embedding_cache import EmbeddingCache
+from onnx_embedding import FastONNXMiniLM
+from vector_index import StaticVectorIndex
+
+# ⚡ orjson (tùy chọn) cho serialize/deserialize documents JSON
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+if ORJSON_AVAILABLE:
+    def _json_dumps(value: Any) -> str:
+        """Serialize bằng orjson; datetime vẫn đi qua default=str như json.dumps"""
+        return orjson.dumps(
+            value, default=str,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        ).decode()
+    _json_loads = orjson.loads
+else:
+    def _json_dumps(value: Any) -> str:
+        return json.dumps(value, ensure_ascii=False, default=str)
+    _json_loads = json.loads
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# HNSW index settings for every ExpenseDB collection: embeddings are L2-normalized, so
+# inner product equals cosine similarity without the per-distance norm work; denser
+# graph (M) and wider build/search beams than Chroma's defaults.
+# Chroma only applies these when a collection is created; existing ones keep theirs.
+HNSW_METADATA = {
+    "hnsw:space": "ip",
+    "hnsw:M": 32,
+    "hnsw:construction_ef": 128,
+    "hnsw:search_ef": 64,
+}
+
+# (ExpenseDB attribute, collection name, description) of every collection ExpenseDB uses,
+# each opened lazily on first access
+COLLECTIONS = (
+    ("expense_policies", "expense_policies", "Company expense policies"),
+    ("expense_categories", "expense_categories", "Expense categories and limits"),
+    ("expense_reports", "expense_reports", "Sample expense reports"),
+    # New collections for enhanced chatbot capabilities
+    ("faqs", "expense_faq", "General FAQs and common questions"),  # Consistent với populate script
+    ("knowledge_base", "company_knowledge", "Company policies and knowledge base"),
+    # 💾 Persistent user data storage
+    ("user_expenses", "user_expenses", "User expense data for persistence"),
+    ("user_sessions", "user_sessions", "User session data for persistence"),
+    # 🧠 Conversation summaries
+    ("conversation_summaries", "conversation_summaries", "Summarized conversation segments"),
+    # 🧷 Per-turn user messages for top-K relevant history retrieval
+    ("conversation_turns", "conversation_turns", "Embedded user turns for relevant history retrieval"),
+    # 💡 Expense examples
+    ("expense_examples", "expense_examples", "Real expense examples for training"),
+    ("sample_questions", "sample_questions", "Sample user queries"),
+    # ⚡ Semantic cache of assistant responses, keyed by the embedded user input
+    ("response_cache", "llm_response_cache", "Cached assistant responses for near-duplicate questions"),
+)
+_COLLECTION_SPECS = {attr: (name, description) for attr, name, description in COLLECTIONS}
+
+# Collections holding loaded reference data (wiped by ExpenseDB.clear_all before a re-import)
+KNOWLEDGE_COLLECTIONS = (
+    "expense_policies", "expense_categories", "expense_reports",
+    "sample_questions", "faqs", "knowledge_base"
+)
+
+# SQLite settings for Chroma's backing database, applied to every connection it opens
+# (one per thread). WAL lets the searches read while the writer thread commits;
+# synchronous=NORMAL is crash-safe under WAL and drops the fsync per commit that the
+# frequent save_user_data / save_guest_session / buffered-summary writes were paying for.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",
+)
+
+def _tune_sqlite(client) -> None:
+    """Apply SQLITE_PRAGMAS to each new connection of the client's SQLite pool"""
+    try:
+        pool = client._system.instance(SqliteDB)._conn_pool
+        connect = pool.connect
+    except AttributeError:
+        # Private chromadb API (requirements.txt pins the version it was written for,
+        # tests/test_database_sqlite.py checks it): say so instead of silently skipping
+        logger.warning("chromadb %s has no SqliteDB connection pool hook; SQLite pragmas not applied",
+                       chromadb.__version__)
+        return
+    
+    tuned = weakref.WeakSet()
+    
+    def tuned_connect(*args, **kwargs):
+        conn = connect(*args, **kwargs)
+        if conn not in tuned:
+            tuned.add(conn)
+            for pragma in SQLITE_PRAGMAS:
+                try:
+                    conn.execute(pragma)
+                except Exception as e:
+                    logger.warning("Could not apply '%s': %s", pragma, e)
+        return conn
+    
+    pool.connect = tuned_connect
+
+# Metadata key listing the fields of a category/report record that are stored as JSON
+RECORD_JSON_FIELDS = "_json_fields"
+
+def _epoch_seconds(timestamp: Union[int, float, str]) -> float:
+    """Epoch seconds of a "timestamp" metadata value (rows written before epoch timestamps hold ISO strings)"""
+    if isinstance(timestamp, str):
+        try:
+            return datetime.datetime.fromisoformat(timestamp).timestamp()
+        except ValueError:
+            return 0.0
+    return float(timestamp)
+
+def _iso_timestamp(timestamp: Union[int, float, str]) -> str:
+    """ISO 8601 form of a "timestamp" metadata value, formatted only when read"""
+    if isinstance(timestamp, str):
+        return timestamp
+    return datetime.datetime.fromtimestamp(timestamp).isoformat()
+
+# Prefix of the per-keyword boolean flags stored on FAQ / knowledge base metadata
+KEYWORD_FLAG_PREFIX = "kw:"
+
+# Instance state shared by all ExpenseDB objects (see ExpenseDB.__init__)
+_SHARED_STATE: Dict[str, Any] = {}
+_SHARED_STATE_LOCK = threading.Lock()
+
+# Serializes the lazy get_or_create_collection calls of ExpenseDB.__getattr__: two threads
+# creating the same collection at once fail with a UNIQUE constraint error in Chroma's SQLite
+_COLLECTION_OPEN_LOCK = threading.Lock()
+
+# Shared pool for the per-collection lookups of comprehensive_search
+_SEARCH_EXECUTOR = ThreadPoolExecutor(max_workers=3, thread_name_prefix="expense-db-search")
+
 class ExpenseDB:
+    # Số documents tối đa mỗi lần collection.add (mỗi lô một lượt embed + một transaction);
+    # 100-250 là khoảng nhanh nhất khi nạp dữ liệu vào ChromaDB
+    ADD_BATCH_SIZE = 200
+    
+    # Write-behind buffer: flush when a collection has this many pending documents...
+    WRITE_BATCH_SIZE = 64
+    # ...or at least this often (seconds)
+    WRITE_FLUSH_INTERVAL = 0.5
+    
+    # Stored conversation turns older than this are deleted (seconds); the writer
+    # thread checks at most once per CONVERSATION_TURN_PRUNE_INTERVAL
+    CONVERSATION_TURN_TTL = 24 * 3600.0
+    CONVERSATION_TURN_PRUNE_INTERVAL = 600.0
+    
+    # system_health_check result is reused for this many seconds
+    HEALTH_CHECK_TTL = 5.0
+    
+    # Documents read per get() when iterating over all stored users
+    USER_PAGE_SIZE = 500
+    
+    # User data / guest session JSON kept in memory for this long (seconds), LRU-capped
+    RECORD_CACHE_TTL = 30.0
+    RECORD_CACHE_SIZE = 256
+    # In-memory indexes of the static collections are reloaded after this process writes
+    # to the collection, or after this many seconds so writes made by another process
+    # (a separate ingest run or CLI) are picked up
+    STATIC_INDEX_TTL = 600.0
+    
+    # comprehensive_search results, dropped when a searched collection is written to or
+    # after the TTL; together with STATIC_INDEX_TTL, another process's writes show up in
+    # search results within SEARCH_CACHE_TTL + STATIC_INDEX_TTL seconds
+    SEARCH_CACHE_TTL = 600.0
+    SEARCH_CACHE_SIZE = 256
+    
     def __init__(self):
+        # Every ExpenseDB shares one client, one set of collection handles, the write
+        # buffer and the caches: open them only for the first instance in the process
+        self.__dict__ = _SHARED_STATE
+        with _SHARED_STATE_LOCK:
+            if not _SHARED_STATE:
+                try:
+                    self._open()
+                except Exception:
+                    _SHARED_STATE.clear()
+                    raise
+    
+    def __getattr__(self, attr: str):
+        """Open a collection from COLLECTIONS the first time its attribute is used"""
+        spec = _COLLECTION_SPECS.get(attr)
+        if spec is None or "client" not in self.__dict__:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {attr!r}")
+        
+        name, description = spec
+        with _COLLECTION_OPEN_LOCK:
+            # Another thread may have opened it while this one waited for the lock
+            collection = self.__dict__.get(attr)
+            if collection is None:
+                collection = self.client.get_or_create_collection(
+                    name=name,
+                    embedding_function=self.embedding_fn,
+                    metadata={**HNSW_METADATA, "description": description}
+                )
+                setattr(self, attr, collection)
+        return collection
+    
+    def _open(self):
+        """Open the ChromaDB client, embedding function and collections"""
         # Initialize ChromaDB client - sử dụng path nhất quán
         self.client = chromadb.PersistentClient(path="./data/chromadb")
+        _tune_sqlite(self.client)
         
-        # Use ChromaDB's default embedding function (no API key needed)
-        self.embedding_fn = embedding_functions.DefaultEmbeddingFunction()
-        
-        # Initialize collections
-        self.expense_policies = self.client.get_or_create_collection(
-            name="expense_policies",
-            embedding_function=self.embedding_fn,
-            metadata={"description": "Company expense policies"}
-        )
-        
-        self.expense_categories = self.client.get_or_create_collection(
-            name="expense_categories",
-            embedding_function=self.embedding_fn,
-            metadata={"description": "Expense categories and limits"}
-        )
-        
-        self.expense_reports = self.client.get_or_create_collection(
-            name="expense_reports",
-            embedding_function=self.embedding_fn,
-            metadata={"description": "Sample expense reports"}
-        )
+        # One embedding model per process, shared with every other ChromaDB user
+        self.embedding_fn = get_embedding_function()
 
-        # New collections for enhanced chatbot capabilities
-        self.faqs = self.client.get_or_create_collection(
-            name="expense_faq",  # Consistent với populate script
-            embedding_function=self.embedding_fn,
-            metadata={"description": "General FAQs and common questions"}
-        )
+        # Collections are opened on first access (see __getattr__)
         
-        self.knowledge_base = self.client.get_or_create_collection(
-            name="company_knowledge",
-            embedding_function=self.embedding_fn,
-            metadata={"description": "Company policies and knowledge base"}
-        )
+        # ✍️ Write-behind buffer for single-document adds (summaries, turns, expense examples):
+        # collection name -> (collection, {doc_id: (document, metadata)})
+        self._pending_writes: Dict[str, Tuple[Any, Dict[str, Tuple[str, Dict[str, Any]]]]] = {}
+        # Documents taken by the flush that is writing them right now: name -> {doc_id: (document, metadata)}
+        self._flushing_writes: Dict[str, Dict[str, Tuple[str, Dict[str, Any]]]] = {}
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._writer_thread: Optional[threading.Thread] = None
+        self._turns_pruned_at = 0.0
         
-        # 💾 New collections for persistent user data storage
-        self.user_expenses = self.client.get_or_create_collection(
-            name="user_expenses",
-            embedding_function=self.embedding_fn,
-            metadata={"description": "User expense data for persistence"}
-        )
+        # (checked_at, result) of the last system_health_check
+        self._health_cache: Tuple[float, Optional[Dict[str, Any]]] = (0.0, None)
         
-        self.user_sessions = self.client.get_or_create_collection(
-            name="user_sessions", 
-            embedding_function=self.embedding_fn,
-            metadata={"description": "User session data for persistence"}
-        )
+        # Document counts per collection, dropped whenever the collection is written to;
+        # the generation guards against caching a count read while a write was in flight
+        self._count_cache: Dict[str, int] = {}
+        self._count_generation: Dict[str, int] = {}
         
-        # 🧠 Conversation summaries collection
-        self.conversation_summaries = self.client.get_or_create_collection(
-            name="conversation_summaries",
-            embedding_function=self.embedding_fn,
-            metadata={"description": "Summarized conversation segments"}
-        )
+        # In-memory indexes of the static, read-heavy collections: name -> (generation, loaded_at, index),
+        # rebuilt on the first search after a write to that collection or after STATIC_INDEX_TTL
+        self._static_indexes: Dict[str, Tuple[int, float, StaticVectorIndex]] = {}
+        self._static_index_lock = threading.Lock()
         
-        # 💡 Expense examples collection  
-        self.expense_examples = self.client.get_or_create_collection(
-            name="expense_examples",
-            embedding_function=self.embedding_fn,
-            metadata={"description": "Sample expense examples and outcomes"}
-        )  
-        self.expense_examples = self.client.get_or_create_collection(
-            name="expense_examples",
-            embedding_function=self.embedding_fn,
-            metadata={"description": "Real expense examples for training"}
-        )
+        # Stored user data / guest session JSON by document id: doc_id -> (cached_at, json).
+        # Kept as the JSON string so every load hands out its own freshly parsed dict
+        self._record_cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._record_cache_lock = threading.Lock()
+        self._search_cache: "OrderedDict[Tuple[str, int], Tuple[float, Tuple[int, ...], Dict[str, Any]]]" = OrderedDict()
+        self._search_cache_lock = threading.Lock()
+    
+    def _cached_record(self, doc_id: str) -> Optional[str]:
+        """JSON of a recently saved/loaded record, None if absent or older than RECORD_CACHE_TTL"""
+        with self._record_cache_lock:
+            entry = self._record_cache.get(doc_id)
+            if entry is None:
+                return None
+            if time.time() - entry[0] >= self.RECORD_CACHE_TTL:
+                del self._record_cache[doc_id]
+                return None
+            self._record_cache.move_to_end(doc_id)
+            return entry[1]
+    
+    def _cache_record(self, doc_id: str, document: str):
+        with self._record_cache_lock:
+            self._record_cache[doc_id] = (time.time(), document)
+            self._record_cache.move_to_end(doc_id)
+            while len(self._record_cache) > self.RECORD_CACHE_SIZE:
+                self._record_cache.popitem(last=False)
+    
+    def _collection_count(self, collection) -> int:
+        """collection.count(), memoized until the next write to that collection"""
+        name = collection.name
+        if name in self._count_cache:
+            return self._count_cache[name]
+        
+        generation = self._count_generation.get(name, 0)
+        count = collection.count()
+        if self._count_generation.get(name, 0) == generation:
+            self._count_cache[name] = count
+        return count
+    
+    def _invalidate_count(self, collection_name: str):
+        self._count_generation[collection_name] = self._count_generation.get(collection_name, 0) + 1
+        self._count_cache.pop(collection_name, None)
+    
+    def _add_in_batches(self, collection, documents: List[str], ids: List[str],
+                        metadatas: List[Dict[str, Any]], upsert: bool = False):
+        """Add (or upsert) documents in chunks of ADD_BATCH_SIZE (capped by Chroma's max batch size)"""
+        batch_size = min(self.ADD_BATCH_SIZE, self.client.get_max_batch_size())
+        write = collection.upsert if upsert else collection.add
+        try:
+            # Embed everything in one call (one cache lookup, length-sorted model batches
+            # over the whole input) and hand Chroma the vectors instead of per-chunk texts
+            embeddings = self.embedding_fn(documents) if documents else []
+            for start in range(0, len(documents), batch_size):
+                end = start + batch_size
+                write(documents=documents[start:end], ids=ids[start:end], metadatas=metadatas[start:end],
+                      embeddings=embeddings[start:end])
+        finally:
+            self._invalidate_count(collection.name)
     
     def add_policies(self, policies: Dict[str, List[str]]):
-        """Add policies to the database"""
+        """Add policies to the database (batched add)"""
+        documents, ids, metadatas = [], [], []
         for category, rules in policies.items():
             for idx, rule in enumerate(rules):
-                self.expense_policies.add(
-                    documents=[rule],
-                    ids=[f"{category}_{idx}"],
-                    metadatas=[{"category": category}]
-                )
+                documents.append(rule)
+                ids.append(f"{category}_{idx}")
+                metadatas.append({"category": category})
+        
+        if documents:
+            self._add_in_batches(self.expense_policies, documents, ids, metadatas)
+    
+    @staticmethod
+    def _record_to_metadata(record: Dict[str, Any]) -> Dict[str, Any]:
+        """Flatten a record into Chroma metadata; non-scalar values are stored as JSON strings"""
+        metadata, json_fields = {}, []
+        for key, value in record.items():
+            if isinstance(value, (str, int, float, bool)):
+                metadata[key] = value
+            else:
+                metadata[key] = _json_dumps(value)
+                json_fields.append(key)
+        metadata[RECORD_JSON_FIELDS] = ",".join(json_fields)
+        return metadata
+    
+    @staticmethod
+    def _record_from_metadata(metadata: Dict[str, Any], document: str) -> Dict[str, Any]:
+        """Rebuild a record stored by _record_to_metadata (older rows kept the record as a JSON document)"""
+        if RECORD_JSON_FIELDS not in metadata:
+            return _json_loads(document)
+        json_fields = set(filter(None, metadata[RECORD_JSON_FIELDS].split(",")))
+        return {
+            key: _json_loads(value) if key in json_fields else value
+            for key, value in metadata.items()
+            if key != RECORD_JSON_FIELDS
+        }
     
     def add_categories(self, categories: Dict[str, Dict[str, Any]]):
-        """Add expense categories to the database"""
-        for category, details in categories.items():
-            self.expense_categories.add(
-                documents=[json.dumps(details)],
-                ids=[category],
-                metadatas=[{"category": category}]
+        """Add expense categories (fields in metadata, readable description as the document)"""
+        if categories:
+            self._add_in_batches(
+                self.expense_categories,
+                documents=[
+                    f"{category}: " + "; ".join(f"{key} {value}" for key, value in details.items())
+                    for category, details in categories.items()
+                ],
+                ids=list(categories),
+                metadatas=[self._record_to_metadata(details) for details in categories.values()]
             )
     
     def add_expense_reports(self, reports: List[Dict[str, Any]]):
-        """Add expense reports to the database"""
-        for idx, report in enumerate(reports):
-            self.expense_reports.add(
-                documents=[json.dumps(report)],
-                ids=[f"report_{idx}"],
-                metadatas=[{"employee_id": report.get("employee_id")}]
+        """Add expense reports (fields in metadata, description as the document)"""
+        if reports:
+            self._add_in_batches(
+                self.expense_reports,
+                documents=[
+                    report.get("description") or f"{report.get('category', '')} expense {report.get('amount', '')}"
+                    for report in reports
+                ],
+                ids=[f"report_{idx}" for idx in range(len(reports))],
+                metadatas=[self._record_to_metadata(report) for report in reports]
             )
     
-    def search_policies(self, query: str, limit: int = 5) -> List[str]:
-        """Search policies based on query"""
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a search query once so it can be reused across several collections"""
+        return self.embedding_fn([query])[0]
+    
+    def _static_index(self, collection) -> StaticVectorIndex:
+        """In-memory index of a static collection, reloaded after a write or after STATIC_INDEX_TTL"""
+        name = collection.name
+        generation = self._count_generation.get(name, 0)
+        
+        def fresh(cached) -> bool:
+            return (cached is not None and cached[0] == generation
+                    and time.time() - cached[1] < self.STATIC_INDEX_TTL)
+        
+        cached = self._static_indexes.get(name)
+        if fresh(cached):
+            return cached[2]
+        
+        with self._static_index_lock:
+            cached = self._static_indexes.get(name)
+            if fresh(cached):
+                return cached[2]
+            loaded_at = time.time()
+            index = StaticVectorIndex.from_collection(collection)
+            # Same guard as the count cache: don't keep an index loaded while a write was in flight
+            if self._count_generation.get(name, 0) == generation:
+                self._static_indexes[name] = (generation, loaded_at, index)
+            return index
+    
+    def _static_query(self, collection, queries: List[str], limit: int,
+                      query_embedding: Optional[List[float]] = None) -> Dict[str, List[List[Any]]]:
+        """collection.query() served from the in-memory index (reuses query_embedding if given)"""
+        query_embeddings = [query_embedding] if query_embedding is not None else self.embedding_fn(queries)
+        return self._static_index(collection).query(query_embeddings, limit)
+    
+    def search_policies(self, query: Union[str, List[str]], limit: int = 5,
+                        query_embedding: Optional[List[float]] = None) -> Union[List[str], List[List[str]]]:
+        """Search policies based on query (a list of queries is embedded and searched in one call)"""
+        queries = [query] if isinstance(query, str) else list(query)
         try:
-            results = self.expense_policies.query(
-                query_texts=[query],
-                n_results=limit
-            )
-            return results['documents'][0] if results['documents'] else []
+            results = self._static_query(self.expense_policies, queries, limit, query_embedding)
+            documents = results['documents'] or [[] for _ in queries]
+            return documents[0] if isinstance(query, str) else documents
         except Exception as e:
-            print(f"Error searching policies: {e}")
-            return []
+            logger.error("Error searching policies: %s", e)
+            return [] if isinstance(query, str) else [[] for _ in queries]
     
     def get_category_limits(self, category: str) -> Dict[str, Any]:
         """Get category limits and rules"""
-        result = self.expense_categories.get(
-            ids=[category]
-        )
-        if result['documents']:
-            return json.loads(result['documents'][0])
-        return {}
+        return self.get_category_limits_many([category]).get(category, {})
+    
+    def get_category_limits_many(self, categories: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get limits and rules for several categories in a single get() call"""
+        if not categories:
+            return {}
+        result = self.expense_categories.get(ids=list(categories), include=["metadatas", "documents"])
+        return {
+            category_id: self._record_from_metadata(metadata, doc)
+            for category_id, metadata, doc in zip(result['ids'], result['metadatas'], result['documents'])
+        }
     
     def get_sample_reports(self, limit: int = 5) -> List[Dict[str, Any]]:
-        """Get sample expense reports"""
-        results = self.expense_reports.query(
-            query_texts=[""],
-            n_results=limit
-        )
-        return [json.loads(doc) for doc in results['documents'][0]]
+        """Get sample expense reports (plain fetch, no embedding/vector search)"""
+        results = self.expense_reports.get(limit=limit, include=["metadatas", "documents"])
+        return [
+            self._record_from_metadata(metadata, doc)
+            for metadata, doc in zip(results['metadatas'], results['documents'])
+        ]
 
     def clear_all(self):
-        """Clear all collections"""
+        """Clear all knowledge collections (policies, categories, reports, questions, FAQs, knowledge base)"""
+        # Resolved through COLLECTIONS so the names always match what ExpenseDB opens;
+        # user data, sessions, summaries and turns are deliberately left alone.
+        # Collections are opened lazily, so some may never have been created
+        existing = {collection.name for collection in self.client.list_collections()}
         collections_to_clear = [
-            "expense_policies", "expense_categories", "expense_reports", 
-            "sample_questions", "general_faqs", "company_knowledge"
+            _COLLECTION_SPECS[attr][0] for attr in KNOWLEDGE_COLLECTIONS
+            if _COLLECTION_SPECS[attr][0] in existing
         ]
+        
+        # One at a time: Chroma's SQLite backend can't run deletes concurrently
+        # ("database is locked"), which leaves orphaned segments and embeddings behind
         for collection_name in collections_to_clear:
             try:
                 self.client.delete_collection(collection_name)
             except Exception as e:
-                print(f"Warning: Could not delete collection {collection_name}: {e}")
+                logger.warning("Could not delete collection %s: %s", collection_name, e)
+            self._invalidate_count(collection_name)
+        
+        # Drop the handles of deleted collections; the next access recreates them
+        for attr in KNOWLEDGE_COLLECTIONS:
+            self.__dict__.pop(attr, None)
 
     def add_sample_questions(self, questions: list):
-        """Add sample user queries to the database"""
-        collection = self.client.get_or_create_collection(
-            name="sample_questions",
-            embedding_function=self.embedding_fn,
-            metadata={"description": "Sample user queries"}
-        )
-        for idx, q in enumerate(questions):
-            collection.add(
-                documents=[q],
-                ids=[f"question_{idx}"],
-                metadatas=[{"type": "sample_question"}]
+        """Add sample user queries to the database (batched add)"""
+        if questions:
+            self._add_in_batches(
+                self.sample_questions,
+                documents=list(questions),
+                ids=[f"question_{idx}" for idx in range(len(questions))],
+                metadatas=[{"type": "sample_question"} for _ in questions]
             )
     
+    @staticmethod
+    def _keyword_metadata(keywords: List[str]) -> Dict[str, Any]:
+        """
+        Keyword metadata for one item: the normalized comma-joined list plus a boolean
+        flag per keyword, so where={"kw:mileage": True} is an exact metadata filter
+        (Chroma metadata values cannot be lists)
+        """
+        normalized = list(dict.fromkeys(keyword.strip().lower() for keyword in keywords if keyword.strip()))
+        return {
+            "keywords": ",".join(normalized),
+            **{f"{KEYWORD_FLAG_PREFIX}{keyword}": True for keyword in normalized}
+        }
+    
     def add_faqs(self, faqs: List[Dict[str, Any]]):
-        """Add FAQs to the database"""
-        for idx, faq in enumerate(faqs):
-            # Store both question and answer as searchable content
-            content = f"Q: {faq['question']} A: {faq['answer']}"
-            self.faqs.add(
-                documents=[content],
-                ids=[f"faq_{idx}"],
-                metadatas={
-                    "question": faq["question"],
-                    "answer": faq["answer"],
-                    "category": faq["category"],
-                    "keywords": ",".join(faq["keywords"])
-                }
-            )
+        """Add FAQs to the database (batched add)"""
+        if not faqs:
+            return
+        
+        # Store both question and answer as searchable content
+        self._add_in_batches(
+            self.faqs,
+            documents=[f"Q: {faq['question']} A: {faq['answer']}" for faq in faqs],
+            ids=[f"faq_{idx}" for idx in range(len(faqs))],
+            metadatas=[{
+                "question": faq["question"],
+                "answer": faq["answer"],
+                "category": faq["category"],
+                **self._keyword_metadata(faq["keywords"])
+            } for faq in faqs]
+        )
     
     def add_knowledge_base(self, knowledge_items: List[Dict[str, Any]]):
-        """Add knowledge base items to the database"""
-        for idx, item in enumerate(knowledge_items):
-            content = f"{item['topic']}: {item['content']}"
-            self.knowledge_base.add(
-                documents=[content],
-                ids=[f"kb_{idx}"],
-                metadatas={
-                    "topic": item["topic"],
-                    "content": item["content"],
-                    "category": item["category"],
-                    "keywords": ",".join(item["keywords"])
-                }
-            )
+        """Add knowledge base items to the database (batched add)"""
+        if not knowledge_items:
+            return
+        
+        self._add_in_batches(
+            self.knowledge_base,
+            documents=[f"{item['topic']}: {item['content']}" for item in knowledge_items],
+            ids=[f"kb_{idx}" for idx in range(len(knowledge_items))],
+            metadatas=[{
+                "topic": item["topic"],
+                "content": item["content"],
+                "category": item["category"],
+                **self._keyword_metadata(item["keywords"])
+            } for item in knowledge_items]
+        )
     
-    def search_faqs(self, query: str, limit: int = 3) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _hit_rows(results: Dict[str, Any], fields: Tuple[str, ...]) -> List[Dict[str, Any]]:
+        """Turn the column lists of a single-query result into rows of the given metadata fields"""
+        return [
+            {**{field: (metadata or {}).get(field, "") for field in fields}, "relevance_score": distance}
+            for metadata, distance in zip(results['metadatas'][0], results['distances'][0])
+        ]
+    
+    def search_faqs(self, query: str, limit: int = 3,
+                    query_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
         """Search FAQs based on query"""
         try:
-            results = self.faqs.query(
-                query_texts=[query],
-                n_results=limit
-            )
-            
-            faqs = []
-            if results['documents'] and results['documents'][0]:
-                for i, doc in enumerate(results['documents'][0]):
-                    metadata = results['metadatas'][0][i] if results['metadatas'] else {}
-                    faqs.append({
-                        "question": metadata.get("question", ""),
-                        "answer": metadata.get("answer", ""),
-                        "category": metadata.get("category", ""),
-                        "relevance_score": results['distances'][0][i] if results.get('distances') else 0
-                    })
-            return faqs
+            results = self._static_query(self.faqs, [query], limit, query_embedding)
+            return self._hit_rows(results, ("question", "answer", "category"))
         except Exception as e:
-            print(f"Error searching FAQs: {e}")
+            logger.error("Error searching FAQs: %s", e)
             return []
     
-    def search_knowledge_base(self, query: str, limit: int = 3) -> List[Dict[str, Any]]:
+    def search_knowledge_base(self, query: str, limit: int = 3,
+                              query_embedding: Optional[List[float]] = None) -> List[Dict[str, Any]]:
         """Search knowledge base based on query"""
         try:
-            results = self.knowledge_base.query(
-                query_texts=[query],
-                n_results=limit
-            )
-            
-            knowledge_items = []
-            if results['documents'] and results['documents'][0]:
-                for i, doc in enumerate(results['documents'][0]):
-                    metadata = results['metadatas'][0][i] if results['metadatas'] else {}
-                    knowledge_items.append({
-                        "topic": metadata.get("topic", ""),
-                        "content": metadata.get("content", ""),
-                        "category": metadata.get("category", ""),
-                        "relevance_score": results['distances'][0][i] if results.get('distances') else 0
-                    })
-            return knowledge_items
+            results = self._static_query(self.knowledge_base, [query], limit, query_embedding)
+            return self._hit_rows(results, ("topic", "content", "category"))
         except Exception as e:
-            print(f"Error searching knowledge base: {e}")
+            logger.error("Error searching knowledge base: %s", e)
             return []
     
+    def _buffer_write(self, collection, doc_id: str, document: str, metadata: Dict[str, Any]):
+        """Queue a single-document upsert; the writer thread flushes it in a batch"""
+        with self._pending_lock:
+            if self._writer_thread is None:
+                self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+                self._writer_thread.start()
+                # Write whatever is still buffered before the process exits
+                atexit.register(self.flush)
+            _, records = self._pending_writes.setdefault(collection.name, (collection, {}))
+            # Same id twice in one batch fails the whole write - the latest version wins, as with upsert
+            records[doc_id] = (document, metadata)
+            buffered = len(records)
+        
+        if buffered >= self.WRITE_BATCH_SIZE:
+            self._flush_event.set()
+    
+    def _writer_loop(self):
+        """Flush buffered writes every WRITE_FLUSH_INTERVAL seconds, or sooner when a batch fills"""
+        while True:
+            self._flush_event.wait(timeout=self.WRITE_FLUSH_INTERVAL)
+            self._flush_event.clear()
+            self.flush()
+            if time.time() - self._turns_pruned_at >= self.CONVERSATION_TURN_PRUNE_INTERVAL:
+                self._turns_pruned_at = time.time()
+                self.prune_conversation_turns()
+    
+    def flush(self):
+        """Write all buffered documents now (one batched upsert per collection)"""
+        with self._flush_lock:
+            with self._pending_lock:
+                pending, self._pending_writes = self._pending_writes, {}
+                self._flushing_writes = {name: records for name, (_, records) in pending.items()}
+            
+            for name, (collection, records) in pending.items():
+                try:
+                    self._add_in_batches(
+                        collection,
+                        documents=[document for document, _ in records.values()],
+                        ids=list(records),
+                        metadatas=[metadata for _, metadata in records.values()],
+                        upsert=True
+                    )
+                except Exception as e:
+                    logger.error("Error writing buffered documents to %s: %s", name, e)
+            
+            with self._pending_lock:
+                self._flushing_writes = {}
+    
+    def _buffered_documents(self, collection_name: str,
+                            where: Dict[str, Any]) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+        """Buffered (or being flushed) documents of a collection whose metadata matches every key of where"""
+        with self._pending_lock:
+            sources = (
+                self._flushing_writes.get(collection_name, {}),
+                self._pending_writes.get(collection_name, (None, {}))[1],  # newest version wins
+            )
+            return {
+                doc_id: (document, metadata)
+                for records in sources
+                for doc_id, (document, metadata) in records.items()
+                if all(metadata.get(key) == value for key, value in where.items())
+            }
+
     def add_conversation_summary(self, user_id: str, conversation_id: str, 
                                   summary: str, metadata: Dict = None) -> str:
-        """Add conversation summary to database"""
+        """Add conversation summary to database (buffered, written in batches)"""
+        now_ns = time.time_ns()
+        # Nanosecond suffix: two summaries in the same second must not share an id
+        doc_id = f"{user_id}_{conversation_id}_{now_ns}"
+        full_metadata = {
+            "user_id": user_id,
+            "conversation_id": conversation_id,
+            "timestamp": now_ns / 1e9,
+            "type": "conversation_summary"
+        }
+        if metadata:
+            full_metadata.update(metadata)
+        
+        self._buffer_write(self.conversation_summaries, doc_id, summary, full_metadata)
+        return doc_id
+
+    def get_conversation_summaries(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get the most recent conversation summaries for a user (metadata filter, no embedding)"""
+        self.flush()
         try:
-            doc_id = f"{user_id}_{conversation_id}_{int(time.time())}"
-            full_metadata = {
-                "user_id": user_id,
-                "conversation_id": conversation_id,
-                "timestamp": datetime.datetime.now().isoformat(),
-                "type": "conversation_summary"
-            }
-            if metadata:
-                full_metadata.update(metadata)
+            # Rank by timestamp on metadata only, then load the documents of the top `limit`
+            results = self.conversation_summaries.get(
+                where={"user_id": user_id},
+                include=["metadatas"]
+            )
+            ranked = sorted(
+                zip(results['ids'], results['metadatas'] or []),
+                key=lambda item: _epoch_seconds(item[1].get("timestamp", 0)),
+                reverse=True
+            )[:limit]
+            if not ranked:
+                return []
             
-            self.conversation_summaries.add(
-                documents=[summary],
-                metadatas=[full_metadata],
-                ids=[doc_id]
+            documents = self.conversation_summaries.get(
+                ids=[doc_id for doc_id, _ in ranked],
+                include=["documents"]
             )
-            return doc_id
+            doc_by_id = dict(zip(documents['ids'], documents['documents']))
+            
+            return [
+                {
+                    "summary": doc_by_id.get(doc_id, ""),
+                    "conversation_id": metadata.get("conversation_id", ""),
+                    "timestamp": _iso_timestamp(metadata["timestamp"]) if "timestamp" in metadata else "",
+                    "metadata": metadata
+                }
+                for doc_id, metadata in ranked
+            ]
         except Exception as e:
-            print(f"Error adding conversation summary: {e}")
-            return ""
+            logger.error("Error getting conversation summaries: %s", e)
+            return []
 
-    def get_conversation_summaries(self, user_id: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Get conversation summaries for a user"""
+    def add_cached_response(self, doc_id: str, user_input: str, response_json: str,
+                            namespace: str, expires_at: float):
+        """Cache a response under the embedding of user_input (buffered, written in batches)"""
+        self._buffer_write(self.response_cache, doc_id, user_input, {
+            "response_json": response_json,
+            "namespace": namespace,
+            "expires_at": expires_at
+        })
+
+    def search_cached_response(self, query_embedding: List[float], namespace: str) -> Optional[Tuple[float, str]]:
+        """Closest unexpired cached response as (distance, response_json), or None"""
         try:
-            results = self.conversation_summaries.query(
-                query_texts=[f"user summaries for {user_id}"],
-                where={"user_id": user_id},
-                n_results=limit
+            if not self._collection_count(self.response_cache):
+                return None
+            results = self.response_cache.query(
+                query_embeddings=[query_embedding],
+                n_results=1,
+                where={"$and": [{"namespace": namespace}, {"expires_at": {"$gt": time.time()}}]},
+                include=["metadatas", "distances"]
+            )
+            if not results['ids'] or not results['ids'][0]:
+                return None
+            return results['distances'][0][0], results['metadatas'][0][0]["response_json"]
+        except Exception as e:
+            logger.error("Error searching response cache: %s", e)
+            return None
+
+    def prune_response_cache(self) -> int:
+        """Delete expired cached responses; returns how many were removed"""
+        try:
+            expired = self.response_cache.get(where={"expires_at": {"$lte": time.time()}}, include=[])
+            if expired['ids']:
+                self.response_cache.delete(ids=expired['ids'])
+                self._invalidate_count(self.response_cache.name)
+            return len(expired['ids'])
+        except Exception as e:
+            logger.error("Error pruning response cache: %s", e)
+            return 0
+
+    def add_conversation_turn(self, session_id: str, turn_index: int, content: str) -> str:
+        """Store a single user turn for later relevant-history retrieval (buffered, written in batches)"""
+        doc_id = f"{session_id}_turn_{turn_index}"
+        self._buffer_write(self.conversation_turns, doc_id, content, {
+            "session_id": session_id,
+            "turn_index": turn_index,
+            "timestamp": time.time()
+        })
+        return doc_id
+
+    def delete_conversation_turns(self, session_id: str):
+        """Delete every stored turn of a session (called when the conversation is cleared)"""
+        name = self.conversation_turns.name
+        # Turns still buffered are simply dropped - no need to write them first
+        with self._pending_lock:
+            _, records = self._pending_writes.get(name, (None, {}))
+            for doc_id in [doc_id for doc_id, (_, metadata) in records.items()
+                           if metadata.get("session_id") == session_id]:
+                del records[doc_id]
+        try:
+            # Under the flush lock: a flush already writing some of them would bring them back
+            with self._flush_lock:
+                self.conversation_turns.delete(where={"session_id": session_id})
+            self._invalidate_count(name)
+        except Exception as e:
+            logger.error("Error deleting conversation turns: %s", e)
+
+    def prune_conversation_turns(self) -> int:
+        """Delete turns older than CONVERSATION_TURN_TTL; returns how many were removed"""
+        try:
+            expired = self.conversation_turns.get(
+                where={"timestamp": {"$lt": time.time() - self.CONVERSATION_TURN_TTL}},
+                include=[]
+            )
+            if expired['ids']:
+                self.conversation_turns.delete(ids=expired['ids'])
+                self._invalidate_count(self.conversation_turns.name)
+            return len(expired['ids'])
+        except Exception as e:
+            logger.error("Error pruning conversation turns: %s", e)
+            return 0
+
+    def search_conversation_turns(self, session_id: str, query: str, limit: int = 8) -> List[Dict[str, Any]]:
+        """Get the most relevant prior user turns of a session for the given query"""
+        try:
+            query_embedding = self.embed_query(query)
+            results = self.conversation_turns.query(
+                query_embeddings=[query_embedding],
+                where={"session_id": session_id},
+                n_results=limit,
+                include=["documents", "metadatas", "distances"]
             )
+            turns = {
+                doc_id: (doc, metadata, distance)
+                for doc_id, doc, metadata, distance in zip(
+                    results['ids'][0], results['documents'][0], results['metadatas'][0], results['distances'][0]
+                )
+            }
             
-            summaries = []
-            if results['documents'] and results['documents'][0]:
-                for i, doc in enumerate(results['documents'][0]):
-                    metadata = results['metadatas'][0][i] if results['metadatas'] else {}
-                    summaries.append({
-                        "summary": doc,
-                        "conversation_id": metadata.get("conversation_id", ""),
-                        "timestamp": metadata.get("timestamp", ""),
-                        "metadata": metadata
-                    })
-            return summaries
+            # Turns are written behind: score this session's still-buffered ones directly
+            # instead of flushing every session's writes on the request path
+            buffered = self._buffered_documents(self.conversation_turns.name, {"session_id": session_id})
+            if buffered:
+                doc_ids = list(buffered)
+                vectors = np.asarray(self.embedding_fn([buffered[doc_id][0] for doc_id in doc_ids]), dtype=np.float32)
+                # Same distance as the collection's "ip" space
+                distances = 1.0 - vectors @ np.asarray(query_embedding, dtype=np.float32)
+                for doc_id, distance in zip(doc_ids, distances):
+                    turns[doc_id] = (*buffered[doc_id], float(distance))
+            
+            return [
+                {
+                    "turn_index": (metadata or {}).get("turn_index", 0),
+                    "content": doc,
+                    "relevance_score": distance
+                }
+                for doc, metadata, distance in sorted(turns.values(), key=lambda turn: turn[2])[:limit]
+            ]
         except Exception as e:
-            print(f"Error getting conversation summaries: {e}")
+            logger.error("Error searching conversation turns: %s", e)
             return []
 
     def add_expense_example(self, example_id: str, description: str, amount: float,
                            category: str, status: str, reason: str, documents: list) -> str:
-        """Add expense example to database"""
+        """Add expense example to database (buffered, written in batches)"""
         try:
             content = f"{description} - {status}: {reason}"
             metadata = {
@@ -303,53 +806,70 @@ class ExpenseDB:
                 "status": status,
                 "reason": reason,
                 "documents": ",".join(documents),
-                "timestamp": datetime.datetime.now().isoformat()
+                "timestamp": time.time()
             }
             
-            self.expense_examples.add(
-                documents=[content],
-                metadatas=[metadata],
-                ids=[example_id]
-            )
+            self._buffer_write(self.expense_examples, example_id, content, metadata)
             return example_id
         except Exception as e:
-            print(f"Error adding expense example: {e}")
+            logger.error("Error adding expense example: %s", e)
             return ""
 
     def add_knowledge_item(self, topic: str, content: str, category: str, tags: list) -> str:
         """Add knowledge base item"""
         try:
+            now_ns = time.time_ns()
             full_content = f"{topic}: {content}"
             metadata = {
                 "topic": topic,
                 "content": content,
                 "category": category,
                 "tags": ",".join(tags),
-                "timestamp": datetime.datetime.now().isoformat()
+                "timestamp": now_ns / 1e9
             }
             
-            doc_id = f"kb_{topic.replace(' ', '_')}_{int(time.time())}"
+            # Nanosecond suffix: two items on one topic in the same second must not share an id
+            doc_id = f"kb_{topic.replace(' ', '_')}_{now_ns}"
             self.knowledge_base.add(
                 documents=[full_content],
                 metadatas=[metadata],
                 ids=[doc_id]
             )
+            self._invalidate_count(self.knowledge_base.name)
             return doc_id
         except Exception as e:
-            print(f"Error adding knowledge item: {e}")
+            logger.error("Error adding knowledge item: %s", e)
             return ""
 
     def comprehensive_search(self, query: str, limit_per_source: int = 2) -> Dict[str, Any]:
-        """Search across all collections for comprehensive results"""
+        """Search across all collections for comprehensive results (query embedded once)"""
+        # The embedding model is uncased, so case and spacing variants share one entry
+        key = (re.sub(r"\s+", " ", query.strip().lower()), limit_per_source)
+        generations = tuple(
+            self._count_generation.get(name, 0)
+            for name in (self.expense_policies.name, self.faqs.name, self.knowledge_base.name)
+        )
+        with self._search_cache_lock:
+            entry = self._search_cache.get(key)
+            if entry is not None and entry[1] == generations and time.time() - entry[0] < self.SEARCH_CACHE_TTL:
+                self._search_cache.move_to_end(key)
+                # Callers add their own keys to the result, so hand out a copy
+                return {**copy.deepcopy(entry[2]), "query": query}
+        
         try:
-            return {
-                "policies": self.search_policies(query, limit_per_source),
-                "faqs": self.search_faqs(query, limit_per_source),
-                "knowledge_base": self.search_knowledge_base(query, limit_per_source),
-                "query": query
+            query_embedding = self.embed_query(query)
+            # The three ANN lookups are independent and run in parallel
+            futures = {
+                name: _SEARCH_EXECUTOR.submit(search, query, limit_per_source, query_embedding=query_embedding)
+                for name, search in (
+                    ("policies", self.search_policies),
+                    ("faqs", self.search_faqs),
+                    ("knowledge_base", self.search_knowledge_base),
+                )
             }
+            results = {name: future.result() for name, future in futures.items()}
         except Exception as e:
-            print(f"Error in comprehensive search: {e}")
+            logger.error("Error in comprehensive search: %s", e)
             return {
                 "policies": [],
                 "faqs": [],
@@ -357,14 +877,26 @@ class ExpenseDB:
                 "query": query,
                 "error": str(e)
             }
+        
+        with self._search_cache_lock:
+            self._search_cache[key] = (time.time(), generations, copy.deepcopy(results))
+            self._search_cache.move_to_end(key)
+            while len(self._search_cache) > self.SEARCH_CACHE_SIZE:
+                self._search_cache.popitem(last=False)
+        return {**results, "query": query}
     
     def system_health_check(self) -> Dict[str, Any]:
         """
         🏥 Comprehensive system health check
         
         Returns:
-            Dictionary with system health status and metrics
+            Dictionary with system health status and metrics (cached for HEALTH_CHECK_TTL seconds)
         """
+        checked_at, cached_status = self._health_cache
+        if cached_status is not None and time.time() - checked_at < self.HEALTH_CHECK_TTL:
+            # Callers add their own keys to the result, so hand out a copy
+            return copy.deepcopy(cached_status)
+        
         health_status = {
             "timestamp": datetime.datetime.now().isoformat(),
             "database_connection": False,
@@ -389,36 +921,49 @@ class ExpenseDB:
                 ("conversation_summaries", self.conversation_summaries, "User conversation history")
             ]
             
-            total_docs = 0
-            for name, collection, description in collections:
+            # Embed the probe query once for all collections
+            test_embedding = self.embed_query("test")
+            
+            def probe(entry: Tuple[str, Any, str]) -> Tuple[int, Union[float, Exception]]:
+                """(document count, search time in ms) of one collection, or (0, error)"""
+                _, collection, _ = entry
                 try:
-                    count = collection.count()
-                    total_docs += count
+                    count = self._collection_count(collection)
                     
                     # Test search performance
                     start_time = time.time()
-                    test_result = collection.query(query_texts=["test"], n_results=1)
-                    search_time = (time.time() - start_time) * 1000
-                    
-                    health_status["collections"][name] = {
-                        "document_count": count,
-                        "description": description,
-                        "search_time_ms": round(search_time, 2),
-                        "status": "healthy" if count > 0 else "empty"
-                    }
-                    
-                    # Add recommendations for empty collections
-                    if count == 0:
-                        health_status["recommendations"].append(
-                            f"📈 {name}: Consider adding documents to improve RAG effectiveness"
-                        )
-                    
+                    collection.query(query_embeddings=[test_embedding], n_results=1)
+                    return count, (time.time() - start_time) * 1000
                 except Exception as e:
+                    return 0, e
+            
+            # The probes are independent: run them side by side, report in the listed order
+            with ThreadPoolExecutor(max_workers=len(collections)) as executor:
+                probes = list(executor.map(probe, collections))
+            
+            total_docs = 0
+            for (name, _, description), (count, result) in zip(collections, probes):
+                if isinstance(result, Exception):
                     health_status["collections"][name] = {
                         "status": "error",
-                        "error": str(e)
+                        "error": str(result)
                     }
-                    health_status["issues"].append(f"❌ {name}: {str(e)}")
+                    health_status["issues"].append(f"❌ {name}: {str(result)}")
+                    continue
+                
+                total_docs += count
+                health_status["collections"][name] = {
+                    "document_count": count,
+                    "description": description,
+                    "search_time_ms": round(result, 2),
+                    "status": "healthy" if count > 0 else "empty"
+                }
+                
+                # Add recommendations for empty collections
+                if count == 0:
+                    health_status["recommendations"].append(
+                        f"📈 {name}: Consider adding documents to improve RAG effectiveness"
+                    )
             
             health_status["total_documents"] = total_docs
             
@@ -443,7 +988,8 @@ class ExpenseDB:
             health_status["overall_status"] = "error"
             health_status["issues"].append(f"❌ Database connection error: {str(e)}")
         
-        return health_status
+        self._health_cache = (time.time(), health_status)
+        return copy.deepcopy(health_status)
     
     def get_system_stats(self) -> Dict[str, Any]:
         """
@@ -471,7 +1017,7 @@ class ExpenseDB:
             
             for name, collection in collections:
                 try:
-                    count = collection.count()
+                    count = self._collection_count(collection)
                     stats["collections"][name] = count
                     stats["total_documents"] += count
                 except Exception as e:
@@ -487,7 +1033,7 @@ class ExpenseDB:
         """Save user data to ChromaDB for persistence"""
         try:
             # Convert user data to JSON string for storage
-            user_json = json.dumps(user_data, ensure_ascii=False, default=str)
+            user_json = _json_dumps(user_data)
             
             # Save to user_expenses collection
             self.user_expenses.upsert(
@@ -496,69 +1042,81 @@ class ExpenseDB:
                 metadatas=[{
                     "account": account,
                     "type": "user_data",
-                    "updated_at": datetime.datetime.now().isoformat(),
-                    "expense_count": len(user_data.get("expenses", [])),
-                    "session_count": len(user_data.get("sessions", {}))
+                    "updated_at": time.time(),
+                    "expense_count": len(user_data.get("expenses", ())),
+                    "session_count": len(user_data.get("sessions", ()))
                 }]
             )
+            self._invalidate_count(self.user_expenses.name)
+            self._cache_record(f"user_{account}", user_json)
             
-            print(f"💾 User data saved to ChromaDB: {account}")
+            logger.debug("💾 User data saved to ChromaDB: %s", account)
             return True
             
         except Exception as e:
-            print(f"❌ Error saving user data to ChromaDB: {str(e)}")
+            logger.error("❌ Error saving user data to ChromaDB: %s", e)
             return False
     
     def load_user_data(self, account: str) -> Optional[Dict[str, Any]]:
-        """Load user data from ChromaDB"""
+        """Load user data from ChromaDB (served from memory if saved/loaded recently)"""
         try:
+            cached_json = self._cached_record(f"user_{account}")
+            if cached_json is not None:
+                return _json_loads(cached_json)
+            
             # Query user data from ChromaDB
             results = self.user_expenses.get(
                 ids=[f"user_{account}"],
-                include=["documents", "metadatas"]
+                include=["documents"]
             )
             
             if results["ids"] and len(results["ids"]) > 0:
                 user_json = results["documents"][0]
-                user_data = json.loads(user_json)
-                print(f"🔄 User data loaded from ChromaDB: {account}")
+                user_data = _json_loads(user_json)
+                self._cache_record(f"user_{account}", user_json)
+                logger.debug("🔄 User data loaded from ChromaDB: %s", account)
                 return user_data
             else:
-                print(f"📝 No data found for user: {account}")
+                logger.debug("📝 No data found for user: %s", account)
                 return None
                 
         except Exception as e:
-            print(f"❌ Error loading user data from ChromaDB: {str(e)}")
+            logger.error("❌ Error loading user data from ChromaDB: %s", e)
             return None
     
-    def load_all_users(self) -> Dict[str, Dict[str, Any]]:
-        """Load all user data from ChromaDB"""
-        try:
-            # Get all user data
+    def iter_all_users(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield (account, user_data) for every stored user, reading USER_PAGE_SIZE documents at a time"""
+        offset = 0
+        while True:
             results = self.user_expenses.get(
-                include=["documents", "metadatas"]
+                include=["documents"],
+                limit=self.USER_PAGE_SIZE,
+                offset=offset
             )
-            
-            all_users = {}
-            for i, doc_id in enumerate(results["ids"]):
+            for doc_id, user_json in zip(results["ids"], results["documents"]):
                 if doc_id.startswith("user_"):
-                    account = doc_id.replace("user_", "")
-                    user_json = results["documents"][i]
-                    user_data = json.loads(user_json)
-                    all_users[account] = user_data
+                    yield doc_id[len("user_"):], _json_loads(user_json)
             
-            print(f"🔄 Loaded {len(all_users)} users from ChromaDB")
+            if len(results["ids"]) < self.USER_PAGE_SIZE:
+                return
+            offset += self.USER_PAGE_SIZE
+    
+    def load_all_users(self) -> Dict[str, Dict[str, Any]]:
+        """Load all user data from ChromaDB"""
+        try:
+            all_users = dict(self.iter_all_users())
+            logger.info("🔄 Loaded %d users from ChromaDB", len(all_users))
             return all_users
             
         except Exception as e:
-            print(f"❌ Error loading all users from ChromaDB: {str(e)}")
+            logger.error("❌ Error loading all users from ChromaDB: %s", e)
             return {}
     
     def save_guest_session(self, session_id: str, session_data: Dict[str, Any]) -> bool:
         """Save guest session data to ChromaDB"""
         try:
             # Convert session data to JSON string
-            session_json = json.dumps(session_data, ensure_ascii=False, default=str)
+            session_json = _json_dumps(session_data)
             
             # Save to user_sessions collection
             self.user_sessions.upsert(
@@ -567,34 +1125,96 @@ class ExpenseDB:
                 metadatas=[{
                     "session_id": session_id,
                     "type": "guest_session",
-                    "updated_at": datetime.datetime.now().isoformat(),
-                    "expense_count": len(session_data.get("expenses", []))
+                    "updated_at": time.time(),
+                    "expense_count": len(session_data.get("expenses", ()))
                 }]
             )
+            self._invalidate_count(self.user_sessions.name)
+            self._cache_record(f"guest_{session_id}", session_json)
             
-            print(f"💾 Guest session saved to ChromaDB: {session_id}")
+            logger.debug("💾 Guest session saved to ChromaDB: %s", session_id)
             return True
             
         except Exception as e:
-            print(f"❌ Error saving guest session to ChromaDB: {str(e)}")
+            logger.error("❌ Error saving guest session to ChromaDB: %s", e)
             return False
     
     def load_guest_session(self, session_id: str) -> Optional[Dict[str, Any]]:
-        """Load guest session data from ChromaDB"""
+        """Load guest session data from ChromaDB (served from memory if saved/loaded recently)"""
         try:
+            cached_json = self._cached_record(f"guest_{session_id}")
+            if cached_json is not None:
+                return _json_loads(cached_json)
+            
             results = self.user_sessions.get(
                 ids=[f"guest_{session_id}"],
-                include=["documents", "metadatas"]
+                include=["documents"]
             )
             
             if results["ids"] and len(results["ids"]) > 0:
                 session_json = results["documents"][0]
-                session_data = json.loads(session_json)
-                print(f"🔄 Guest session loaded from ChromaDB: {session_id}")
+                session_data = _json_loads(session_json)
+                self._cache_record(f"guest_{session_id}", session_json)
+                logger.debug("🔄 Guest session loaded from ChromaDB: %s", session_id)
                 return session_data
             else:
                 return None
                 
         except Exception as e:
-            print(f"❌ Error loading guest session from ChromaDB: {str(e)}")
-            return None
\ No newline at end of file
+            logger.error("❌ Error loading guest session from ChromaDB: %s", e)
+            return None
+
+
+# Embedding function dùng chung - model chỉ nạp một lần cho cả process
+_embedding_fn = None
+_embedding_fn_lock = threading.Lock()
+
+def get_embedding_function() -> EmbeddingCache:
+    """
+    Lấy embedding function dùng chung (singleton), tạo và warm up ở lần gọi đầu tiên
+    
+    Cùng model all-MiniLM-L6-v2 ONNX như mặc định của ChromaDB (không cần API key),
+    chạy với session tối ưu; bọc bởi EmbeddingCache để mỗi văn bản chỉ phải embed một lần
+    
+    Returns:
+        EmbeddingCache instance
+    """
+    global _embedding_fn
+    
+    if _embedding_fn is None:
+        with _embedding_fn_lock:
+            if _embedding_fn is None:
+                # FastONNXMiniLM already returns L2-normalized vectors (needed by the "ip" space)
+                embedding_fn = EmbeddingCache(FastONNXMiniLM())
+                
+                # Load the ONNX session/tokenizer now instead of inside the first user search.
+                # Call the model itself: after the first run a cached "warmup" vector would skip it
+                try:
+                    embedding_fn.embedding_fn(["warmup"])
+                except Exception as e:
+                    logger.warning("Could not warm up embedding model: %s", e)
+                
+                _embedding_fn = embedding_fn
+    
+    return _embedding_fn
+
+
+# Global instance - mở ChromaDB và các collections một lần cho cả process
+_expense_db = None
+_expense_db_lock = threading.Lock()
+
+def get_expense_db() -> ExpenseDB:
+    """
+    Lấy ExpenseDB dùng chung (singleton), tạo ở lần gọi đầu tiên
+    
+    Returns:
+        ExpenseDB instance
+    """
+    global _expense_db
+    
+    if _expense_db is None:
+        with _expense_db_lock:
+            if _expense_db is None:
+                _expense_db = ExpenseDB()
+    
+    return _expense_db
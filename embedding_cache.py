@@ -0,0 +1,114 @@
+"""
+🧬 EMBEDDING CACHE - Cache vector embedding theo nội dung văn bản
+==================================================================
+
+Bọc embedding function của ChromaDB để mỗi đoạn văn bản chỉ được embed một lần:
+- Key là sha256 của văn bản, value là vector float32
+- Tầng 1: dict LRU trong bộ nhớ, tầng 2: SQLite trên đĩa (dùng lại giữa các lần chạy)
+- Chỉ các văn bản chưa có trong cache được gửi xuống embedding function gốc,
+  trong một lần gọi batch duy nhất, rồi ghép lại đúng thứ tự ban đầu
+- Áp dụng cho cả documents khi add và query_texts khi search
+- Tùy chọn chuẩn hóa L2 vector (một phép NumPy cho cả lô) để collection dùng
+  inner product thay cho cosine
+"""
+
+import os
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+
+class EmbeddingCache(EmbeddingFunction[Documents]):
+    """
+    🗄️ Embedding function có cache, dùng thay trực tiếp cho embedding function gốc
+    """
+
+    # Số key tối đa trong một câu SELECT ... IN (...) (giới hạn biến của SQLite)
+    SQL_BATCH_SIZE = 500
+
+    def __init__(self, embedding_fn: EmbeddingFunction, path: str = "./data/embedding_cache.sqlite3",
+                 max_memory_entries: int = 4096, normalize: bool = False):
+        """
+        Khởi tạo embedding cache
+
+        Args:
+            embedding_fn: Embedding function gốc (vd: DefaultEmbeddingFunction)
+            path: Đường dẫn file SQLite lưu vector
+            max_memory_entries: Số vector tối đa giữ trong bộ nhớ
+            normalize: Chuẩn hóa L2 vector mới embed trước khi lưu cache
+        """
+        self.embedding_fn = embedding_fn
+        self.normalize = normalize
+        self.max_memory_entries = max_memory_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: List[float]):
+        """Đưa vector vào tầng bộ nhớ, loại entry LRU nếu vượt giới hạn."""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def __call__(self, input: Documents) -> Embeddings:
+        keys = [self._key(text) for text in input]
+        vectors: Dict[str, List[float]] = {}
+
+        with self._lock:
+            # Tầng 1: bộ nhớ
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    vectors[key] = self._memory[key]
+
+            # Tầng 2: SQLite, truy vấn các key còn thiếu theo từng lô
+            missing = list({key for key in keys if key not in vectors})
+            for start in range(0, len(missing), self.SQL_BATCH_SIZE):
+                chunk = missing[start:start + self.SQL_BATCH_SIZE]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    vectors[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+                    self._remember(key, vectors[key])
+
+        # Chỉ embed các văn bản chưa có (mỗi nội dung một lần) trong một lần gọi batch
+        miss_texts = {}
+        for key, text in zip(keys, input):
+            if key not in vectors:
+                miss_texts.setdefault(key, text)
+
+        self.hits += len(keys) - len(miss_texts)
+        self.misses += len(miss_texts)
+
+        if miss_texts:
+            embeddings = np.asarray(self.embedding_fn(list(miss_texts.values())), dtype=np.float32)
+            if self.normalize:
+                embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-12
+            rows = []
+            with self._lock:
+                for key, vector in zip(miss_texts, embeddings):
+                    vectors[key] = vector.tolist()
+                    self._remember(key, vectors[key])
+                    rows.append((key, vector.tobytes()))
+                self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+                self._conn.commit()
+
+        return [vectors[key] for key in keys]
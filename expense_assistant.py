@@ -6,34 +6,88 @@ gọi hàm và khả năng hướng dẫn chính sách.
 
 import os
 import json
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import warnings
 import pandas as pd
+from collections import deque
+from functools import lru_cache
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Generator, Optional, Tuple
 import re
+from types import SimpleNamespace
+import httpx
+import tiktoken
 from dotenv import load_dotenv
-from openai import OpenAI
-from database import ExpenseDB
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient, RateLimitError
+from openai.types.chat import ChatCompletion, ChatCompletionMessage, ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+from database import get_expense_db
+from functions import (
+    EXPENSE_POLICIES, FUNCTION_SCHEMAS, execute_function_call,
+    calculate_reimbursement_columns, validate_expense_batch, format_expense_summary
+)
+from conversation_cache import ConversationCache
+from completion_cache import CompletionCache
+from semantic_cache import SemanticCache
 
-# Load environment variables
-load_dotenv()
+# ⚡ orjson (tùy chọn) cho tham số/kết quả tool call và dòng JSONL của Batch API
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
-class ExpenseAssistant:
+if ORJSON_AVAILABLE:
+    def _json_dumps(value: Any, default=str) -> str:
+        """Serialize bằng orjson (UTF-8, giữ nguyên ký tự tiếng Việt)."""
+        return orjson.dumps(value, default=default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY).decode()
+    _json_loads = orjson.loads
+else:
+    def _json_dumps(value: Any, default=str) -> str:
+        return json.dumps(value, ensure_ascii=False, default=default)
+    _json_loads = json.loads
+
+
+def _request_jsonable(value: Any) -> Any:
     """
-    Trợ lý báo cáo chi phí được hỗ trợ AI với quản lý hội thoại,
-    gọi hàm và khả năng hướng dẫn chính sách.
+    default= khi serialize request gửi lên API: object pydantic của SDK (vd: tool_calls
+    trong history) thành dict, kiểu khác báo lỗi ngay thay vì thành chuỗi repr.
     """
-    
-    def __init__(self, client, model="GPT-4o-mini"):
-        self.client = client
-        self.model = model
-        self.conversation_history = []
-        self.user_context = {}  # Store user-specific context
-        
-        # Initialize ChromaDB connection
-        self.db = ExpenseDB()
-        
-        # System prompt với ví dụ few-shot và chính sách công ty
-        self.system_prompt = """Bạn là Trợ Lý Thông Minh của công ty, được trang bị ChromaDB knowledge base để hỗ trợ nhân viên toàn diện. 
+    if hasattr(value, "model_dump"):
+        return value.model_dump()
+    raise TypeError(f"Không serialize được {type(value).__name__} vào request")
+
+# Load environment variables
+load_dotenv()
+
+
+def _get_encoding(model: str):
+    """Lấy tokenizer cho model, fallback về o200k_base (họ GPT-4o) nếu tên model lạ."""
+    try:
+        return tiktoken.encoding_for_model(model.lower())
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def _format_policy_appendix(policies: Dict[str, List[str]]) -> str:
+    """Ghép toàn bộ EXPENSE_POLICIES thành một khối văn bản cố định theo thứ tự khai báo."""
+    lines = ["CHÍNH SÁCH CHI PHÍ CHI TIẾT:"]
+    for category, rules in policies.items():
+        lines.append(f"[{category}]")
+        lines.extend(f"- {rule}" for rule in rules)
+    return "\n".join(lines)
+
+
+# System prompt với ví dụ few-shot và chính sách công ty.
+# Được dựng một lần và giống hệt nhau byte-by-byte ở mọi request để OpenAI
+# prompt caching tái sử dụng prefix (system + tools). Phần chính sách chi tiết
+# đẩy prefix vượt ngưỡng 1024 tokens tối thiểu của cache. Không chèn dữ liệu
+# theo request (thời gian, user ID...) vào đây - đưa chúng vào tin nhắn user.
+SYSTEM_PROMPT = """Bạn là Trợ Lý Thông Minh của công ty, được trang bị ChromaDB knowledge base để hỗ trợ nhân viên toàn diện. 
 
 VAI TRÒ CHÍNH:
 1. 💰 Trợ lý báo cáo chi phí chuyên nghiệp
@@ -94,10 +148,145 @@ VÍ DỤ TƯƠNG TÁC:
 👤 "Chi phí ăn trưa 850.000 VNĐ có được hoàn không?"
 🤖 "🍽️ Chi phí 850.000 VNĐ nằm trong giới hạn 1.000.000 VNĐ/ngày! ✅ Hoàn toàn có thể được hoàn trả. Bạn có hóa đơn chưa? 🧾"
 
-Hãy luôn tìm kiếm knowledge base để đưa ra câu trả lời chính xác nhất!"""
+Hãy luôn tìm kiếm knowledge base để đưa ra câu trả lời chính xác nhất!""" + "\n\n" + _format_policy_appendix(EXPENSE_POLICIES)
+
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+# Tokenizer và token ids của system prompt chỉ tính một lần khi import module
+_ENCODING = _get_encoding("gpt-4o-mini")
+SYSTEM_PROMPT_TOKENS = _ENCODING.encode(SYSTEM_PROMPT)
+
+# Đổi chính sách thì mọi completion đã cache đều hết hiệu lực
+_POLICIES_HASH = hashlib.sha256(
+    json.dumps(EXPENSE_POLICIES, ensure_ascii=False, sort_keys=True).encode("utf-8")
+).hexdigest()
+
+# Tham số sinh dùng chung cho mọi request chat có function calling
+_COMPLETION_PARAMS = {"tool_choice": "auto", "temperature": 0.7, "max_tokens": 1000}
+
+# FUNCTION_SCHEMAS không đổi lúc chạy: key của completion cache dùng digest tính sẵn
+# thay vì serialize lại cả danh sách schema ở mỗi request
+_TOOLS_HASH = hashlib.sha256(
+    json.dumps(FUNCTION_SCHEMAS, ensure_ascii=False, sort_keys=True).encode("utf-8")
+).hexdigest()
+
+# Trạng thái kết thúc của một job OpenAI Batch API
+_BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+# Số lần gửi lại một request batch bị 429, với exponential backoff giữa các lần
+_RATE_LIMIT_RETRIES = 4
+
+# Từ khóa kích hoạt tìm kiếm knowledge base cho các câu hỏi chính sách và tổng quát
+KNOWLEDGE_BASE_KEYWORDS = (
+    'chính sách', 'policy', 'quy định', 'giới hạn', 'limit',
+    'hóa đơn', 'receipt', 'yêu cầu', 'requirement', 'quy trình',
+    'hạn', 'deadline', 'nộp', 'submit', 'làm thế nào', 'how to',
+    'tôi có thể', 'can I', 'được không', 'phải', 'cần', 'need',
+    'hỗ trợ', 'support', 'giúp', 'help', 'thông tin', 'information'
+)
+# Một regex cho cả danh sách: quét user_input một lần thay vì một lần cho mỗi từ khóa
+_KB_KEYWORD_RE = re.compile("|".join(map(re.escape, KNOWLEDGE_BASE_KEYWORDS)), re.IGNORECASE)
+
+# Câu hỏi tra cứu có FAQ gần như trùng khớp được trả lời thẳng bằng câu trả lời của FAQ,
+# không gọi LLM. Bật bằng biến môi trường KB_DIRECT_ANSWER=true.
+KB_DIRECT_ANSWER = os.getenv("KB_DIRECT_ANSWER", "false").strip().lower() in ("1", "true", "yes")
+KB_DIRECT_MAX_DISTANCE = 0.15
+_FACTOID_RE = re.compile(r"giới hạn|bao nhiêu|có được|yêu cầu", re.IGNORECASE)
+
+
+@lru_cache(maxsize=1024)
+def _count_text_tokens(text: str) -> int:
+    """Đếm tokens của một đoạn text, nhớ kết quả cho các câu hỏi lặp lại (SAMPLE_USER_QUERIES...)."""
+    return len(_ENCODING.encode(text))
+
+
+def _cached_prompt_tokens(response) -> int:
+    """Số prompt tokens được phục vụ từ prompt cache của OpenAI (0 nếu API không trả về)."""
+    usage = getattr(response, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", None) or 0
+
+
+class AsyncRateLimiter:
+    """
+    Giới hạn số request song song và RPM/TPM cho các lời gọi AsyncOpenAI.
+    
+    Token của mỗi request được ước lượng trước khi gửi (kiểu ConcurrentOpenAI),
+    nên request chỉ được phát đi khi cửa sổ 60 giây còn đủ quota.
+    """
+    
+    def __init__(self, max_concurrent: int = 5, rpm: int = 200, tpm: int = 40000):
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.rpm = rpm
+        self.tpm = tpm
+        self._window = deque()  # (timestamp, tokens) của các request trong 60s gần nhất
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self, estimated_tokens: int):
+        """Chờ tới khi cửa sổ 60 giây còn đủ quota cho request sắp gửi."""
+        while True:
+            async with self._lock:
+                now = time.monotonic()
+                while self._window and now - self._window[0][0] >= 60:
+                    self._window.popleft()
+                
+                used_tokens = sum(tokens for _, tokens in self._window)
+                # Luôn cho phép request đầu tiên trong cửa sổ, kể cả khi nó lớn hơn TPM
+                if not self._window or (
+                    len(self._window) < self.rpm and used_tokens + estimated_tokens <= self.tpm
+                ):
+                    self._window.append((now, estimated_tokens))
+                    return
+                
+                wait_time = 60 - (now - self._window[0][0])
+            await asyncio.sleep(max(wait_time, 0.05))
+
+
+class ExpenseAssistant:
+    """
+    Trợ lý báo cáo chi phí được hỗ trợ AI với quản lý hội thoại,
+    gọi hàm và khả năng hướng dẫn chính sách.
+    """
+    
+    def __init__(self, client, model="GPT-4o-mini", max_history_tokens: int = 3000,
+                 relevant_history_k: int = 8, pretokenized_system: Optional[List[int]] = None,
+                 completion_cache: Optional[CompletionCache] = None,
+                 response_cache: Optional[SemanticCache] = None):
+        self.client = client
+        self.model = model
+        
+        # Tham số cố định của mọi request chat (model + tools + tham số sinh), dựng một lần
+        self._completion_kwargs = {"model": model, "tools": FUNCTION_SCHEMAS, **_COMPLETION_PARAMS}
+        
+        # Cache completions theo nội dung request (None = luôn gọi API)
+        self.completion_cache = completion_cache
+        # Cache phản hồi theo ngữ nghĩa câu hỏi (None = tắt)
+        self.response_cache = response_cache
+        
+        # Token ids của system prompt dùng cho ước lượng TPM - mặc định lấy bản đã encode sẵn
+        self.system_prompt_tokens = SYSTEM_PROMPT_TOKENS if pretokenized_system is None else pretokenized_system
+        self.conversation_history = []
+        self.user_context = {}  # Store user-specific context
+        
+        # Top-K lượt cũ liên quan được truy xuất từ ChromaDB thay vì phát lại toàn bộ history
+        self.session_id = f"assistant_{uuid.uuid4().hex[:12]}"
+        self.relevant_history_k = relevant_history_k
+        self.turn_count = 0
+        
+        # LRU các lượt hội thoại theo ngân sách tokens - lượt cũ được gộp vào tóm tắt
+        self.conversation_cache = ConversationCache(
+            max_tokens=max_history_tokens,
+            summarize_fn=self._summarize_evicted_turns
+        )
+        
+        # Initialize ChromaDB connection
+        self.db = get_expense_db()
+        
+        # System prompt cố định (SYSTEM_PROMPT) - không chèn dữ liệu theo request
+        self.system_prompt = SYSTEM_PROMPT
 
         # Initialize conversation với system prompt
-        self.conversation_history = [{"role": "system", "content": self.system_prompt}]
+        self.conversation_history = [SYSTEM_MESSAGE]
     
     def add_user_message(self, content: str):
         """Thêm tin nhắn người dùng vào lịch sử hội thoại."""
@@ -112,12 +301,12 @@ Hãy luôn tìm kiếm knowledge base để đưa ra câu trả lời chính xá
         user_messages = [msg for msg in self.conversation_history if msg["role"] == "user"]
         assistant_messages = [msg for msg in self.conversation_history if msg["role"] == "assistant"]
         
-        # Safe token calculation - handle None content
-        total_tokens = 0
-        for msg in self.conversation_history:
-            content = msg.get("content", "")
-            if content and isinstance(content, str):
-                total_tokens += len(content.split())
+        # Tokens đã được đếm sẵn: system prompt lúc import, các lượt và tóm tắt trong ConversationCache
+        total_tokens = (
+            len(self.system_prompt_tokens)
+            + self.conversation_cache.total_tokens
+            + self.conversation_cache.summary_tokens
+        )
         
         return {
             "total_exchanges": len(user_messages),
@@ -167,34 +356,293 @@ Hãy luôn tìm kiếm knowledge base để đưa ra câu trả lời chính xá
                 "error": str(e)
             }
     
+    def _run_tool_calls(self, tool_calls, history: List[Dict[str, Any]], response_data: Dict[str, Any]):
+        """
+        Thực thi các tool call của model, ghi kết quả vào history và response_data.
+        
+        Args:
+            tool_calls: Danh sách tool_calls từ message của model
+            history: Lịch sử hội thoại sẽ nhận các tin nhắn role="tool"
+            response_data: Dictionary phản hồi để ghi lại chi tiết từng lần gọi hàm
+        """
+        for tool_call in tool_calls:
+            function_name = tool_call.function.name
+            function_args = _json_loads(tool_call.function.arguments)
+            
+            # Execute function
+            function_result = execute_function_call(function_name, function_args)
+            
+            # Add function result to conversation
+            history.append({
+                "role": "tool",
+                "tool_call_id": tool_call.id,
+                "content": _json_dumps(function_result) if isinstance(function_result, dict) else str(function_result)
+            })
+            
+            response_data["tool_calls"].append({
+                "function": function_name,
+                "arguments": function_args,
+                "result": function_result
+            })
+    
+    def _summarize_evicted_turns(self, previous_summary: str, messages: List[Dict[str, Any]]) -> str:
+        """
+        Tóm tắt các lượt hội thoại bị loại khỏi ConversationCache bằng một lời gọi LLM nhỏ.
+        
+        Args:
+            previous_summary: Tóm tắt hiện có của các lượt đã bị loại trước đó
+            messages: Các message vừa bị loại
+            
+        Returns:
+            Tóm tắt mới gộp cả phần cũ và phần vừa bị loại
+        """
+        conversation_text = "\n".join(
+            f"{msg['role'].upper()}: {msg['content']}"
+            for msg in messages
+            if msg.get("role") in ("user", "assistant") and isinstance(msg.get("content"), str)
+        )
+        
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": "Tóm tắt ngắn gọn hội thoại về chi phí. Giữ lại mọi chi phí đã kê khai (số tiền, danh mục), câu hỏi chính sách và thông tin cần nhớ. Tối đa 150 từ."},
+                {"role": "user", "content": f"Tóm tắt trước đó:\n{previous_summary or '(trống)'}\n\nHội thoại mới cần gộp:\n{conversation_text}"}
+            ],
+            temperature=0.3,
+            max_tokens=200
+        )
+        return (response.choices[0].message.content or previous_summary).strip()
+    
+    def _build_relevant_history_message(self, user_input: str) -> List[Dict[str, Any]]:
+        """
+        Lấy top-K lượt user trước đó liên quan tới câu hỏi hiện tại.
+        
+        Các lượt còn nằm nguyên văn trong history bị bỏ qua. Kết quả được sắp theo
+        thứ tự lượt để block ổn định giữa các request, và trả về dưới dạng một
+        tin nhắn user riêng (không chèn vào system prompt để giữ prefix cache).
+        
+        Returns:
+            Danh sách rỗng hoặc một tin nhắn chứa block ngữ cảnh liên quan
+        """
+        if self.turn_count == 0 or self.relevant_history_k <= 0:
+            return []
+        
+        hits = self.db.search_conversation_turns(
+            self.session_id, user_input, limit=min(self.relevant_history_k, self.turn_count)
+        )
+        
+        # Lượt còn nguyên văn trong history thì không lặp lại, chỉ đánh dấu segment của nó
+        # vừa được dùng để ConversationCache (LRU) giữ nó lâu hơn
+        segment_openers = {
+            key: segment[0]["content"] for key, segment in self.conversation_cache.segments.items()
+            if isinstance(segment[0].get("content"), str)
+        }
+        remaining = []
+        for hit in hits:
+            reused = [key for key, content in segment_openers.items() if content.startswith(hit["content"])]
+            for key in reused:
+                self.conversation_cache.get(key)
+            if not reused:
+                remaining.append(hit)
+        hits = remaining
+        if not hits:
+            return []
+        
+        lines = ["🧷 NGỮ CẢNH LIÊN QUAN TỪ CÁC LƯỢT TRƯỚC:"]
+        for hit in sorted(hits, key=lambda h: h["turn_index"]):
+            lines.append(f"[#{hit['turn_index']}] {hit['content']}")
+        return [{"role": "user", "content": "\n".join(lines)}]
+    
+    def _remember_turn(self, turn_start: int):
+        """Đưa lượt vừa hoàn tất vào ConversationCache và dựng lại history trong ngân sách tokens."""
+        turn_messages = self.conversation_history[turn_start:]
+        if not turn_messages:
+            return
+        
+        self.conversation_cache.add(turn_messages)
+        self.conversation_history = [SYSTEM_MESSAGE] + self.conversation_cache.get_messages()
+    
     def clear_conversation(self):
         """Xóa lịch sử hội thoại nhưng giữ system prompt."""
-        self.conversation_history = [self.conversation_history[0]]  # Giữ system prompt
+        self.conversation_history = [SYSTEM_MESSAGE]  # Giữ system prompt
+        self.conversation_cache.clear()
         self.user_context = {}
+        
+        # Phiên mới: xóa các lượt đã lưu của phiên cũ, không truy xuất lại chúng nữa
+        if self.turn_count:
+            self.db.delete_conversation_turns(self.session_id)
+        self.session_id = f"assistant_{uuid.uuid4().hex[:12]}"
+        self.turn_count = 0
+    
+    def _lookup_cached_completion(self, messages: List[Dict[str, Any]]):
+        """
+        Tra completion cache cho một request.
+        
+        Returns:
+            (key, response) - key là None nếu không bật cache, response là None nếu chưa có
+        """
+        if self.completion_cache is None:
+            return None, None
+        
+        key = CompletionCache.make_key(self.model, _TOOLS_HASH, messages,
+                                       namespace=_POLICIES_HASH, **_COMPLETION_PARAMS)
+        cached = self.completion_cache.get(key)
+        if cached is None:
+            return key, None
+        
+        # Lấy từ cache không tốn token nào
+        cached["usage"] = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        return key, ChatCompletion.model_validate(cached)
+    
+    def _store_completion(self, key: Optional[str], response):
+        """Lưu completion vừa nhận từ API vào cache (nếu cache đang bật)."""
+        if key is not None and hasattr(response, "model_dump"):
+            self.completion_cache.set(key, response.model_dump())
+    
+    def _create_chat_completion(self, messages: List[Dict[str, Any]]):
+        """Gọi API chat với function calling, trả về completion đã cache nếu request trùng."""
+        key, response = self._lookup_cached_completion(messages)
+        if response is None:
+            response = self.client.chat.completions.create(messages=messages, **self._completion_kwargs)
+            self._store_completion(key, response)
+        return response
+    
+    async def _create_chat_completion_async(self, async_client: AsyncOpenAI, limiter: "AsyncRateLimiter",
+                                            estimated_tokens: int, messages: List[Dict[str, Any]]):
+        """
+        Bản async của _create_chat_completion; chỉ chiếm quota RPM/TPM khi thực sự gọi API.
+        
+        Lỗi 429 được thử lại với exponential backoff + jitter, mỗi lần gửi lại đều
+        xin lại quota từ limiter. Retry nội bộ của SDK bị tắt cho các lần gọi này để
+        vòng lặp dưới đây là lớp retry duy nhất (không nhân số lần gửi lại).
+        """
+        key, response = self._lookup_cached_completion(messages)
+        if response is None:
+            async_client = async_client.with_options(max_retries=0)
+            for attempt in range(_RATE_LIMIT_RETRIES):
+                await limiter.acquire(estimated_tokens)
+                try:
+                    response = await async_client.chat.completions.create(
+                        messages=messages, **self._completion_kwargs
+                    )
+                    break
+                except RateLimitError:
+                    if attempt == _RATE_LIMIT_RETRIES - 1:
+                        raise
+                    await asyncio.sleep(2 ** attempt + random.random())
+            self._store_completion(key, response)
+        return response
+    
+    def _stream_chat_completion(self, messages: List[Dict[str, Any]]):
+        """
+        Gọi API với stream=True, yield từng đoạn nội dung ngay khi token tới.
+        
+        Các mảnh delta.tool_calls được ghép lại theo index, nên giá trị return của
+        generator có cùng dạng với response không stream (choices[0].message, usage).
+        """
+        stream = self.client.chat.completions.create(
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **self._completion_kwargs
+        )
+        
+        content_parts = []
+        tool_call_parts = {}  # index -> {"id", "name", "arguments"}
+        usage = None
+        
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+            
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content_parts.append(delta.content)
+                yield delta.content
+            
+            for tool_call in delta.tool_calls or []:
+                part = tool_call_parts.setdefault(tool_call.index, {"id": "", "name": "", "arguments": []})
+                if tool_call.id:
+                    part["id"] = tool_call.id
+                if tool_call.function and tool_call.function.name:
+                    part["name"] += tool_call.function.name
+                if tool_call.function and tool_call.function.arguments:
+                    part["arguments"].append(tool_call.function.arguments)
+        
+        tool_calls = [
+            ChatCompletionMessageToolCall(
+                id=part["id"],
+                type="function",
+                function=Function(name=part["name"], arguments="".join(part["arguments"]))
+            )
+            for _, part in sorted(tool_call_parts.items())
+        ]
+        message = ChatCompletionMessage(
+            role="assistant",
+            content="".join(content_parts) or None,
+            tool_calls=tool_calls or None
+        )
+        
+        response = SimpleNamespace(choices=[SimpleNamespace(message=message)])
+        if usage is not None:
+            response.usage = usage
+        return response
     
-    def get_response(self, user_input: str, max_retries: int = 3) -> Dict[str, Any]:
+    def get_response(self, user_input: str, max_retries: int = 3, stream: bool = False,
+                     cache: bool = True) -> Dict[str, Any]:
         """
         Nhận phản hồi từ assistant với hỗ trợ gọi hàm và tìm kiếm knowledge base.
         
         Args:
             user_input: Tin nhắn của người dùng
             max_retries: Số lần thử lại tối đa cho gọi hàm
+            stream: In nội dung phản hồi ra màn hình theo từng token khi đang sinh
+            cache: Dùng semantic response cache (nếu assistant có response_cache; chỉ ở lượt đầu)
             
         Returns:
             Dictionary với chi tiết phản hồi
         """
-        from functions import FUNCTION_SCHEMAS, execute_function_call
+        events = self._response_events(user_input, stream, cache)
+        printed = False
+        while True:
+            try:
+                chunk = next(events)
+            except StopIteration as done:
+                if printed:
+                    print()
+                return done.value
+            print(chunk, end="", flush=True)
+            printed = True
+    
+    def get_response_stream(self, user_input: str, cache: bool = True) -> Generator[str, None, Dict[str, Any]]:
+        """
+        Bản generator của get_response: yield từng đoạn nội dung ngay khi model sinh ra.
         
-        # Tự động tìm kiếm knowledge base cho các câu hỏi chính sách và tổng quát
-        knowledge_base_keywords = [
-            'chính sách', 'policy', 'quy định', 'giới hạn', 'limit', 
-            'hóa đơn', 'receipt', 'yêu cầu', 'requirement', 'quy trình',
-            'hạn', 'deadline', 'nộp', 'submit', 'làm thế nào', 'how to',
-            'tôi có thể', 'can I', 'được không', 'phải', 'cần', 'need',
-            'hỗ trợ', 'support', 'giúp', 'help', 'thông tin', 'information'
-        ]
+        Dictionary chi tiết phản hồi (như get_response) là giá trị return của generator,
+        lấy được qua `response_data = yield from assistant.get_response_stream(...)`.
         
-        should_search_kb = any(keyword in user_input.lower() for keyword in knowledge_base_keywords)
+        Args:
+            user_input: Tin nhắn của người dùng
+            cache: Dùng semantic response cache (nếu assistant có response_cache; chỉ ở lượt đầu)
+        """
+        return (yield from self._response_events(user_input, True, cache))
+    
+    def _response_events(self, user_input: str, stream: bool, cache: bool) -> Generator[str, None, Dict[str, Any]]:
+        """Thân chung của get_response / get_response_stream; chỉ yield nội dung khi stream=True."""
+        # Key của semantic cache chỉ là user_input, nên chỉ dùng cho câu hỏi tự đủ nghĩa ở lượt đầu:
+        # khi đã có lượt trước, câu trả lời phụ thuộc ngữ cảnh mà một hội thoại khác không có
+        use_cache = cache and self.response_cache is not None and len(self.conversation_history) <= 1
+        if use_cache:
+            cached = self.response_cache.get(user_input)
+            if cached is not None:
+                if stream and cached["content"]:
+                    yield cached["content"]
+                return self._record_answered_turn(user_input, cached)
+        
+        # Tự động tìm kiếm knowledge base cho các câu hỏi chính sách và tổng quát
+        should_search_kb = _KB_KEYWORD_RE.search(user_input) is not None
         kb_results = {}
         
         enhanced_input = user_input
@@ -223,20 +671,29 @@ Hãy luôn tìm kiếm knowledge base để đưa ra câu trả lời chính xá
                 
                 # Thêm context vào tin nhắn của user
                 enhanced_input = f"{user_input}{kb_context}"
+                
+                direct = self._direct_kb_answer(user_input, kb_results)
+                if direct is not None:
+                    if stream:
+                        yield direct["content"]
+                    return self._record_answered_turn(user_input, direct)
+        
+        # Top-K lượt cũ liên quan, sau đó mới lưu lượt hiện tại để không tự khớp với chính nó
+        relevant_history = self._build_relevant_history_message(user_input)
+        self.turn_count += 1
+        self.db.add_conversation_turn(self.session_id, self.turn_count, user_input)
         
+        turn_start = len(self.conversation_history)
         try:
             # Add enhanced user message to history
             self.add_user_message(enhanced_input)
             
             # Make API call with function calling enabled
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=self.conversation_history,
-                tools=FUNCTION_SCHEMAS,
-                tool_choice="auto",
-                temperature=0.7,
-                max_tokens=1000
-            )
+            request_messages = self.conversation_history[:turn_start] + relevant_history + self.conversation_history[turn_start:]
+            if stream:
+                response = yield from self._stream_chat_completion(request_messages)
+            else:
+                response = self._create_chat_completion(request_messages)
             
             message = response.choices[0].message
             response_data = {
@@ -244,6 +701,7 @@ Hãy luôn tìm kiếm knowledge base để đưa ra câu trả lời chính xá
                 "tool_calls": [],
                 "function_results": [],
                 "total_tokens": response.usage.total_tokens if hasattr(response, 'usage') else 0,
+                "cached_tokens": _cached_prompt_tokens(response),
                 "knowledge_base_used": should_search_kb and kb_results.get("found", False)
             }
             
@@ -255,51 +713,36 @@ Hãy luôn tìm kiếm knowledge base để đưa ra câu trả lời chính xá
                     "tool_calls": message.tool_calls
                 })
                 
-                for tool_call in message.tool_calls:
-                    function_name = tool_call.function.name
-                    function_args = json.loads(tool_call.function.arguments)
-                    
-                    # Execute function
-                    function_result = execute_function_call(function_name, function_args)
-                    
-                    # Add function result to conversation
-                    self.conversation_history.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "content": json.dumps(function_result, ensure_ascii=False) if isinstance(function_result, dict) else str(function_result)
-                    })
-                    
-                    response_data["tool_calls"].append({
-                        "function": function_name,
-                        "arguments": function_args,
-                        "result": function_result
-                    })
+                self._run_tool_calls(message.tool_calls, self.conversation_history, response_data)
                 
                 # Get final response after function calls
-                final_response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=self.conversation_history,
-                    tools=FUNCTION_SCHEMAS,
-                    tool_choice="auto",
-                    temperature=0.7,
-                    max_tokens=1000
-                )
+                request_messages = self.conversation_history[:turn_start] + relevant_history + self.conversation_history[turn_start:]
+                if stream:
+                    final_response = yield from self._stream_chat_completion(request_messages)
+                else:
+                    final_response = self._create_chat_completion(request_messages)
                 
                 final_message = final_response.choices[0].message
                 response_data["content"] = final_message.content or ""  # Handle None content
                 response_data["total_tokens"] += final_response.usage.total_tokens if hasattr(final_response, 'usage') else 0
+                response_data["cached_tokens"] += _cached_prompt_tokens(final_response)
                 
                 # Add final response to history
                 self.add_assistant_message(final_message.content or "")
             else:
                 # No function calls, just add the response
                 self.add_assistant_message(message.content or "")
+                # Chỉ cache câu trả lời thuần văn bản - tool call có tác dụng phụ
+                if use_cache:
+                    self.response_cache.put(user_input, response_data)
             
+            self._remember_turn(turn_start)
             return response_data
             
         except Exception as e:
             error_msg = f"❌ Lỗi: {str(e)}"
             self.add_assistant_message(error_msg)
+            self._remember_turn(turn_start)
             return {
                 "content": error_msg,
                 "tool_calls": [],
@@ -309,130 +752,339 @@ Hãy luôn tìm kiếm knowledge base để đưa ra câu trả lời chính xá
                 "knowledge_base_used": False
             }
     
-    def process_batch_requests(self, user_inputs: List[str], batch_size: int = 5) -> List[Dict[str, Any]]:
+    def _direct_kb_answer(self, user_input: str, kb_results: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
-        Xử lý nhiều request cùng lúc với batching để tối ưu hiệu suất.
+        Trả lời câu hỏi tra cứu bằng FAQ gần nhất, không cần LLM diễn đạt lại.
+        
+        Chỉ áp dụng khi KB_DIRECT_ANSWER bật, câu hỏi có dạng tra cứu (_FACTOID_RE)
+        và FAQ đứng đầu có distance < KB_DIRECT_MAX_DISTANCE.
+        
+        Returns:
+            response_data với cache_hit="kb_direct", hoặc None nếu phải gọi LLM
+        """
+        if not KB_DIRECT_ANSWER or not kb_results.get("faqs") or not _FACTOID_RE.search(user_input):
+            return None
+        
+        top = kb_results["faqs"][0]
+        if top.get("relevance_score", 1.0) >= KB_DIRECT_MAX_DISTANCE or not top.get("answer"):
+            return None
+        
+        return {
+            "content": f"{top['answer']}\n\n📌 Nguồn: Câu hỏi thường gặp - \"{top['question']}\"",
+            "tool_calls": [],
+            "function_results": [],
+            "total_tokens": 0,
+            "cached_tokens": 0,
+            "knowledge_base_used": True,
+            "cache_hit": "kb_direct"
+        }
+    
+    def _record_answered_turn(self, user_input: str, response_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Ghi lượt đã có sẵn câu trả lời (semantic cache, FAQ) vào lịch sử như một lượt bình thường, không gọi API."""
+        self.turn_count += 1
+        self.db.add_conversation_turn(self.session_id, self.turn_count, user_input)
+        
+        turn_start = len(self.conversation_history)
+        self.add_user_message(user_input)
+        self.add_assistant_message(response_data["content"])
+        self._remember_turn(turn_start)
+        return response_data
+    
+    def process_batch_requests(self, user_inputs: List[str], max_concurrent: int = 5,
+                               async_client: Optional[AsyncOpenAI] = None,
+                               batch_size: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Xử lý nhiều request cùng lúc để tối ưu hiệu suất.
+        
+        Mọi request được gửi trong một asyncio.gather duy nhất, giới hạn bởi
+        semaphore max_concurrent - không chia thành các batch chạy tuần tự.
         
         Args:
             user_inputs: Danh sách các tin nhắn từ người dùng
-            batch_size: Kích thước batch cho mỗi lần xử lý
+            max_concurrent: Số request tối đa chạy song song
+            async_client: AsyncOpenAI client dùng chung; nếu không có sẽ tạo tạm một client
+            batch_size: (Deprecated) tên cũ của max_concurrent
             
         Returns:
             Danh sách các phản hồi tương ứng
         """
-        from functions import FUNCTION_SCHEMAS, execute_function_call
-        import time
+        if batch_size is not None:
+            warnings.warn("batch_size đã deprecated, hãy dùng max_concurrent",
+                          DeprecationWarning, stacklevel=2)
+            max_concurrent = batch_size
         
-        results = []
-        total_batches = (len(user_inputs) + batch_size - 1) // batch_size
+        return asyncio.run(self._process_batch_with_client(user_inputs, async_client, max_concurrent))
+    
+    async def _process_batch_with_client(self, user_inputs: List[str], async_client: Optional[AsyncOpenAI],
+                                         max_concurrent: int) -> List[Dict[str, Any]]:
+        """Chạy process_batch_requests_async, tự tạo và đóng AsyncOpenAI client nếu cần."""
+        owns_client = async_client is None
+        if owns_client:
+            async_client = create_async_client()
         
-        print(f"🔄 Xử lý {len(user_inputs)} requests với {total_batches} batch(es) (kích thước batch: {batch_size})")
+        try:
+            return await self.process_batch_requests_async(
+                user_inputs, async_client, max_concurrent=max_concurrent
+            )
+        finally:
+            if owns_client:
+                await async_client.close()
+    
+    async def process_batch_requests_async(self, user_inputs: List[str], async_client: AsyncOpenAI,
+                                           max_concurrent: int = 5, rpm: int = 200,
+                                           tpm: int = 40000) -> List[Dict[str, Any]]:
+        """
+        Xử lý batch request song song bằng AsyncOpenAI, giới hạn theo concurrency và RPM/TPM.
         
-        for batch_idx in range(0, len(user_inputs), batch_size):
-            batch_inputs = user_inputs[batch_idx:batch_idx + batch_size]
-            current_batch = batch_idx // batch_size + 1
-            
-            print(f"📦 Đang xử lý batch {current_batch}/{total_batches} ({len(batch_inputs)} requests)")
-            start_time = time.time()
-            
-            batch_results = []
+        Args:
+            user_inputs: Danh sách các tin nhắn từ người dùng
+            async_client: AsyncOpenAI client dùng chung cho cả batch
+            max_concurrent: Số request tối đa chạy song song
+            rpm: Giới hạn số request mỗi phút
+            tpm: Giới hạn số token mỗi phút
             
-            for i, user_input in enumerate(batch_inputs):
-                try:
-                    # Tạo bản sao conversation history cho mỗi request trong batch
-                    original_history = self.conversation_history.copy()
-                    
-                    # Add user message
-                    temp_history = original_history + [{"role": "user", "content": user_input}]
-                    
-                    # Make API call
-                    response = self.client.chat.completions.create(
-                        model=self.model,
-                        messages=temp_history,
-                        tools=FUNCTION_SCHEMAS,
-                        tool_choice="auto",
-                        temperature=0.7,
-                        max_tokens=1000
-                    )
-                    
-                    message = response.choices[0].message
-                    response_data = {
-                        "input": user_input,
+        Returns:
+            Danh sách các phản hồi theo đúng thứ tự đầu vào
+        """
+        limiter = AsyncRateLimiter(max_concurrent=max_concurrent, rpm=rpm, tpm=tpm)
+        
+        # Prefix (system prompt + history) giống nhau cho mọi request, chỉ đếm token một lần.
+        # System prompt dùng token ids đã encode sẵn, không tokenize lại mỗi batch.
+        # Snapshot chỉ-đọc dùng chung cho mọi item - mỗi item tự dựng list riêng của nó.
+        base_history = tuple(self.conversation_history)
+        base_tokens = len(self.system_prompt_tokens) + sum(
+            _count_text_tokens(msg["content"])
+            for msg in base_history[1:] if isinstance(msg.get("content"), str)
+        )
+        
+        print(f"🔄 Xử lý {len(user_inputs)} requests song song (tối đa {max_concurrent} cùng lúc, {rpm} RPM, {tpm:,} TPM)")
+        start_time = time.time()
+        
+        tasks = [
+            self._process_single_request_async(
+                async_client, limiter, base_history,
+                base_tokens + _count_text_tokens(user_input), user_input, i
+            )
+            for i, user_input in enumerate(user_inputs)
+        ]
+        results = await asyncio.gather(*tasks)
+        
+        print(f"   ✅ Hoàn thành {len(results)} requests trong {time.time() - start_time:.2f}s")
+        self._print_batch_statistics(results)
+        return results
+    
+    async def _process_single_request_async(self, async_client: AsyncOpenAI, limiter: AsyncRateLimiter,
+                                            base_history: Tuple[Dict[str, Any], ...], prompt_tokens: int,
+                                            user_input: str, index: int) -> Dict[str, Any]:
+        """Xử lý một request trong batch async, kể cả vòng gọi hàm thứ hai nếu model yêu cầu."""
+        # Ước lượng token trước khi chiếm slot: prompt + max_tokens của completion
+        estimated_tokens = prompt_tokens + 1000
+        
+        async with limiter.semaphore:
+            try:
+                temp_history = [*base_history, {"role": "user", "content": user_input}]
+                
+                response = await self._create_chat_completion_async(
+                    async_client, limiter, estimated_tokens, temp_history
+                )
+                
+                message = response.choices[0].message
+                response_data = {
+                    "input": user_input,
+                    "content": message.content,
+                    "tool_calls": [],
+                    "function_results": [],
+                    "total_tokens": response.usage.total_tokens if hasattr(response, 'usage') else 0,
+                    "cached_tokens": _cached_prompt_tokens(response),
+                    "batch_index": 1,
+                    "item_index": index + 1
+                }
+                
+                if message.tool_calls:
+                    temp_history.append({
+                        "role": "assistant",
                         "content": message.content,
-                        "tool_calls": [],
-                        "function_results": [],
-                        "total_tokens": response.usage.total_tokens if hasattr(response, 'usage') else 0,
-                        "batch_index": current_batch,
-                        "item_index": i + 1
-                    }
-                    
-                    # Handle function calls nếu có
-                    if message.tool_calls:
-                        temp_history.append({
-                            "role": "assistant",
-                            "content": message.content,
-                            "tool_calls": message.tool_calls
-                        })
-                        
-                        for tool_call in message.tool_calls:
-                            function_name = tool_call.function.name
-                            function_args = json.loads(tool_call.function.arguments)
-                            
-                            # Execute function
-                            function_result = execute_function_call(function_name, function_args)
-                            
-                            # Add function result
-                            temp_history.append({
-                                "role": "tool",
-                                "tool_call_id": tool_call.id,
-                                "content": json.dumps(function_result, ensure_ascii=False) if isinstance(function_result, dict) else str(function_result)
-                            })
-                            
-                            response_data["tool_calls"].append({
-                                "function": function_name,
-                                "arguments": function_args,
-                                "result": function_result
-                            })
-                        
-                        # Get final response
-                        final_response = self.client.chat.completions.create(
-                            model=self.model,
-                            messages=temp_history,
-                            tools=FUNCTION_SCHEMAS,
-                            tool_choice="auto",
-                            temperature=0.7,
-                            max_tokens=1000
-                        )
-                        
-                        final_message = final_response.choices[0].message
-                        response_data["content"] = final_message.content
-                        response_data["total_tokens"] += final_response.usage.total_tokens if hasattr(final_response, 'usage') else 0
+                        "tool_calls": message.tool_calls
+                    })
+                    self._run_tool_calls(message.tool_calls, temp_history, response_data)
                     
-                    batch_results.append(response_data)
+                    final_response = await self._create_chat_completion_async(
+                        async_client, limiter, estimated_tokens, temp_history
+                    )
                     
-                except Exception as e:
-                    error_response = {
-                        "input": user_input,
-                        "content": f"❌ Lỗi: {str(e)}",
-                        "tool_calls": [],
-                        "function_results": [],
-                        "total_tokens": 0,
-                        "batch_index": current_batch,
-                        "item_index": i + 1,
-                        "error": str(e)
-                    }
-                    batch_results.append(error_response)
+                    final_message = final_response.choices[0].message
+                    response_data["content"] = final_message.content
+                    response_data["total_tokens"] += final_response.usage.total_tokens if hasattr(final_response, 'usage') else 0
+                    response_data["cached_tokens"] += _cached_prompt_tokens(final_response)
+                
+                return response_data
+                
+            except Exception as e:
+                return {
+                    "input": user_input,
+                    "content": f"❌ Lỗi: {str(e)}",
+                    "tool_calls": [],
+                    "function_results": [],
+                    "total_tokens": 0,
+                    "batch_index": 1,
+                    "item_index": index + 1,
+                    "error": str(e)
+                }
+    
+    def process_batch_requests_batch_api(self, user_inputs: List[str], completion_window: str = "24h",
+                                         poll_interval: float = 30.0,
+                                         max_wait: float = 25 * 3600) -> List[Dict[str, Any]]:
+        """
+        Xử lý batch request qua OpenAI Batch API (/v1/batches) cho các job không cần phản hồi ngay.
+        
+        Toàn bộ request được gửi trong một file JSONL, xử lý trong completion_window với
+        chi phí thấp hơn gọi trực tiếp. Các request có tool call được chạy hàm tại chỗ rồi
+        gửi vòng thứ hai trong một batch tiếp theo. Dùng process_batch_requests cho
+        các tình huống tương tác.
+        
+        Args:
+            user_inputs: Danh sách các tin nhắn từ người dùng
+            completion_window: Thời hạn xử lý của batch
+            poll_interval: Số giây giữa hai lần kiểm tra trạng thái batch
+            max_wait: Số giây chờ tối đa cho mỗi batch; quá hạn thì batch bị hủy và
+                các request chưa có kết quả được trả về dưới dạng lỗi
             
-            # Add delay giữa các batch để tránh rate limiting
-            batch_time = time.time() - start_time
-            print(f"   ✅ Hoàn thành batch {current_batch} trong {batch_time:.2f}s")
+        Returns:
+            Danh sách các phản hồi theo đúng thứ tự đầu vào (cùng dạng với process_batch_requests)
+        """
+        base_history = tuple(self.conversation_history)
+        histories = [[*base_history, {"role": "user", "content": user_input}] for user_input in user_inputs]
+        
+        print(f"📦 Gửi {len(user_inputs)} requests qua Batch API (completion window {completion_window})")
+        start_time = time.time()
+        
+        responses, errors = self._run_completion_batch(
+            {f"req-{i}": history for i, history in enumerate(histories)}, completion_window, poll_interval, max_wait
+        )
+        
+        results = []
+        follow_ups = {}
+        for i, user_input in enumerate(user_inputs):
+            response = responses.get(f"req-{i}")
+            if response is None:
+                error = errors.get(f"req-{i}", "Không có kết quả từ Batch API")
+                results.append({
+                    "input": user_input,
+                    "content": f"❌ Lỗi: {error}",
+                    "tool_calls": [],
+                    "function_results": [],
+                    "total_tokens": 0,
+                    "batch_index": 1,
+                    "item_index": i + 1,
+                    "error": error
+                })
+                continue
             
-            if current_batch < total_batches:
-                time.sleep(0.5)  # Nghỉ 0.5s giữa các batch
+            message = response.choices[0].message
+            response_data = {
+                "input": user_input,
+                "content": message.content,
+                "tool_calls": [],
+                "function_results": [],
+                "total_tokens": response.usage.total_tokens if response.usage else 0,
+                "cached_tokens": _cached_prompt_tokens(response),
+                "batch_index": 1,
+                "item_index": i + 1
+            }
+            if message.tool_calls:
+                histories[i].append({
+                    "role": "assistant",
+                    "content": message.content,
+                    "tool_calls": [tool_call.model_dump() for tool_call in message.tool_calls]
+                })
+                self._run_tool_calls(message.tool_calls, histories[i], response_data)
+                follow_ups[f"req-{i}"] = histories[i]
+            results.append(response_data)
+        
+        # Vòng thứ hai cho các request đã gọi hàm, gom chung một batch
+        if follow_ups:
+            print(f"   🔧 {len(follow_ups)} requests có tool call, gửi batch vòng hai")
+            responses, errors = self._run_completion_batch(follow_ups, completion_window, poll_interval, max_wait)
+            for custom_id in follow_ups:
+                response_data = results[int(custom_id.split("-", 1)[1])]
+                response = responses.get(custom_id)
+                if response is None:
+                    response_data["error"] = errors.get(custom_id, "Không có kết quả từ Batch API")
+                    continue
+                response_data["content"] = response.choices[0].message.content
+                response_data["total_tokens"] += response.usage.total_tokens if response.usage else 0
+                response_data["cached_tokens"] += _cached_prompt_tokens(response)
+        
+        print(f"   ✅ Hoàn thành {len(results)} requests trong {time.time() - start_time:.2f}s")
+        self._print_batch_statistics(results)
+        return results
+    
+    def _run_completion_batch(self, requests: Dict[str, List[Dict[str, Any]]], completion_window: str,
+                              poll_interval: float, max_wait: float):
+        """
+        Gửi một job Batch API (mỗi dòng JSONL là một chat completion) và chờ tới khi kết thúc.
+        
+        Args:
+            requests: custom_id -> messages của request
+            completion_window: Thời hạn xử lý của batch
+            poll_interval: Số giây giữa hai lần kiểm tra trạng thái
+            max_wait: Số giây chờ tối đa trước khi hủy batch
             
-            results.extend(batch_results)
+        Returns:
+            (responses, errors) - custom_id -> ChatCompletion và custom_id -> thông báo lỗi
+        """
+        lines = [
+            _json_dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {"messages": messages, **self._completion_kwargs}
+            }, default=_request_jsonable)
+            for custom_id, messages in requests.items()
+        ]
+        input_file = self.client.files.create(
+            file=("batch_requests.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch"
+        )
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=completion_window
+        )
+        
+        deadline = time.monotonic() + max_wait
+        while batch.status not in _BATCH_TERMINAL_STATUSES:
+            if time.monotonic() >= deadline:
+                print(f"   ⏱️ Batch {batch.id} quá {max_wait:.0f}s chưa xong ({batch.status}), hủy batch")
+                batch = self.client.batches.cancel(batch.id)
+                break
+            time.sleep(min(poll_interval, max(deadline - time.monotonic(), 0)))
+            batch = self.client.batches.retrieve(batch.id)
         
-        # Tính toán thống kê tổng
+        responses = {}
+        errors = {}
+        # Batch hết hạn / bị hủy vẫn có thể có kết quả cho một phần request
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                record = _json_loads(line)
+                response = record.get("response") or {}
+                if response.get("status_code") == 200:
+                    responses[record["custom_id"]] = ChatCompletion.model_validate(response["body"])
+                else:
+                    error = record.get("error") or response.get("body", {}).get("error") or response
+                    errors[record["custom_id"]] = str(error)
+        
+        for custom_id in requests:
+            if custom_id not in responses and custom_id not in errors:
+                errors[custom_id] = f"Batch {batch.id} kết thúc với trạng thái {batch.status}"
+        return responses, errors
+    
+    def _print_batch_statistics(self, results: List[Dict[str, Any]]):
+        """In thống kê tổng hợp cho một lần batch processing."""
         total_tokens = sum(r.get("total_tokens", 0) for r in results)
         successful_requests = len([r for r in results if "error" not in r])
         failed_requests = len(results) - successful_requests
@@ -442,9 +1094,7 @@ Hãy luôn tìm kiếm knowledge base để đưa ra câu trả lời chính xá
         print(f"   • Thành công: {successful_requests}")
         print(f"   • Thất bại: {failed_requests}")
         print(f"   • Tổng tokens: {total_tokens:,}")
-        print(f"   • Trung bình tokens/request: {total_tokens/len(results):.1f}")
-        
-        return results
+        print(f"   • Trung bình tokens/request: {total_tokens/max(len(results), 1):.1f}")
     
     def process_expense_batch(self, expenses: List[Dict[str, Any]]) -> Dict[str, Any]:
         """
@@ -456,20 +1106,17 @@ Hãy luôn tìm kiếm knowledge base để đưa ra câu trả lời chính xá
         Returns:
             Dictionary với kết quả xử lý tổng hợp
         """
-        from functions import calculate_reimbursement, validate_expense, format_expense_summary
-        
         print(f"💰 Xử lý batch {len(expenses)} chi phí...")
         
-        # Tính toán hoàn trả cho tất cả chi phí
-        reimbursement_result = calculate_reimbursement(expenses)
+        # Tính toán hoàn trả cho tất cả chi phí trong một lượt vector hóa -
+        # breakdown giữ dạng cột (mỗi trường một np.ndarray)
+        reimbursement_result = calculate_reimbursement_columns(expenses)
         
-        # Xác thực từng chi phí
-        validation_results = []
-        for i, expense in enumerate(expenses):
-            validation = validate_expense(expense)
+        # Xác thực cả batch trong một kernel
+        validation_results = validate_expense_batch(expenses)
+        for i, (validation, expense) in enumerate(zip(validation_results, expenses)):
             validation["expense_index"] = i + 1
             validation["expense"] = expense
-            validation_results.append(validation)
         
         # Tạo tóm tắt
         summary = format_expense_summary(expenses)
@@ -499,9 +1146,25 @@ Hãy luôn tìm kiếm knowledge base để đưa ra câu trả lời chính xá
         
         return batch_result
 
+# Giữ tối đa 20 kết nối keep-alive để các request liên tiếp không phải bắt tay TLS lại
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+
 def create_client():
-    """Tạo và trả về OpenAI client."""
+    """Tạo và trả về OpenAI client (connection pool keep-alive dùng lại giữa các request)."""
     return OpenAI(
         base_url=os.getenv('AZURE_OPENAI_LLM_ENDPOINT'),
-        api_key=os.getenv('AZURE_OPENAI_LLM_API_KEY')
+        api_key=os.getenv('AZURE_OPENAI_LLM_API_KEY'),
+        http_client=DefaultHttpxClient(limits=HTTP_LIMITS)
     )
+
+def create_async_client():
+    """Tạo và trả về AsyncOpenAI client cho các batch request song song."""
+    return AsyncOpenAI(
+        base_url=os.getenv('AZURE_OPENAI_LLM_ENDPOINT'),
+        api_key=os.getenv('AZURE_OPENAI_LLM_API_KEY'),
+        http_client=DefaultAsyncHttpxClient(limits=HTTP_LIMITS)
+    )
+
+def create_response_cache(model: str = "GPT-4o-mini", ttl_seconds: float = 3600.0) -> SemanticCache:
+    """Tạo semantic response cache cho model, tự vô hiệu khi EXPENSE_POLICIES thay đổi."""
+    return SemanticCache(get_expense_db(), namespace=f"{model}:{_POLICIES_HASH}", ttl_seconds=ttl_seconds)
@@ -13,7 +13,7 @@ Date: August 16, 2025
 import json
 import time
 from typing import List, Dict, Any, Optional
-from database import ExpenseDB
+from database import get_expense_db
 import openai
 from openai import OpenAI
 
@@ -30,7 +30,7 @@ class FallbackRAGSystem:
     
     def __init__(self, openai_client: Optional[OpenAI] = None):
         """Initialize fallback RAG system"""
-        self.db = ExpenseDB()
+        self.db = get_expense_db()
         self.client = openai_client
         
         # RAG configuration
@@ -83,10 +83,11 @@ class FallbackRAGSystem:
             
             formatted_results = []
             if results['documents'] and results['documents'][0]:
-                for i, doc in enumerate(results['documents'][0]):
-                    metadata = results['metadatas'][0][i] if results['metadatas'] else {}
-                    distance = results['distances'][0][i] if results.get('distances') else 1.0
-                    
+                documents = results['documents'][0]
+                metadatas = results['metadatas'][0] if results['metadatas'] else [{}] * len(documents)
+                distances = results['distances'][0] if results.get('distances') else [1.0] * len(documents)
+                
+                for doc, metadata, distance in zip(documents, metadatas, distances):
                     # Convert distance to relevance score (lower distance = higher relevance)
                     relevance_score = max(0, 1.0 - distance)
                     
@@ -12,6 +12,15 @@ import re
 from datetime import datetime
 from typing import List, Dict, Any
 
+import numpy as np
+
+# Numba là tùy chọn: có thì JIT kernel validation, không có thì dùng bản NumPy
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
 # 📋 CHÍNH SÁCH CHI PHÍ CÔNG TY (Company Expense Policies)
 EXPENSE_POLICIES = {
     # 🧾 Quy định về hóa đơn và chứng từ
@@ -429,6 +438,153 @@ def calculate_reimbursement(expenses: List[Dict]) -> Dict[str, Any]:
         "savings": total_submitted - total_reimbursed  # Số tiền tiết kiệm cho công ty
     }
 
+# 🧮 Bảng tra cứu cho tính toán hoàn trả dạng vector (calculate_reimbursement_columns)
+# Thứ tự phải khớp với các nhánh trong calculate_reimbursement
+REIMBURSABLE_CATEGORIES = ("meals", "taxi", "travel", "mileage", "office_supplies", "parking")
+CATEGORY_IDS = {category: idx for idx, category in enumerate(REIMBURSABLE_CATEGORIES)}
+UNKNOWN_CATEGORY_ID = len(REIMBURSABLE_CATEGORIES)
+MILEAGE_CATEGORY_ID = CATEGORY_IDS["mileage"]
+
+# Mức trần hoàn trả theo danh mục (inf = không giới hạn), phần tử cuối cho danh mục lạ
+REIMBURSEMENT_CAPS = np.array([
+    EXPENSE_CATEGORIES["meals"]["daily_limit"],
+    np.inf, np.inf, np.inf,
+    EXPENSE_CATEGORIES["office_supplies"]["monthly_limit"],
+    np.inf,
+    np.inf
+], dtype=np.float64)
+
+# Tỷ lệ hoàn trả: danh mục không nhận dạng được hoàn 0%
+REIMBURSEMENT_RATIOS = np.array([1, 1, 1, 1, 1, 1, 0], dtype=np.float64)
+
+_NOTES_FULL = np.array([
+    "Hoàn trả đầy đủ",
+    "Hoàn trả đầy đủ",
+    "Hoàn trả đầy đủ (giả sử đã được phê duyệt)",
+    "Tính toán thủ công - xác minh số km",
+    "Hoàn trả đầy đủ",
+    "Hoàn trả đầy đủ",
+    "Danh mục không được nhận dạng - cần xem xét thủ công"
+], dtype=object)
+_NOTES_CAPPED = np.array([
+    f"Giới hạn {EXPENSE_CATEGORIES['meals']['daily_limit']:,.0f} VNĐ/ngày",
+    None, None, None,
+    f"Giới hạn {EXPENSE_CATEGORIES['office_supplies']['monthly_limit']:,.0f} VNĐ/tháng",
+    None, None
+], dtype=object)
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _reimburse_kernel(base_amounts, cat_idx, caps, ratios):
+        """Kernel JIT: số tiền hoàn trả, cờ bị chặn trần của từng chi phí và tổng, trong một vòng lặp."""
+        n = base_amounts.shape[0]
+        reimbursed = np.empty(n, dtype=np.float64)
+        capped = np.empty(n, dtype=np.bool_)
+        total = 0.0
+        for i in range(n):
+            cap = caps[cat_idx[i]]
+            capped[i] = base_amounts[i] > cap
+            reimbursed[i] = min(base_amounts[i], cap) * ratios[cat_idx[i]]
+            total += reimbursed[i]
+        return reimbursed, capped, total
+else:
+    def _reimburse_kernel(base_amounts, cat_idx, caps, ratios):
+        """Bản NumPy thuần khi không có Numba: cùng đầu vào/đầu ra với kernel JIT."""
+        row_caps = caps[cat_idx]
+        reimbursed = np.minimum(base_amounts, row_caps) * ratios[cat_idx]
+        return reimbursed, base_amounts > row_caps, float(reimbursed.sum())
+
+# Warmup: biên dịch kernel ngay khi import (với cache=True chỉ tốn lần chạy đầu tiên)
+_reimburse_kernel(np.zeros(1, dtype=np.float64), np.zeros(1, dtype=np.int32), REIMBURSEMENT_CAPS, REIMBURSEMENT_RATIOS)
+
+def calculate_reimbursement_columns(expenses: List[Dict]) -> Dict[str, Any]:
+    """
+    🧮 Tính toán hoàn trả cho cả batch chi phí bằng phép toán vector NumPy
+    
+    Áp dụng mức trần và tỷ lệ hoàn trả trên toàn bộ mảng số tiền trong một lượt.
+    Breakdown trả về dạng cột (Struct-of-Arrays): mỗi trường là một np.ndarray
+    cùng độ dài, phần tử thứ i ứng với expenses[i].
+    
+    Args:
+        expenses: Danh sách dictionary chứa thông tin chi phí (category, amount, etc.)
+        
+    Returns:
+        Dictionary chứa breakdown dạng cột và tổng tiền hoàn trả
+    """
+    count = len(expenses)
+    amounts = np.fromiter((float(e.get('amount', 0)) for e in expenses), dtype=np.float64, count=count)
+    cat_idx = np.fromiter(
+        (CATEGORY_IDS.get(e.get('category', '').lower(), UNKNOWN_CATEGORY_ID) for e in expenses),
+        dtype=np.int32, count=count
+    )
+    
+    # 🛣️ Xăng xe tính theo km trong mô tả - chỉ phần này cần xử lý chuỗi
+    base_amounts = amounts.copy()
+    mileage_notes = {}
+    rate = EXPENSE_CATEGORIES['mileage']['rate_per_km']
+    for i in np.flatnonzero(cat_idx == MILEAGE_CATEGORY_ID).tolist():
+        km_match = re.search(r'(\d+)\s*km', expenses[i].get('description', '').lower())
+        if km_match:
+            km = int(km_match.group(1))
+            base_amounts[i] = km * rate
+            mileage_notes[i] = f"{km} km @ {rate:,.0f} VNĐ/km"
+    
+    # 🔢 Áp dụng mức trần và tỷ lệ hoàn trả cho toàn bộ batch trong một kernel
+    reimbursed, capped, total_reimbursed = _reimburse_kernel(
+        base_amounts, cat_idx, REIMBURSEMENT_CAPS, REIMBURSEMENT_RATIOS
+    )
+    
+    # 📝 Ghi chú chọn theo mảng: trần/không trần theo danh mục, xăng xe ghi đè
+    notes = np.where(capped, _NOTES_CAPPED[cat_idx], _NOTES_FULL[cat_idx])
+    for i, note in mileage_notes.items():
+        notes[i] = note
+    
+    total_submitted = float(amounts.sum())
+    total_reimbursed = float(total_reimbursed)
+    
+    return {
+        "breakdown": {
+            "category": np.array([e.get('category') for e in expenses], dtype=object),
+            "amount_submitted": amounts,
+            "amount_reimbursed": reimbursed,
+            "note": notes
+        },
+        "total_submitted": total_submitted,
+        "total_reimbursed": total_reimbursed,
+        "savings": total_submitted - total_reimbursed  # Số tiền tiết kiệm cho công ty
+    }
+
+def calculate_reimbursement_batch(expenses: List[Dict]) -> Dict[str, Any]:
+    """
+    🧮 Tính toán hoàn trả cho cả batch chi phí bằng phép toán vector NumPy
+    
+    Cho kết quả giống calculate_reimbursement (breakdown là danh sách dict, dùng
+    được làm kết quả tool call) - được dựng từ calculate_reimbursement_columns.
+    
+    Args:
+        expenses: Danh sách dictionary chứa thông tin chi phí (category, amount, etc.)
+        
+    Returns:
+        Dictionary chứa breakdown chi tiết và tổng tiền hoàn trả
+    """
+    result = calculate_reimbursement_columns(expenses)
+    columns = result["breakdown"]
+    
+    # 📊 Dựng breakdown từ các mảng kết quả
+    result["breakdown"] = [
+        {
+            "category": category,
+            "amount_submitted": amount,
+            "amount_reimbursed": reimbursed_amount,
+            "note": note
+        }
+        for category, amount, reimbursed_amount, note in zip(
+            columns["category"].tolist(), columns["amount_submitted"].tolist(),
+            columns["amount_reimbursed"].tolist(), columns["note"].tolist()
+        )
+    ]
+    return result
+
 def validate_expense(expense: Dict) -> Dict[str, Any]:
     """
     🔍 Xác thực một mục chi phí theo chính sách công ty
@@ -480,6 +636,120 @@ def validate_expense(expense: Dict) -> Dict[str, Any]:
         "requires_manager_approval": len(errors) > 0 or ('travel' in category and not expense.get('pre_approved', False))
     }
 
+RECEIPT_REQUIRED_THRESHOLD = 500000   # Chi phí trên mức này bắt buộc có hóa đơn
+SUBMISSION_WINDOW_DAYS = 30           # Số ngày tối đa để nộp báo cáo
+TRAVEL_CATEGORY_ID = CATEGORY_IDS["travel"]
+
+if NUMBA_AVAILABLE:
+    @njit(cache=True)
+    def _validate_kernel(amounts, cat_idx, caps, has_receipt, pre_approved, days_old):
+        """Kernel JIT: trả về các mask cờ lỗi/cảnh báo cho từng chi phí trong một vòng lặp."""
+        n = amounts.shape[0]
+        receipt_error = np.zeros(n, dtype=np.bool_)
+        over_limit = np.zeros(n, dtype=np.bool_)
+        needs_approval = np.zeros(n, dtype=np.bool_)
+        stale = np.zeros(n, dtype=np.bool_)
+        for i in range(n):
+            receipt_error[i] = amounts[i] > RECEIPT_REQUIRED_THRESHOLD and not has_receipt[i]
+            over_limit[i] = amounts[i] > caps[cat_idx[i]]
+            needs_approval[i] = cat_idx[i] == TRAVEL_CATEGORY_ID and not pre_approved[i]
+            stale[i] = days_old[i] > SUBMISSION_WINDOW_DAYS
+        return receipt_error, over_limit, needs_approval, stale
+else:
+    def _validate_kernel(amounts, cat_idx, caps, has_receipt, pre_approved, days_old):
+        """Bản NumPy thuần khi không có Numba: cùng đầu vào/đầu ra với kernel JIT."""
+        receipt_error = (amounts > RECEIPT_REQUIRED_THRESHOLD) & ~has_receipt
+        over_limit = amounts > caps[cat_idx]
+        needs_approval = (cat_idx == TRAVEL_CATEGORY_ID) & ~pre_approved
+        stale = days_old > SUBMISSION_WINDOW_DAYS
+        return receipt_error, over_limit, needs_approval, stale
+
+# Warmup: biên dịch kernel ngay khi import (với cache=True chỉ tốn lần chạy đầu tiên)
+_validate_kernel(
+    np.zeros(1, dtype=np.float64), np.zeros(1, dtype=np.int32), REIMBURSEMENT_CAPS,
+    np.zeros(1, dtype=np.bool_), np.zeros(1, dtype=np.bool_), np.zeros(1, dtype=np.int64)
+)
+
+def validate_expense_batch(expenses: List[Dict]) -> List[Dict[str, Any]]:
+    """
+    🔍 Xác thực cả batch chi phí, phần so sánh số chạy trong một kernel duy nhất
+    
+    Cho kết quả giống [validate_expense(e) for e in expenses]. Chỉ phần parse
+    ngày và dựng thông báo (chuỗi) còn chạy trong Python.
+    
+    Args:
+        expenses: Danh sách dictionary chứa thông tin chi phí cần xác thực
+        
+    Returns:
+        Danh sách kết quả validation theo đúng thứ tự đầu vào
+    """
+    count = len(expenses)
+    categories = [e.get('category', '').lower() for e in expenses]
+    amounts = np.fromiter((float(e.get('amount', 0)) for e in expenses), dtype=np.float64, count=count)
+    cat_idx = np.fromiter(
+        (CATEGORY_IDS.get(category, UNKNOWN_CATEGORY_ID) for category in categories),
+        dtype=np.int32, count=count
+    )
+    has_receipt = np.fromiter((bool(e.get('has_receipt', False)) for e in expenses), dtype=np.bool_, count=count)
+    pre_approved = np.fromiter((bool(e.get('pre_approved', False)) for e in expenses), dtype=np.bool_, count=count)
+    
+    # 📅 Parse ngày trong Python (mỗi chuỗi ngày khác nhau chỉ parse một lần).
+    # Ngày không hợp lệ có mask riêng - mọi giá trị days_old (kể cả âm, ngày
+    # trong tương lai) đều là số ngày thật
+    now = datetime.now()
+    parsed_days = {}
+    days_old = np.zeros(count, dtype=np.int64)
+    invalid_date = np.zeros(count, dtype=np.bool_)
+    for i, expense in enumerate(expenses):
+        date_str = expense.get('date', '')
+        if date_str not in parsed_days:
+            try:
+                parsed_days[date_str] = (now - datetime.strptime(date_str, '%Y-%m-%d')).days
+            except ValueError:
+                parsed_days[date_str] = None
+        days = parsed_days[date_str]
+        if days is None:
+            invalid_date[i] = True
+        else:
+            days_old[i] = days
+    
+    receipt_error, over_limit, needs_approval, stale = _validate_kernel(
+        amounts, cat_idx, REIMBURSEMENT_CAPS, has_receipt, pre_approved, days_old
+    )
+    
+    meals_limit = EXPENSE_CATEGORIES['meals']['daily_limit']
+    office_limit = EXPENSE_CATEGORIES['office_supplies']['monthly_limit']
+    results = []
+    for i, (category, amount, days, bad_date, receipt_err, over, approval, is_stale) in enumerate(zip(
+        categories, amounts.tolist(), days_old.tolist(), invalid_date.tolist(), receipt_error.tolist(),
+        over_limit.tolist(), needs_approval.tolist(), stale.tolist()
+    )):
+        warnings = []
+        errors = []
+        
+        if receipt_err:
+            errors.append(f"⚠️ Yêu cầu hóa đơn cho chi phí trên 500.000 VNĐ (số tiền: {amount:,.0f} VNĐ)")
+        if bad_date:
+            errors.append("❌ Định dạng ngày không hợp lệ - sử dụng YYYY-MM-DD")
+        elif is_stale:
+            warnings.append(f"📆 Chi phí đã {days} ngày tuổi - báo cáo nên được nộp trong vòng 30 ngày")
+        
+        if over and category == 'meals':
+            warnings.append(f"🍽️ Chi phí ăn uống {amount:,.0f} VNĐ vượt quá giới hạn hàng ngày {meals_limit:,.0f} VNĐ")
+        if approval:
+            warnings.append("✈️ Chi phí đi lại cần phê duyệt trước")
+        if over and category == 'office_supplies':
+            warnings.append(f"📎 Chi phí văn phòng phẩm {amount:,.0f} VNĐ vượt quá giới hạn hàng tháng {office_limit:,.0f} VNĐ")
+        
+        results.append({
+            "is_valid": len(errors) == 0,
+            "warnings": warnings,
+            "errors": errors,
+            "requires_manager_approval": len(errors) > 0 or ('travel' in category and not pre_approved[i])
+        })
+    
+    return results
+
 def search_policies(query: str) -> List[str]:
     """
     🔍 Tìm kiếm chính sách chi phí dựa trên câu hỏi của user
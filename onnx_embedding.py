@@ -0,0 +1,87 @@
+"""
+⚡ ONNX EMBEDDING - all-MiniLM-L6-v2 chạy nhanh hơn trên CPU
+=============================================================
+
+Cùng model ONNX với DefaultEmbeddingFunction của ChromaDB (vector tương thích với
+các collection đã lưu), chỉ thay cách chạy:
+- Graph optimization ORT_ENABLE_ALL, intra-op threads = số CPU
+- Padding theo câu dài nhất trong lô thay vì luôn pad đủ 256 tokens
+- Sắp văn bản theo độ dài trước khi chia lô để mỗi lô ít padding nhất
+
+Lớp này override các thành phần nội bộ của ONNXMiniLM_L6_V2 (tokenizer, model,
+_forward, _preferred_providers): requirements.txt pin chính xác version chromadb,
+tests/test_onnx_embedding.py kiểm tra các thành phần đó và so embedding với bản gốc.
+"""
+
+import os
+from functools import cached_property
+from typing import List
+
+import numpy as np
+from chromadb.api.types import Documents, Embeddings
+from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+
+class FastONNXMiniLM(ONNXMiniLM_L6_V2):
+    """
+    🚀 ONNXMiniLM_L6_V2 với session tối ưu và dynamic padding
+
+    Attention mask loại token padding khỏi cả self-attention lẫn mean pooling,
+    nên bỏ padding thừa không làm đổi embedding. Vector trả về đã chuẩn hóa L2.
+    """
+
+    @cached_property
+    def tokenizer(self):
+        tokenizer = ONNXMiniLM_L6_V2.tokenizer.func(self)
+        # Vẫn truncate ở 256 tokens, nhưng chỉ pad tới câu dài nhất của lô
+        tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+        return tokenizer
+
+    @cached_property
+    def model(self):
+        providers = self._preferred_providers or self.ort.get_available_providers()
+
+        so = self.ort.SessionOptions()
+        so.log_severity_level = 3
+        so.graph_optimization_level = self.ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        so.intra_op_num_threads = os.cpu_count() or 0
+
+        return self.ort.InferenceSession(
+            os.path.join(self.DOWNLOAD_PATH, self.EXTRACTED_FOLDER_NAME, "model.onnx"),
+            providers=providers,
+            sess_options=so,
+        )
+
+    def _forward(self, documents: List[str], batch_size: int = 32) -> np.ndarray:
+        # Chia lô theo thứ tự độ dài, ghép kết quả về đúng thứ tự ban đầu
+        order = np.argsort([len(doc) for doc in documents], kind="stable")
+        embeddings = np.empty((len(documents), 0), dtype=np.float32)
+
+        for start in range(0, len(documents), batch_size):
+            batch_idx = order[start:start + batch_size]
+            encoded = self.tokenizer.encode_batch([documents[i] for i in batch_idx])
+            input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+
+            last_hidden_state = self.model.run(None, {
+                "input_ids": input_ids,
+                "attention_mask": attention_mask,
+                "token_type_ids": np.zeros_like(input_ids),
+            })[0]
+
+            # Mean pooling theo attention mask
+            mask = attention_mask[..., np.newaxis].astype(last_hidden_state.dtype)
+            pooled = (last_hidden_state * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            # Chuẩn hóa L2 duy nhất của pipeline (như bản gốc); EmbeddingCache không chuẩn hóa lại
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+            if embeddings.shape[1] == 0:
+                embeddings = np.empty((len(documents), pooled.shape[1]), dtype=np.float32)
+            embeddings[batch_idx] = pooled
+
+        return embeddings
+
+    def __call__(self, input: Documents) -> Embeddings:
+        if not input:
+            return []
+        return super().__call__(input)
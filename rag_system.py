@@ -261,9 +261,6 @@ class ExpenseRAGSystem:
     def calculate_reimbursement_wrapper(self, query: str) -> str:
         """Wrapper for expense calculation function"""
         try:
-            # Use existing function from functions.py
-            from functions import calculate_reimbursement
-            
             # Parse query to extract basic expense data
             import re
             
@@ -296,9 +293,6 @@ class ExpenseRAGSystem:
     def validate_expense_wrapper(self, query: str) -> str:
         """Wrapper for expense validation function"""
         try:
-            # Use existing function from functions.py
-            from functions import validate_expense
-            
             # Extract amount and category from query
             import re
             
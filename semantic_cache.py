@@ -0,0 +1,82 @@
+"""
+🧠 SEMANTIC CACHE - Cache phản hồi của assistant theo ngữ nghĩa câu hỏi
+=========================================================================
+
+Người dùng hay hỏi lại cùng một câu chính sách với cách diễn đạt khác nhau
+("giới hạn ăn uống?" / "quy định ăn uống là bao nhiêu?"). CompletionCache chỉ khớp
+request giống hệt byte-by-byte; cache này khớp theo embedding của câu hỏi:
+- Lưu trong collection llm_response_cache của ExpenseDB (cùng embedding model)
+- Trúng cache khi distance (1 - cosine) < max_distance, bỏ qua hoàn toàn lượt gọi API
+- Mỗi entry có TTL để không trả mãi câu trả lời cũ khi chính sách đổi
+- namespace (model + hash chính sách) tách các entry không còn dùng được
+"""
+
+import json
+import time
+import hashlib
+from typing import Any, Dict, Optional
+
+
+class SemanticCache:
+    """
+    🗄️ Cache response_data theo embedding của user_input, lưu trong ChromaDB
+    """
+
+    # Số lần put giữa hai lần dọn các entry đã hết hạn
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, db, namespace: str = "", max_distance: float = 0.1, ttl_seconds: float = 3600.0):
+        """
+        Khởi tạo semantic cache
+
+        Args:
+            db: ExpenseDB (dùng collection response_cache và embedding function của nó)
+            namespace: Chuỗi phân vùng entry (vd: model + hash chính sách)
+            max_distance: Distance tối đa để coi là cùng một câu hỏi
+            ttl_seconds: Thời gian sống của mỗi entry
+        """
+        self.db = db
+        self.namespace = namespace
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+
+    def _key(self, user_input: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\n{user_input}".encode("utf-8")).hexdigest()
+
+    def get(self, user_input: str) -> Optional[Dict[str, Any]]:
+        """Lấy response_data của câu hỏi gần nhất còn hạn, None nếu không đủ gần."""
+        match = self.db.search_cached_response(self.db.embed_query(user_input), self.namespace)
+        if match is None or match[0] >= self.max_distance:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        response_data = json.loads(match[1])
+        response_data["cache_hit"] = True
+        return response_data
+
+    def put(self, user_input: str, response_data: Dict[str, Any]):
+        """Lưu response_data cho user_input, hết hạn sau ttl_seconds."""
+        self.db.add_cached_response(
+            self._key(user_input),
+            user_input,
+            json.dumps(response_data, ensure_ascii=False),
+            self.namespace,
+            time.time() + self.ttl_seconds
+        )
+
+        self._puts += 1
+        if self._puts % self.PRUNE_INTERVAL == 0:
+            self.db.prune_response_cache()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Thống kê hit/miss của cache."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -14,6 +14,7 @@ Features:
 
 from typing import Dict, List, Any, Optional
 from datetime import datetime
+from itertools import islice
 import json
 from openai import OpenAI
 
@@ -99,7 +100,8 @@ class SmartConversationMemory:
         # Add recent active messages
         if self.session_id in self.summarizer.active_conversations:
             active_messages = self.summarizer.active_conversations[self.session_id]['messages']
-            messages.extend(active_messages[-5:])  # Chỉ lấy 5 messages gần nhất
+            # Chỉ lấy 5 messages gần nhất (active_messages là deque, không hỗ trợ slice)
+            messages.extend(islice(active_messages, max(0, len(active_messages) - 5), None))
         
         return messages
     
@@ -0,0 +1,35 @@
+import os
+import sys
+
+# Các module nằm phẳng ở thư mục gốc của repo
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hashlib
+
+import pytest
+from chromadb.api.client import SharedSystemClient
+
+
+class _HashEmbedding:
+    """Embedding giả (hash của văn bản) để test ExpenseDB không cần tải model ONNX."""
+
+    def __call__(self, input):
+        return [[byte / 255.0 for byte in hashlib.sha256(text.encode("utf-8")).digest()[:16]] for text in input]
+
+
+@pytest.fixture
+def expense_db(tmp_path, monkeypatch):
+    """ExpenseDB mới trong thư mục tạm, không dùng chung state với test khác."""
+    import database
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database, "get_embedding_function", lambda: _HashEmbedding())
+    # State riêng cho mỗi test: writer thread của test trước vẫn giữ state cũ của nó
+    monkeypatch.setattr(database, "_SHARED_STATE", {})
+    db = database.ExpenseDB()
+    yield db
+    db.flush()
+    # Writer thread (daemon) vẫn chạy sau test: không cho nó dọn DB đã đóng
+    db._turns_pruned_at = float("inf")
+    # Chroma giữ client theo đường dẫn (tương đối) - bỏ để test sau mở lại ở thư mục tạm mới
+    SharedSystemClient.clear_system_cache()
@@ -0,0 +1,61 @@
+"""ConversationCache loại segment theo LRU nhưng vẫn trả lịch sử theo thứ tự thời gian."""
+
+import types
+
+import pytest
+
+import conversation_cache
+from conversation_cache import ConversationCache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    # Mỗi từ một token: không cần tải file encoding của tiktoken
+    monkeypatch.setattr(conversation_cache.tiktoken, "get_encoding",
+                        lambda name: types.SimpleNamespace(encode=str.split))
+    return ConversationCache(max_tokens=8)
+
+
+def _turn(question):
+    return [{"role": "user", "content": question}, {"role": "assistant", "content": "trả lời ngắn"}]
+
+
+def _questions(cache):
+    return [msg["content"] for msg in cache.get_messages() if msg["role"] == "user"]
+
+
+def test_evicts_least_recently_used_segment(cache):
+    first = cache.add(_turn("một"))
+    cache.add(_turn("hai"))
+    cache.get(first)
+    cache.add(_turn("ba"))
+
+    # "hai" là segment ít dùng gần đây nhất, không phải segment cũ nhất
+    assert _questions(cache) == ["một", "ba"]
+    assert cache.evicted_segments == 1
+
+
+def test_without_get_eviction_is_oldest_first(cache):
+    for question in ("một", "hai", "ba"):
+        cache.add(_turn(question))
+
+    assert _questions(cache) == ["hai", "ba"]
+
+
+def test_repeated_question_replaces_its_segment(cache):
+    cache.add(_turn("một"))
+    cache.add(_turn("hai"))
+    cache.add(_turn("một"))
+
+    assert _questions(cache) == ["hai", "một"]
+    assert cache.total_tokens == 8
+
+
+def test_get_keeps_chronological_order(cache):
+    cache.max_tokens = 12
+    first = cache.add(_turn("một"))
+    cache.add(_turn("hai"))
+    cache.get(first)
+    cache.add(_turn("ba"))
+
+    assert _questions(cache) == ["một", "hai", "ba"]
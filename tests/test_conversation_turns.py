@@ -0,0 +1,43 @@
+"""Tìm kiếm và xóa các lượt hội thoại lưu theo kiểu write-behind của ExpenseDB."""
+
+
+def _buffered_count(db):
+    _, records = db._pending_writes.get(db.conversation_turns.name, (None, {}))
+    return len(records)
+
+
+def test_search_includes_own_buffered_turns_without_flushing(expense_db):
+    expense_db.add_conversation_turn("a", 1, "taxi ra sân bay")
+    expense_db.flush()
+    expense_db.add_conversation_turn("a", 2, "khách sạn công tác")
+    expense_db.add_conversation_turn("b", 1, "ăn trưa với khách hàng")
+
+    turns = expense_db.search_conversation_turns("a", "khách sạn công tác", limit=8)
+
+    assert sorted(turn["turn_index"] for turn in turns) == [1, 2]
+    assert turns[0]["content"] == "khách sạn công tác"
+    # Lượt của các phiên khác vẫn nằm trong buffer
+    assert _buffered_count(expense_db) == 2
+
+
+def test_search_respects_limit(expense_db):
+    for index in range(5):
+        expense_db.add_conversation_turn("a", index + 1, f"câu hỏi {index}")
+    expense_db.flush()
+    expense_db.add_conversation_turn("a", 6, "câu hỏi 5")
+
+    assert len(expense_db.search_conversation_turns("a", "câu hỏi", limit=3)) == 3
+
+
+def test_delete_drops_buffered_and_stored_turns(expense_db):
+    expense_db.add_conversation_turn("a", 1, "taxi ra sân bay")
+    expense_db.flush()
+    expense_db.add_conversation_turn("a", 2, "khách sạn công tác")
+    expense_db.add_conversation_turn("b", 1, "ăn trưa với khách hàng")
+
+    expense_db.delete_conversation_turns("a")
+
+    assert expense_db.search_conversation_turns("a", "taxi", limit=8) == []
+    expense_db.flush()
+    stored = expense_db.conversation_turns.get(include=["metadatas"])["metadatas"]
+    assert [metadata["session_id"] for metadata in stored] == ["b"]
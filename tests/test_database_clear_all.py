@@ -0,0 +1,29 @@
+"""ExpenseDB.clear_all phải xóa sạch dữ liệu tri thức, không để lại segment mồ côi."""
+
+import os
+import sqlite3
+
+from database import KNOWLEDGE_COLLECTIONS
+
+
+def test_clear_all_leaves_no_orphaned_data(expense_db):
+    for attr in KNOWLEDGE_COLLECTIONS:
+        getattr(expense_db, attr).add(
+            ids=[f"{attr}_{i}" for i in range(20)],
+            documents=[f"{attr} document {i}" for i in range(20)],
+        )
+    expense_db.user_expenses.add(ids=["kept"], documents=["user data is not knowledge"])
+
+    expense_db.clear_all()
+
+    conn = sqlite3.connect(os.path.join("data", "chromadb", "chroma.sqlite3"))
+    try:
+        names = {row[0] for row in conn.execute("SELECT name FROM collections")}
+        embeddings = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+    finally:
+        conn.close()
+
+    assert names == {expense_db.user_expenses.name}
+    assert embeddings == 1
+    # Truy cập lại sẽ tạo collection rỗng mới
+    assert expense_db.expense_policies.count() == 0
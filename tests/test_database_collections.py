@@ -0,0 +1,29 @@
+"""Các collection mở lazy của ExpenseDB phải an toàn khi nhiều thread cùng truy cập lần đầu."""
+
+import threading
+
+from database import KNOWLEDGE_COLLECTIONS
+
+
+def test_concurrent_first_access_opens_each_collection_once(expense_db):
+    barrier = threading.Barrier(4)
+    errors = []
+    opened = []
+
+    def open_all():
+        barrier.wait()
+        try:
+            opened.append([getattr(expense_db, attr) for attr in KNOWLEDGE_COLLECTIONS])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=open_all) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    # Mọi thread nhận cùng một handle cho mỗi collection
+    for handles in opened[1:]:
+        assert all(a is b for a, b in zip(handles, opened[0]))
@@ -0,0 +1,12 @@
+"""Mỗi lần add_knowledge_item phải tạo một mục riêng, kể cả cùng topic trong cùng một giây."""
+
+
+def test_same_topic_items_get_distinct_ids(expense_db):
+    first = expense_db.add_knowledge_item("Taxi rules", "taxi trong giờ hành chính", "travel", ["taxi"])
+    second = expense_db.add_knowledge_item("Taxi rules", "taxi ngoài giờ cần duyệt", "travel", ["taxi"])
+
+    assert first and second and first != second
+    stored = expense_db.knowledge_base.get(ids=[first, second], include=["metadatas"])
+    assert sorted(metadata["content"] for metadata in stored["metadatas"]) == [
+        "taxi ngoài giờ cần duyệt", "taxi trong giờ hành chính"
+    ]
@@ -0,0 +1,27 @@
+"""_tune_sqlite dựa vào API nội bộ của chromadb - test này báo lỗi khi nâng version làm mất nó."""
+
+from chromadb.db.impl.sqlite import SqliteDB
+
+import database
+
+
+def test_connection_pool_hook_exists(expense_db):
+    pool = expense_db.client._system.instance(SqliteDB)._conn_pool
+    assert callable(pool.connect)
+
+
+def test_pragmas_applied_to_new_connections(expense_db):
+    conn = expense_db.client._system.instance(SqliteDB)._conn_pool.connect()
+
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2  # MEMORY
+
+
+def test_missing_hook_is_reported(caplog):
+    class Client:
+        _system = None
+
+    database._tune_sqlite(Client())
+
+    assert "SQLite pragmas not applied" in caplog.text
@@ -0,0 +1,46 @@
+"""FastONNXMiniLM phải cho cùng embedding với ONNXMiniLM_L6_V2 gốc của chromadb."""
+
+from functools import cached_property
+
+import numpy as np
+import pytest
+from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+from onnx_embedding import FastONNXMiniLM
+
+TEXTS = [
+    "taxi",
+    "Giới hạn chi phí ăn uống khi đi công tác là bao nhiêu?",
+    "Hotel stay for two nights during the Da Nang client visit, receipt attached and pre-approved by manager",
+    "vé máy bay",
+]
+
+
+def test_overridden_chromadb_internals_exist():
+    # Các thành phần nội bộ FastONNXMiniLM override hoặc dùng lại
+    assert isinstance(ONNXMiniLM_L6_V2.__dict__["tokenizer"], cached_property)
+    assert isinstance(ONNXMiniLM_L6_V2.__dict__["model"], cached_property)
+    assert callable(ONNXMiniLM_L6_V2._forward)
+
+    stock = ONNXMiniLM_L6_V2()
+    for attr in ("_preferred_providers", "ort", "DOWNLOAD_PATH", "EXTRACTED_FOLDER_NAME"):
+        assert hasattr(stock, attr)
+
+
+@pytest.fixture(scope="module")
+def stock():
+    embedding_fn = ONNXMiniLM_L6_V2()
+    try:
+        embedding_fn._download_model_if_not_exists()
+    except Exception as e:
+        pytest.skip(f"Không tải được model all-MiniLM-L6-v2: {e}")
+    return embedding_fn
+
+
+def test_matches_stock_embeddings(stock):
+    expected = np.asarray(stock(TEXTS))
+    actual = np.asarray(FastONNXMiniLM()(TEXTS))
+
+    assert actual.shape == expected.shape
+    np.testing.assert_allclose(actual, expected, atol=1e-5)
+    np.testing.assert_allclose(np.linalg.norm(actual, axis=1), 1.0, atol=1e-5)
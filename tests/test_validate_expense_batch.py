@@ -0,0 +1,51 @@
+"""validate_expense_batch phải cho kết quả giống hệt validate_expense trên từng mục."""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from functions import validate_expense, validate_expense_batch
+
+
+def _day(offset: int) -> str:
+    return (datetime.now() + timedelta(days=offset)).strftime('%Y-%m-%d')
+
+
+EXPENSES = [
+    {"category": "meals", "amount": 300000, "date": _day(0), "has_receipt": True},
+    {"category": "meals", "amount": 900000, "date": _day(-5), "has_receipt": False},
+    {"category": "travel", "amount": 2000000, "date": _day(-45), "has_receipt": True},
+    {"category": "travel", "amount": 2000000, "date": _day(-1), "has_receipt": True, "pre_approved": True},
+    {"category": "office_supplies", "amount": 3000000, "date": _day(-10), "has_receipt": True},
+    {"category": "Taxi", "amount": 150000, "date": _day(1)},
+    {"category": "parking", "amount": 600000, "date": _day(30), "has_receipt": False},
+    {"category": "unknown", "amount": 100000, "date": "2024/01/01"},
+    {"category": "meals", "amount": 100000, "date": ""},
+    {"category": "taxi", "amount": 700000, "date": "not a date", "has_receipt": False},
+    {"category": "mileage", "amount": 80000},
+]
+
+
+@pytest.mark.parametrize("expense", EXPENSES, ids=lambda e: f"{e['category']}-{e.get('date', 'no-date')}")
+def test_batch_matches_single(expense):
+    assert validate_expense_batch([expense]) == [validate_expense(expense)]
+
+
+def test_batch_matches_single_for_whole_list():
+    assert validate_expense_batch(EXPENSES) == [validate_expense(expense) for expense in EXPENSES]
+
+
+def test_future_date_is_valid():
+    result = validate_expense_batch([{"category": "taxi", "amount": 100000, "date": _day(1)}])[0]
+    assert result["is_valid"]
+    assert not result["requires_manager_approval"]
+
+
+def test_invalid_date_is_an_error():
+    result = validate_expense_batch([{"category": "taxi", "amount": 100000, "date": "2024/01/01"}])[0]
+    assert not result["is_valid"]
+    assert result["requires_manager_approval"]
+
+
+def test_empty_batch():
+    assert validate_expense_batch([]) == []
@@ -18,6 +18,9 @@ import chromadb
 from chromadb.config import Settings
 import os
 import logging
+import threading
+
+from database import get_embedding_function
 
 # Import our smart memory system
 from conversation_summarizer import IntelligentConversationSummarizer
@@ -123,11 +126,14 @@ class UserSessionManager:
         collection_name = f"user_{account.replace('@', '_').replace('.', '_')}"
         
         try:
-            user_collection = self.chroma_client.get_collection(collection_name)
+            user_collection = self.chroma_client.get_collection(
+                collection_name, embedding_function=get_embedding_function()
+            )
             logger.info(f"📚 Loaded existing collection for user: {account}")
         except:
             user_collection = self.chroma_client.create_collection(
                 name=collection_name,
+                embedding_function=get_embedding_function(),
                 metadata={"user_account": account, "created_at": datetime.now().isoformat()}
             )
             logger.info(f"🆕 Created new collection for user: {account}")
@@ -184,25 +190,28 @@ class UserSessionManager:
         Tải lịch sử hội thoại của người dùng từ ChromaDB
         """
         try:
-            # Get recent conversations (last 10 summaries)
-            results = collection.query(
-                query_texts=["conversation summary"],
-                n_results=min(10, collection.count()),
+            # Lấy 10 summaries gần nhất bằng filter metadata (không embed câu truy vấn giả)
+            results = collection.get(
+                where={"type": "summary"},
                 include=['documents', 'metadatas']
             )
             
-            if results['documents'] and results['documents'][0]:
+            recent = sorted(
+                zip(results['documents'] or [], results['metadatas'] or []),
+                key=lambda item: str(item[1].get('timestamp', ''))
+            )[-10:]
+            
+            if recent:
                 summaries_loaded = 0
-                for doc, metadata in zip(results['documents'][0], results['metadatas'][0]):
-                    if metadata and metadata.get('type') == 'summary':
-                        # Add summary to smart memory
-                        smart_memory.summaries.append({
-                            'content': doc,
-                            'timestamp': metadata.get('timestamp', datetime.now().isoformat()),
-                            'tokens_saved': metadata.get('tokens_saved', 0),
-                            'original_length': metadata.get('original_length', 0)
-                        })
-                        summaries_loaded += 1
+                for doc, metadata in recent:
+                    # Add summary to smart memory
+                    smart_memory.summaries.append({
+                        'content': doc,
+                        'timestamp': metadata.get('timestamp', datetime.now().isoformat()),
+                        'tokens_saved': metadata.get('tokens_saved', 0),
+                        'original_length': metadata.get('original_length', 0)
+                    })
+                    summaries_loaded += 1
                 
                 logger.info(f"📖 Loaded {summaries_loaded} conversation summaries from ChromaDB")
                 
@@ -357,5 +366,24 @@ class UserSessionManager:
             }
         }
 
-# Global instance
-session_manager = UserSessionManager()
+# Global instance - khởi tạo lười để import module không mở ChromaDB
+_session_manager = None
+_session_manager_lock = threading.Lock()
+
+def get_session_manager() -> UserSessionManager:
+    """
+    Lấy UserSessionManager dùng chung (singleton), tạo ở lần gọi đầu tiên
+    
+    Returns:
+        UserSessionManager instance
+    """
+    global _session_manager
+    
+    if _session_manager is None:
+        # Flask phục vụ request song song: chỉ một thread được tạo instance,
+        # nếu không session lưu trên instance bị ghi đè sẽ biến mất
+        with _session_manager_lock:
+            if _session_manager is None:
+                _session_manager = UserSessionManager()
+    
+    return _session_manager
@@ -0,0 +1,91 @@
+"""
+📐 VECTOR INDEX - Tìm kiếm trong bộ nhớ cho các collection tĩnh, đọc nhiều
+============================================================================
+
+Policies, FAQs và knowledge base chỉ được ghi lúc nạp dữ liệu rồi được đọc ở mọi
+câu hỏi. Thay vì đi qua SQLite + HNSW của ChromaDB cho mỗi lần search, toàn bộ
+collection (vài chục tới vài nghìn documents) được nạp một lần vào bộ nhớ:
+- Có usearch: HNSW C++ với vector f16 (kernel SIMD của simsimd, bộ nhớ giảm ~2x)
+- Không có usearch: tìm chính xác bằng một phép nhân ma trận NumPy + argpartition
+
+Vector đã chuẩn hóa L2 (EmbeddingCache normalize=True), distance = 1 - inner product,
+giống hệt "hnsw:space": "ip" của ChromaDB. Kết quả trả về đúng dạng của
+collection.query() nên code gọi không cần đổi.
+"""
+
+from typing import Any, Dict, List
+
+import numpy as np
+
+# 🚀 Optional: usearch cho HNSW f16 với kernel SIMD
+try:
+    from usearch.index import Index
+    USEARCH_AVAILABLE = True
+except ImportError:
+    USEARCH_AVAILABLE = False
+
+
+class StaticVectorIndex:
+    """
+    🗂️ Bản sao chỉ-đọc trong bộ nhớ của một collection ChromaDB
+    """
+
+    def __init__(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict[str, Any]]):
+        self.ids = list(ids)
+        self.documents = list(documents or [None] * len(self.ids))
+        self.metadatas = list(metadatas or [None] * len(self.ids))
+
+        if self.ids:
+            vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(self.ids), -1)
+        else:
+            vectors = np.zeros((0, 0), dtype=np.float32)
+        self._index = None
+        self._vectors = vectors
+        if USEARCH_AVAILABLE and self.ids:
+            self._index = Index(ndim=vectors.shape[1], metric="ip", dtype="f16")
+            self._index.add(np.arange(len(self.ids), dtype=np.uint64), vectors)
+            self._vectors = None
+
+    @classmethod
+    def from_collection(cls, collection) -> "StaticVectorIndex":
+        """Nạp toàn bộ ids, embeddings, documents, metadatas của collection trong một lần get()"""
+        results = collection.get(include=["embeddings", "documents", "metadatas"])
+        return cls(results["ids"], results["embeddings"], results["documents"], results["metadatas"])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _top_k(self, queries: np.ndarray, k: int):
+        """(hàng, distances) của k vector gần nhất cho mỗi query, sắp theo distance tăng dần"""
+        if self._index is not None:
+            matches = self._index.search(queries, k)
+            rows = np.asarray(matches.keys, dtype=np.int64).reshape(len(queries), -1)
+            distances = np.asarray(matches.distances, dtype=np.float32).reshape(len(queries), -1)
+            return rows, distances
+
+        scores = queries @ self._vectors.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+        rows = np.take_along_axis(top, order, axis=1)
+        return rows, 1.0 - np.take_along_axis(scores, rows, axis=1)
+
+    def query(self, query_embeddings, n_results: int) -> Dict[str, List[List[Any]]]:
+        """Tương đương collection.query(query_embeddings=..., n_results=...)"""
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        k = min(n_results, len(self.ids))
+        if k <= 0:
+            empty = [[] for _ in range(len(queries))]
+            return {"ids": empty, "documents": empty, "metadatas": empty, "distances": empty}
+
+        rows, distances = self._top_k(queries, k)
+        # usearch trả key âm / ngoài phạm vi cho các ô không tìm được
+        hits = [[int(row) for row in query_rows if 0 <= row < len(self.ids)] for query_rows in rows]
+        return {
+            "ids": [[self.ids[row] for row in query_hits] for query_hits in hits],
+            "documents": [[self.documents[row] for row in query_hits] for query_hits in hits],
+            "metadatas": [[self.metadatas[row] for row in query_hits] for query_hits in hits],
+            "distances": [
+                [float(distance) for distance in query_distances[:len(query_hits)]]
+                for query_hits, query_distances in zip(hits, distances)
+            ],
+        }
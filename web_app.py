@@ -9,6 +9,7 @@ import os
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
 import json
+import importlib.util
 import uuid
 import re
 import logging
@@ -18,7 +19,7 @@ from typing import Dict, List, Any, Optional, Tuple
 from flask import Flask, jsonify, render_template, request, send_file
 from flask_cors import CORS
 
-from database import ExpenseDB
+from database import get_expense_db
 from expense_assistant import ExpenseAssistant, create_client
 from functions import EXPENSE_POLICIES, MOCK_EXPENSE_REPORTS, SAMPLE_USER_QUERIES, calculate_reimbursement, validate_expense
 from text_to_speech import text_to_speech as tts
@@ -54,11 +55,12 @@ class EnhancedMemorySystem:
                 logger.warning("⚠️ No database instance available for loading data")
                 return
                 
-            # Load all users
-            all_users = self.db.load_all_users()
+            # Load all users - đọc từng trang, không giữ thêm một dict chứa toàn bộ users
+            users_loaded = 0
             
             # Validate and update store
-            for account, user_data in all_users.items():
+            for account, user_data in self.db.iter_all_users():
+                users_loaded += 1
                 # Ensure user data has required structure
                 if not isinstance(user_data, dict):
                     logger.warning(f"⚠️ Invalid user data structure for {account}")
@@ -74,7 +76,7 @@ class EnhancedMemorySystem:
                     
                 self.store["users"][account] = user_data
             
-            logger.info(f"🔄 Successfully loaded {len(all_users)} users from ChromaDB")
+            logger.info(f"🔄 Successfully loaded {users_loaded} users from ChromaDB")
             
             # Note: Guest sessions are typically short-lived, so we don't restore them
             # But we could add this logic if needed
@@ -1124,20 +1126,12 @@ try:
 except ImportError:
     RAG_AVAILABLE = False
 
-# 🧠 Smart Conversation Memory
-try:
-    from smart_memory_integration import (
-        SmartConversationMemory, 
-        WebAppMemoryIntegration,
-        create_smart_memory_for_session
-    )
-    SMART_MEMORY_AVAILABLE = True
-except ImportError:
-    SMART_MEMORY_AVAILABLE = False
+# 🧠 Smart Conversation Memory - chỉ kiểm tra module có tồn tại, không import
+SMART_MEMORY_AVAILABLE = importlib.util.find_spec("smart_memory_integration") is not None
 
-# 🔐 User Session Management
+# 🔐 User Session Management - UserSessionManager được tạo ở request đầu tiên
 try:
-    from user_session_manager import UserSessionManager, session_manager
+    from user_session_manager import get_session_manager
     USER_SESSION_AVAILABLE = True
 except ImportError:
     USER_SESSION_AVAILABLE = False
@@ -1151,7 +1145,7 @@ app.secret_key = "expense_assistant_secret_key_2024"
 CORS(app)
 
 # Khởi tạo cơ sở dữ liệu
-db = ExpenseDB()
+db = get_expense_db()
 
 # Initialize enhanced memory system với ChromaDB persistence
 enhanced_memory = EnhancedMemorySystem(database=db)
@@ -1203,7 +1197,7 @@ def start_session():
         # 🔐 Create guest session with User Session Manager
         session_id = None
         if USER_SESSION_AVAILABLE:
-            session_id = session_manager.create_guest_session()
+            session_id = get_session_manager().create_guest_session()
         else:
             session_id = str(uuid.uuid4())
         
@@ -1217,7 +1211,7 @@ def start_session():
         # 🧠 Smart memory đã được tích hợp trong User Session Manager
         smart_memory_stats = None
         if USER_SESSION_AVAILABLE:
-            session_info = session_manager.get_session_info(session_id)
+            session_info = get_session_manager().get_session_info(session_id)
             if session_info:
                 smart_memory_stats = session_info['stats']
 
@@ -1346,7 +1340,7 @@ def login_user():
                 }), 503
             
             # Login user và tạo session
-            session_id, user_info = session_manager.login_user(account)
+            session_id, user_info = get_session_manager().login_user(account)
             
             # Khởi tạo expense memory
             initialize_expense_memory()
@@ -1451,7 +1445,7 @@ def logout_user():
                 }), 503
             
             # Get session info before logout
-            session_info = session_manager.get_session_info(session_id)
+            session_info = get_session_manager().get_session_info(session_id)
             if not session_info:
                 return jsonify({
                     "success": False,
@@ -1463,7 +1457,7 @@ def logout_user():
             
             # Logout from session manager
             if user_type == "logged_in":
-                logout_success = session_manager.logout_user(session_id)
+                logout_success = get_session_manager().logout_user(session_id)
             else:
                 logout_success = True  # Guest sessions don't need explicit logout
             
@@ -1496,7 +1490,7 @@ def get_session_info(session_id):
                 "error": "User session system không khả dụng"
             }), 503
         
-        session_info = session_manager.get_session_info(session_id)
+        session_info = get_session_manager().get_session_info(session_id)
         if not session_info:
             return jsonify({
                 "success": False,
@@ -1553,7 +1547,7 @@ def chat():
             # 🔐 Get session info from User Session Manager
             session_info = None
             if USER_SESSION_AVAILABLE:
-                session_info = session_manager.get_session_info(session_id)
+                session_info = get_session_manager().get_session_info(session_id)
                 if not session_info:
                     return jsonify({"success": False, "error": "Session không tồn tại hoặc đã hết hạn"}), 404
             
@@ -1598,7 +1592,7 @@ def chat():
                 
                 # 🔐 Add conversation to User Session Manager
                 if USER_SESSION_AVAILABLE and session_info:
-                    conversation_result = session_manager.add_conversation_turn(session_id, message, report)
+                    conversation_result = get_session_manager().add_conversation_turn(session_id, message, report)
                 
                 # Legacy smart memory support
                 elif session_data and session_data.get("smart_memory"):
@@ -1654,7 +1648,7 @@ def chat():
                 
                 # 🔐 Add conversation to User Session Manager
                 if USER_SESSION_AVAILABLE and session_info:
-                    conversation_result = session_manager.add_conversation_turn(session_id, message, response)
+                    conversation_result = get_session_manager().add_conversation_turn(session_id, message, response)
                 
                 # Legacy smart memory support
                 elif session_data and session_data.get("smart_memory"):
@@ -1719,7 +1713,7 @@ def chat():
             
             # 🔐 Add conversation to User Session Manager
             if USER_SESSION_AVAILABLE and session_info:
-                conversation_result = session_manager.add_conversation_turn(session_id, message, response)
+                conversation_result = get_session_manager().add_conversation_turn(session_id, message, response)
             
             # Legacy smart memory support
             elif session_data and session_data.get("smart_memory"):
@@ -1762,7 +1756,7 @@ def get_smart_memory_stats(session_id: str):
     try:
         # 🔐 Try User Session Manager first
         if USER_SESSION_AVAILABLE:
-            session_info = session_manager.get_session_info(session_id)
+            session_info = get_session_manager().get_session_info(session_id)
             if session_info:
                 return jsonify({
                     'success': True,
@@ -1819,7 +1813,7 @@ def get_global_smart_memory_stats():
     try:
         # 🔐 Get stats from User Session Manager
         if USER_SESSION_AVAILABLE:
-            global_stats = session_manager.get_global_stats()
+            global_stats = get_session_manager().get_global_stats()
             return jsonify({
                 'success': True,
                 'global_stats': global_stats,
@@ -1890,13 +1884,13 @@ def optimize_smart_memory_session(session_id: str):
     try:
         # 🔐 Try User Session Manager first
         if USER_SESSION_AVAILABLE:
-            session_info = session_manager.get_session_info(session_id)
+            session_info = get_session_manager().get_session_info(session_id)
             if session_info:
                 # Optimize memory using User Session Manager
-                optimization_result = session_manager.optimize_session_memory(session_id)
+                optimization_result = get_session_manager().optimize_session_memory(session_id)
                 
                 # Get updated stats
-                updated_session_info = session_manager.get_session_info(session_id)
+                updated_session_info = get_session_manager().get_session_info(session_id)
                 
                 return jsonify({
                     'success': True,
@@ -2286,7 +2280,7 @@ def health_check():
     """
     try:
         # Database health check
-        db = ExpenseDB()
+        db = get_expense_db()
         health_status = db.system_health_check()
         
         # Add application-level checks
@@ -2338,12 +2332,12 @@ def system_stats():
     📊 Get system statistics
     """
     try:
-        db = ExpenseDB()
+        db = get_expense_db()
         stats = db.get_system_stats()
         
         # Add session statistics if available
-        if USER_SESSION_AVAILABLE and session_manager:
-            session_stats = session_manager.get_session_stats()
+        if USER_SESSION_AVAILABLE:
+            session_stats = get_session_manager().get_session_stats()
             stats["sessions"] = session_stats
             
         return jsonify(stats)